@@ -1,21 +1,22 @@
 from __future__ import annotations
 
-from typing import Dict, Optional
+import threading
+import time
+
+from utils.startup import import_profiler, run_warmup, warmup_timings
 
-from io import BytesIO
+import_profiler.start()
+
+from datetime import date, timedelta
+from typing import Dict, Optional
 
 import pandas as pd
-import plotly.express as px
 import streamlit as st
-from mysql.connector import Error
 
+from config import get_settings
+from db import Error
+from services.aggregates import start_reconcile_job
 from services.auth import authenticate
-from services.preferences import (
-    build_preference_vector,
-    get_user_preferences,
-    get_user_profile,
-    get_user_ratings,
-)
 from services.recommendations import get_recommendations
 from services.search import (
     get_available_categories,
@@ -28,18 +29,55 @@ from services.analytics import (
     get_popular_places,
     get_price_segments,
     get_ratings_timeline,
+    get_rating_trend,
     get_entity_counts,
-    get_users_overview,
+    get_users_page,
     get_recent_ratings,
-    get_ratings_by_category,
-    get_ratings_by_city,
-    get_user_activity,
     get_package_coverage,
+    get_analytics_bundle,
+    get_distinct_active_users,
+    get_rating_quantiles,
+    get_cohort_retention,
+    invalidate_for_tables,
 )
-from services.ratings import delete_rating, list_attractions, upsert_rating
+from services.change_tracking import (
+    ALL_TABLES,
+    broadcast_cache_reset,
+    register_change_listener,
+    start_change_poller,
+)
+from services.credentials import clear_credential_cache, get_credential_schema
+from services.columnar_store import start_snapshot_job
+from services.analytics_mirror import start_mirror_job
+from services.ratings import list_attractions
+from services.rating_buffer import overlay_pending_ratings, rating_buffer
 from services.admin import get_credentials_overview, set_user_block_status
+from services.cache import analytics_cache
+from services.job_status import job_statuses
+from services.user_cache import user_cache
+from services.user_context import UserContext, get_user_context, prefetch_user_context
+from services.reports import get_report, request_full_report
+from services.exports import (
+    EXPORTABLE_TABLES,
+    STREAM_FORMATS,
+    discard_export,
+    list_exports,
+    read_export,
+    start_export,
+)
+from services.counters import start_stats_job
+from services.imports import discard_import, list_imports, start_import
+from services.rollups import GRANULARITIES, GRANULARITY_LABELS, start_rollup_job
+from services.sketches import start_sketch_job
+from services.cohorts import start_cohort_job
+from services.preference_learner import start_preference_job
+from utils.downsampling import Downsampled, downsample_line, downsample_scatter
+from utils.export import EXPORT_FORMATS, dataframe_digest, export_dataframe, get_cached_export
+from utils.figures import cached_figure, clear_figure_cache, figure_cache_stats, render_figure
 from utils.ui import render_kpi, render_profile_card, render_section
 
+import_profiler.stop()
+
 
 ROLE_LABELS = {
     "admin": "Администратор",
@@ -47,6 +85,13 @@ ROLE_LABELS = {
     "user": "Пользователь",
 }
 
+USER_TABS = (
+    "Предпочтения и оценки",
+    "Персональные предложения",
+    "Поиск туров",
+    "Аналитика популярности",
+)
+
 
 COLUMN_RU = {
     "user_id": "ID пользователя",
@@ -81,12 +126,17 @@ COLUMN_RU = {
     "cnt": "Количество объектов",
     "avg_price": "Средняя цена",
     "rated_date": "Дата",
+    "distinct_users": "Уникальных пользователей",
     "recommendation_score": "Скор рекомендации",
     "score": "Скор рекомендации",
     "source": "Источник",
     "package_count": "Количество пакетов",
     "total_stops": "Всего посещений",
     "is_blocked": "Заблокирован",
+    "error_margin": "Погрешность (±, 95%)",
+    "median_rating": "Медианная оценка",
+    "p90_rating": "90-й перцентиль оценки",
+    "rank_error": "Ошибка по рангу",
 }
 
 PREFERENCE_TYPE_DESCRIPTIONS = {
@@ -189,21 +239,6 @@ st.set_page_config(
 )
 
 
-@st.cache_data(show_spinner=False)
-def cached_user_profile(user_id: int) -> Optional[Dict]:
-    return get_user_profile(user_id)
-
-
-@st.cache_data(show_spinner=False)
-def cached_preferences(user_id: int) -> pd.DataFrame:
-    return get_user_preferences(user_id)
-
-
-@st.cache_data(show_spinner=False)
-def cached_ratings(user_id: int) -> pd.DataFrame:
-    return get_user_ratings(user_id)
-
-
 @st.cache_data(ttl=300, show_spinner=False)
 def cached_cities():
     return get_available_cities()
@@ -219,6 +254,86 @@ def cached_places():
     return list_attractions()
 
 
+def clear_process_caches():
+    user_cache.clear()
+    cached_cities.clear()
+    cached_categories.clear()
+    cached_places.clear()
+    analytics_cache.clear()
+    clear_figure_cache()
+    clear_credential_cache()
+
+
+def on_tables_changed(changes):
+    if ALL_TABLES in changes:
+        clear_process_caches()
+        return
+    tables = set(changes)
+    invalidate_for_tables(tables)
+    user_datasets = {"users": "profile", "user_preferences": "preferences", "ratings": "ratings"}
+    for table, dataset in user_datasets.items():
+        if table not in changes:
+            continue
+        if changes[table] is None:
+            user_cache.invalidate_names(dataset)
+        else:
+            for user_id in changes[table]:
+                user_cache.invalidate_user(user_id, dataset)
+    if tables & {"tourism_attractions", "tourism_packages"}:
+        cached_cities.clear()
+        cached_categories.clear()
+        cached_places.clear()
+    if "users_credentials" in tables:
+        clear_credential_cache()
+
+
+def warm_up_caches(delay: float = 0.0):
+    """Прогревает кэши, когда первые перестройки фоновых задач уже начались.
+
+    Кэш st.cache_data общий для процесса, поэтому каталог, города и категории,
+    прогретые фоновым потоком без контекста сессии, достаются всем сессиям.
+    """
+    time.sleep(delay)
+    run_warmup(
+        [
+            ("Каталог мест", cached_places),
+            ("Города", cached_cities),
+            ("Категории", cached_categories),
+            ("Схема учетных записей", get_credential_schema),
+            ("Счетчики KPI", get_entity_counts),
+            ("Снимок аналитики", get_analytics_bundle),
+            ("Популярные места", get_popular_places),
+            ("Спрос по городам", get_city_demand),
+            ("Оценки категорий", get_category_satisfaction),
+            ("Ценовые сегменты", get_price_segments),
+            ("Динамика оценок", get_ratings_timeline),
+            ("Когорты", get_cohort_retention),
+            ("Покрытие пакетами", get_package_coverage),
+            ("plotly.express", lambda: __import__("plotly.express")),
+        ]
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def start_background_jobs() -> bool:
+    settings = get_settings()
+    register_change_listener(on_tables_changed)
+    start_change_poller(settings.cache_sync_interval)
+    rating_buffer.start()
+    start_reconcile_job(settings.aggregates_reconcile_interval)
+    start_stats_job(settings.kpi_stats_refresh_interval)
+    start_rollup_job(settings.rollup_refresh_interval)
+    start_snapshot_job(settings.analytics_snapshot_interval)
+    start_mirror_job(settings.analytics_snapshot_interval)
+    start_sketch_job(settings.sketch_refresh_interval)
+    start_cohort_job(settings.cohort_refresh_interval)
+    start_preference_job(settings.preference_learn_interval)
+    threading.Thread(
+        target=warm_up_caches, args=(settings.warmup_delay,), name="cache-warmup", daemon=True
+    ).start()
+    return True
+
+
 def detect_role(username: str) -> str:
     user_login = (username or "").strip().lower()
     if user_login == "admin":
@@ -248,23 +363,65 @@ def localize_columns(df: pd.DataFrame, extra_map: Optional[Dict[str, str]] = Non
     return df.rename(columns=rename_map)
 
 
-def df_to_xlsx_bytes(df: pd.DataFrame) -> bytes:
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="Данные")
-    output.seek(0)
-    return output.getvalue()
-
-
 def download_button_for_df(df: pd.DataFrame, filename: str, label: str):
+    """Файл собирается только по нажатию и кэшируется по хешу содержимого таблицы."""
     if df.empty:
         return
-    st.download_button(
-        label=label,
-        data=df_to_xlsx_bytes(df),
-        file_name=filename,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
+    base_name = filename.rsplit(".", 1)[0]
+    col_format, col_action = st.columns([1, 3])
+    with col_format:
+        fmt = st.selectbox(
+            "Формат",
+            list(EXPORT_FORMATS),
+            format_func=lambda key: EXPORT_FORMATS[key][0],
+            key=f"export_format_{base_name}",
+            label_visibility="collapsed",
+        )
+    digest = dataframe_digest(df)
+    payload = get_cached_export(digest, fmt)
+    with col_action:
+        if payload is None:
+            if st.button(
+                f"{label} — подготовить {EXPORT_FORMATS[fmt][0]}",
+                key=f"export_prepare_{base_name}",
+            ):
+                with st.spinner("Формируем файл..."):
+                    payload = export_dataframe(df, fmt, digest)
+        if payload is not None:
+            st.download_button(
+                label=f"{label} ({EXPORT_FORMATS[fmt][0]})",
+                data=payload,
+                file_name=f"{base_name}.{fmt}",
+                mime=EXPORT_FORMATS[fmt][1],
+                key=f"export_download_{base_name}",
+            )
+
+
+def render_reduction_note(points: Downsampled):
+    if points.reduced:
+        st.caption(points.describe())
+
+
+def render_users_pager(key: str, page_size: int, search: str = "") -> pd.DataFrame:
+    """Постраничный просмотр пользователей: курсоры страниц хранятся в session_state."""
+    state_key = f"{key}_pager"
+    pager = st.session_state.setdefault(state_key, {"search": search, "cursors": [None]})
+    if pager["search"] != search:
+        pager.update(search=search, cursors=[None])
+    page_df, next_cursor = get_users_page(search or None, pager["cursors"][-1], page_size)
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("← Назад", key=f"{key}_prev", disabled=len(pager["cursors"]) == 1):
+            pager["cursors"].pop()
+            st.rerun(scope="fragment")
+    with col_page:
+        st.caption(f"Страница {len(pager['cursors'])} · по {page_size} записей")
+    with col_next:
+        if st.button("Вперёд →", key=f"{key}_next", disabled=next_cursor is None):
+            pager["cursors"].append(next_cursor)
+            st.rerun(scope="fragment")
+    return page_df
 
 
 def login_screen():
@@ -319,6 +476,8 @@ def login_screen():
                 user["role"] = role
                 st.session_state["auth_user"] = user
                 st.session_state["role"] = role
+                if role == "user":
+                    prefetch_user_context(user["user_id"])
                 st.success("Успешный вход")
                 st.rerun()
             else:
@@ -326,10 +485,12 @@ def login_screen():
     st.markdown("</div>", unsafe_allow_html=True)
 
 
-def render_preferences_tab(user_id: int):
-    profile = cached_user_profile(user_id)
-    pref_df = cached_preferences(user_id)
-    ratings_df = cached_ratings(user_id)
+def render_preferences_tab(context: UserContext):
+    profile = context.profile
+    pref_df = context.preferences
+    if not pref_df.empty:
+        # Кадр из общего кэша пользователя: приводим типы в копии, не меняя закэшированный объект.
+        pref_df = pref_df.assign(preference_value=pd.to_numeric(pref_df["preference_value"], errors="coerce"))
 
     render_section("Профиль пользователя")
     if profile:
@@ -341,7 +502,6 @@ def render_preferences_tab(user_id: int):
     if pref_df.empty:
         st.warning("Предпочтения не заданы.")
     else:
-        pref_df["preference_value"] = pd.to_numeric(pref_df["preference_value"], errors="coerce")
         pref_display = pref_df.copy()
         pref_display["Описание"] = pref_display["preference_type"].map(
             PREFERENCE_TYPE_DESCRIPTIONS
@@ -367,6 +527,12 @@ def render_preferences_tab(user_id: int):
         st.caption("Сводка по весам предпочтений")
         st.dataframe(pref_summary, use_container_width=True)
 
+    render_ratings_history(context.user_id)
+
+
+@st.fragment
+def render_ratings_history(user_id: int):
+    ratings_df = overlay_pending_ratings(user_id, get_user_context(user_id).ratings, cached_places())
     render_section("История оценок")
     if ratings_df.empty:
         st.info("Пользователь пока не ставил оценки.")
@@ -458,6 +624,7 @@ def render_recommendations_tab(user_id: int, preference_vector: Dict):
     st.dataframe(rec_display, use_container_width=True)
 
 
+@st.fragment
 def render_search_tab(user_id: int, preference_vector: Dict):
     render_section("Поиск и ранжирование туров")
     cities = ["Все"] + cached_cities()
@@ -492,6 +659,8 @@ def render_search_tab(user_id: int, preference_vector: Dict):
 
 
 def render_analytics_tab():
+    import plotly.express as px
+
     render_section("Популярность мест и направлений")
     try:
         popular = get_popular_places()
@@ -504,55 +673,81 @@ def render_analytics_tab():
         return
 
     if not popular.empty:
-        fig = px.bar(popular, x="place_name", y="rating_count", color="city", title="ТОП мест по количеству оценок")
-        st.plotly_chart(fig, use_container_width=True)
+        fig = cached_figure(
+            "top_places",
+            popular,
+            lambda frame: px.bar(
+                frame, x="place_name", y="rating_count", color="city", title="ТОП мест по количеству оценок"
+            ),
+        )
+        render_figure(fig)
         st.dataframe(localize_columns(popular), use_container_width=True)
 
     if not cities.empty:
-        fig = px.scatter(
-            cities,
-            x="attractions",
-            y="avg_rating",
-            size="attractions",
-            color="city",
-            title="Города: насыщенность и средний рейтинг",
+        city_points = downsample_scatter(cities, "attractions", "avg_rating", weight="attractions")
+        fig = cached_figure(
+            "city_demand",
+            city_points.frame,
+            lambda frame: px.scatter(
+                frame,
+                x="attractions",
+                y="avg_rating",
+                size="attractions",
+                color="city",
+                title="Города: насыщенность и средний рейтинг",
+            ),
         )
-        st.plotly_chart(fig, use_container_width=True)
+        render_figure(fig)
+        render_reduction_note(city_points)
         st.dataframe(localize_columns(cities), use_container_width=True)
 
     if not categories.empty:
-        fig = px.bar(
+        fig = cached_figure(
+            "category_satisfaction",
             categories,
-            x="category",
-            y="avg_rating",
-            title="Удовлетворенность по категориям",
+            lambda frame: px.bar(
+                frame,
+                x="category",
+                y="avg_rating",
+                title="Удовлетворенность по категориям",
+            ),
         )
-        st.plotly_chart(fig, use_container_width=True)
+        render_figure(fig)
         category_df = localize_columns(categories).rename(columns={"cnt": "Количество объектов"})
         st.dataframe(category_df, use_container_width=True)
 
     if not price_segments.empty:
-        fig = px.bar(
+        fig = cached_figure(
+            "price_segments_bar",
             price_segments,
-            x="price_segment",
-            y="attractions",
-            color="avg_rating",
-            text="avg_rating",
-            title="Распределение объектов по ценовым сегментам",
-            labels={"avg_rating": "Средний рейтинг"},
+            lambda frame: px.bar(
+                frame,
+                x="price_segment",
+                y="attractions",
+                color="avg_rating",
+                text="avg_rating",
+                title="Распределение объектов по ценовым сегментам",
+                labels={"avg_rating": "Средний рейтинг"},
+            ),
         )
-        st.plotly_chart(fig, use_container_width=True)
+        render_figure(fig)
         st.dataframe(localize_columns(price_segments), use_container_width=True)
 
     if not ratings_timeline.empty:
-        fig = px.line(
-            ratings_timeline,
-            x="rated_date",
-            y="avg_rating",
-            markers=True,
-            title="Динамика средних оценок пользователей",
+        timeline_points = downsample_line(ratings_timeline, "rated_date", "avg_rating")
+        fig = cached_figure(
+            "ratings_timeline",
+            timeline_points.frame,
+            lambda frame: px.line(
+                frame,
+                x="rated_date",
+                y="avg_rating",
+                markers=True,
+                title="Динамика средних оценок пользователей",
+            ),
         )
-        st.plotly_chart(fig, use_container_width=True)
+        render_figure(fig)
+        render_reduction_note(timeline_points)
         st.dataframe(localize_columns(ratings_timeline), use_container_width=True)
 
 
@@ -582,13 +777,12 @@ def render_rating_management(user_id: int, ratings_df: pd.DataFrame):
             rating_value = st.slider("Оценка", min_value=1.0, max_value=5.0, step=0.5, value=4.0)
             if st.button("Сохранить", key="rating_add_btn"):
                 try:
-                    upsert_rating(user_id, place_options[place_label], rating_value)
-                except Error as exc:
+                    rating_buffer.submit(user_id, place_options[place_label], rating_value)
+                except OSError as exc:
                     st.error(f"Не удалось сохранить оценку: {exc}")
                 else:
-                    cached_ratings.clear()
-                    st.success("Оценка сохранена.")
-                    st.rerun()
+                    st.toast("Оценка сохранена.")
+                    st.rerun(scope="fragment")
 
     with st.expander("Удалить оценку", expanded=False):
         if ratings_df.empty:
@@ -605,13 +799,12 @@ def render_rating_management(user_id: int, ratings_df: pd.DataFrame):
             )
             if st.button("Удалить", key="rating_delete_btn"):
                 try:
-                    delete_rating(user_id, delete_options[delete_label])
-                except Error as exc:
+                    rating_buffer.submit(user_id, delete_options[delete_label], None)
+                except OSError as exc:
                     st.error(f"Не удалось удалить оценку: {exc}")
                 else:
-                    cached_ratings.clear()
-                    st.success("Оценка удалена.")
-                    st.rerun()
+                    st.toast("Оценка удалена.")
+                    st.rerun(scope="fragment")
 
 
 def render_admin_view():
@@ -627,15 +820,33 @@ def render_admin_view():
     with col4:
         render_kpi("Оценки", counts.get("ratings_count", 0))
 
+    render_admin_users()
+    render_admin_access()
+    render_admin_recent_ratings()
+    render_admin_exports()
+    render_admin_import()
+    render_admin_cache()
+    render_admin_startup()
+
+
+@st.fragment
+def render_admin_users():
     render_section("Пользователи системы")
-    users_df = get_users_overview()
+    users_search = st.text_input(
+        "Поиск пользователя по ID или началу локации",
+        key="admin_user_search",
+    ).strip()
+    users_df = render_users_pager("admin_users", 100, users_search)
     if users_df.empty:
         st.info("Нет данных о пользователях.")
     else:
         users_display = localize_columns(users_df)
         st.dataframe(users_display, use_container_width=True)
-        download_button_for_df(users_display, "users_overview.xlsx", "Скачать пользователей в XLSX")
+        download_button_for_df(users_display, "users_overview.xlsx", "Скачать пользователей")
+
 
+@st.fragment
+def render_admin_access():
     render_section("Управление доступом")
     credentials_df, block_supported = get_credentials_overview()
     if credentials_df.empty:
@@ -669,12 +880,15 @@ def render_admin_view():
                     st.error(f"Не удалось обновить статус: {exc}")
                 else:
                     st.success("Статус обновлён.")
-                    st.rerun()
+                    st.rerun(scope="fragment")
         else:
             st.warning(
                 "Для блокировки пользователей добавьте колонку `is_blocked TINYINT(1)` в таблицу `users_credentials`."
             )
 
+
+@st.fragment
+def render_admin_recent_ratings():
     render_section("Последние оценки пользователей")
     recent_df = get_recent_ratings()
     if recent_df.empty:
@@ -682,7 +896,7 @@ def render_admin_view():
     else:
         recent_display = localize_columns(recent_df)
         st.dataframe(recent_display, use_container_width=True)
-        download_button_for_df(recent_display, "recent_ratings.xlsx", "Скачать оценки в XLSX")
+        download_button_for_df(recent_display, "recent_ratings.xlsx", "Скачать оценки")
         options = {
             f"UID {row.user_id} → {row.place_name} ({format_date(row.rated_at)})": (row.user_id, row.place_id)
             for row in recent_df.itertuples()
@@ -695,23 +909,294 @@ def render_admin_view():
         if st.button("Удалить выбранную оценку"):
             uid, pid = options[delete_label]
             try:
-                delete_rating(uid, pid)
-            except Error as exc:
+                rating_buffer.submit(uid, pid, None)
+                # Пары нет среди записанных и она еще в буфере — значит, не записал и фоновый сброс.
+                written = rating_buffer.flush()
+                if (uid, pid) not in written and (
+                    rating_buffer.is_pending(uid, pid) or rating_buffer.is_dead_letter(uid, pid)
+                ):
+                    raise Error(rating_buffer.last_error or "Изменение осталось в буфере")
+            except (Error, OSError) as exc:
                 st.error(f"Не удалось удалить оценку: {exc}")
             else:
-                cached_ratings.clear()
-                st.success("Оценка удалена.")
+                st.toast("Оценка удалена.")
+                # Полный перезапуск: плитки KPI над фрагментом тоже должны обновиться.
                 st.rerun()
 
+
+@st.fragment
+def render_admin_exports():
+    render_section("Полная выгрузка таблиц")
+    col_table, col_format, col_start = st.columns([2, 1, 1])
+    with col_table:
+        export_table = st.selectbox(
+            "Таблица",
+            list(EXPORTABLE_TABLES),
+            format_func=lambda key: EXPORTABLE_TABLES[key][0],
+            key="admin_export_table",
+        )
+    with col_format:
+        export_format = st.selectbox(
+            "Формат",
+            list(STREAM_FORMATS),
+            format_func=lambda key: STREAM_FORMATS[key][0],
+            key="admin_export_format",
+        )
+    with col_start:
+        st.write("")
+        if st.button("Запустить выгрузку", key="admin_export_start"):
+            start_export(export_table, export_format)
+    render_export_jobs()
+
+
+@st.fragment
+def render_admin_import():
+    render_section("Импорт оценок")
+    st.caption(
+        "CSV или XLSX с колонками user_id, place_id, rating и необязательной rated_at. "
+        "Существующие оценки обновляются, ошибочные строки попадают в отчет."
+    )
+    uploaded = st.file_uploader("Файл с оценками", type=["csv", "xlsx"], key="admin_import_file")
+    if uploaded is not None and st.button("Импортировать", key="admin_import_start"):
+        start_import(uploaded.name, uploaded.getvalue())
+    render_import_jobs()
+
+
+@st.fragment
+def render_admin_cache():
     render_section("Обслуживание кэша")
     if st.button("Очистить кэш данных"):
-        cached_user_profile.clear()
-        cached_preferences.clear()
-        cached_ratings.clear()
-        cached_cities.clear()
-        cached_categories.clear()
-        cached_places.clear()
-        st.success("Кэш очищен.")
+        clear_process_caches()
+        try:
+            broadcast_cache_reset()
+        except Error as exc:
+            st.warning(f"Кэш очищен только в этом процессе: {exc}")
+        else:
+            st.success("Кэш очищен во всех процессах приложения.")
+    cache_stats = analytics_cache.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        render_kpi("Записей в кэше аналитики", cache_stats["entries"])
+    with col2:
+        render_kpi(
+            "Попадания",
+            cache_stats["hits"] + cache_stats["stale_hits"],
+            help_text="Включая устаревшие записи, отданные во время фонового обновления",
+        )
+    with col3:
+        render_kpi("Промахи", cache_stats["misses"])
+    with col4:
+        hit_ratio = cache_stats["hit_ratio"]
+        render_kpi("Доля попаданий", f"{hit_ratio:.0%}" if hit_ratio is not None else None)
+    if cache_stats["refresh_seconds"]:
+        refresh_df = pd.DataFrame(
+            sorted(cache_stats["refresh_seconds"].items()),
+            columns=["Запрос", "Время последнего обновления, с"],
+        )
+        st.dataframe(refresh_df, use_container_width=True)
+
+    user_stats = user_cache.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        render_kpi(
+            "Пользовательский кэш, МБ",
+            f"{user_stats['bytes'] / 1024 / 1024:.1f} / {user_stats['max_bytes'] / 1024 / 1024:.0f}",
+            help_text="Профили, предпочтения и оценки пользователей; при превышении лимита вытесняются давно не использованные",
+        )
+    with col2:
+        render_kpi("Пользователей в кэше", user_stats["users"])
+    with col3:
+        user_hit_ratio = user_stats["hit_ratio"]
+        render_kpi("Доля попаданий", f"{user_hit_ratio:.0%}" if user_hit_ratio is not None else None)
+    with col4:
+        render_kpi("Вытеснено записей", user_stats["evictions"])
+    figure_stats = figure_cache_stats()
+    figure_hit_ratio = figure_stats["hit_ratio"]
+    st.caption(
+        f"Готовые графики: {figure_stats['entries']} в кэше, попаданий {figure_stats['hits']}, "
+        f"построений {figure_stats['misses']}"
+        + (f" ({figure_hit_ratio:.0%} из кэша)" if figure_hit_ratio is not None else "")
+    )
+    buffer_stats = rating_buffer.stats()
+    st.caption(
+        f"Буфер оценок: ожидают записи {buffer_stats['pending']}, записано {buffer_stats['flushed_rows']}, "
+        f"ошибок сброса {buffer_stats['flush_errors']}, в dead-letter {buffer_stats['dead_letters']}"
+    )
+    jobs = job_statuses()
+    if jobs:
+        st.dataframe(
+            pd.DataFrame(jobs).rename(
+                columns={
+                    "job": "Фоновая задача",
+                    "runs": "Успешных запусков",
+                    "errors": "Ошибок",
+                    "last_run_at": "Последний запуск",
+                    "last_error": "Последняя ошибка",
+                    "last_error_at": "Время ошибки",
+                }
+            ),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+
+def render_admin_startup():
+    render_section("Запуск приложения")
+    if import_profiler.total_seconds is not None:
+        st.caption(f"Импорт модулей при старте: {import_profiler.total_seconds:.2f} с")
+    slowest = import_profiler.slowest(limit=15)
+    if slowest:
+        st.dataframe(
+            pd.DataFrame(
+                [(name, round(total * 1000, 1), round(own * 1000, 1)) for name, total, own in slowest],
+                columns=["Модуль", "Импорт с зависимостями, мс", "Собственное время, мс"],
+            ),
+            use_container_width=True,
+        )
+    if warmup_timings:
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    (label, round(seconds * 1000, 1), error or "")
+                    for label, (seconds, error) in warmup_timings.items()
+                ],
+                columns=["Прогрев", "Время, мс", "Ошибка"],
+            ),
+            use_container_width=True,
+        )
+
+
+def _export_title(job) -> str:
+    return f"{EXPORTABLE_TABLES[job.table][0]} · {STREAM_FORMATS[job.fmt][0]} · {job.created_at:%H:%M:%S}"
+
+
+def render_export_jobs():
+    jobs = list_exports()
+    if not jobs:
+        st.caption("Выгрузок пока не было.")
+        return
+    for job in jobs:
+        if job.active:
+            continue
+        title = _export_title(job)
+        if job.status == "error":
+            st.error(f"{title}: {job.error}")
+            continue
+        col_info, col_download, col_discard = st.columns([3, 1, 1])
+        with col_info:
+            st.caption(f"{title} — готово, строк: {job.rows_written}")
+        with col_download:
+            # Файл читается в память только после явного запроса, а не при каждом перерисовывании.
+            prepared_key = f"export_job_prepared_{job.job_id}"
+            if st.session_state.get(prepared_key):
+                st.download_button(
+                    "Скачать",
+                    data=read_export(job),
+                    file_name=job.file_name,
+                    mime=STREAM_FORMATS[job.fmt][1],
+                    key=f"export_job_download_{job.job_id}",
+                )
+            elif st.button("Подготовить файл", key=f"export_job_prepare_{job.job_id}"):
+                st.session_state[prepared_key] = True
+                st.rerun(scope="fragment")
+        with col_discard:
+            if st.button("Удалить", key=f"export_job_discard_{job.job_id}"):
+                discard_export(job.job_id)
+                st.session_state.pop(f"export_job_prepared_{job.job_id}", None)
+                st.rerun(scope="fragment")
+    if any(job.active for job in jobs):
+        render_export_progress()
+
+
+@st.fragment(run_every=2)
+def render_export_progress():
+    active = [job for job in list_exports() if job.active]
+    if not active:
+        # Опрос нужен только пока выгрузка идет: перезапуск страницы показывает результат и снимает таймер.
+        st.rerun()
+    for job in active:
+        total = f" из ~{job.total_rows}" if job.total_rows else ""
+        st.progress(job.progress, text=f"{_export_title(job)}: строк {job.rows_written}{total}")
+
+
+def _import_title(job) -> str:
+    return f"{job.file_name} · {job.created_at:%H:%M:%S}"
+
+
+def _import_speed(job) -> str:
+    return f", {job.rows_per_second:.0f} строк/с" if job.rows_per_second else ""
+
+
+def render_import_jobs():
+    jobs = list_imports()
+    if not jobs:
+        return
+    for job in jobs:
+        if job.active:
+            continue
+        title = _import_title(job)
+        if job.status == "error":
+            st.error(f"{title}: {job.error}")
+        else:
+            col_info, col_discard = st.columns([4, 1])
+            with col_info:
+                st.caption(
+                    f"{title} — загружено {job.imported_rows} из {job.total_rows} строк{_import_speed(job)}, "
+                    f"отклонено {len(job.errors)}"
+                )
+            with col_discard:
+                if st.button("Скрыть", key=f"import_job_discard_{job.job_id}"):
+                    discard_import(job.job_id)
+                    st.rerun(scope="fragment")
+        if not job.errors.empty:
+            with st.expander(f"Ошибки в строках ({len(job.errors)})"):
+                errors_view = job.errors.rename(columns={"row_number": "Строка файла", "reason": "Причина"})
+                st.dataframe(errors_view, use_container_width=True)
+                download_button_for_df(errors_view, f"import_errors_{job.job_id}.xlsx", "Скачать отчет об ошибках")
+    if any(job.active for job in jobs):
+        render_import_progress()
+
+
+@st.fragment(run_every=2)
+def render_import_progress():
+    active = [job for job in list_imports() if job.active]
+    if not active:
+        # Опрос нужен только пока импорт идет: перезапуск страницы показывает результат и снимает таймер.
+        st.rerun()
+    for job in active:
+        st.progress(
+            job.progress,
+            text=f"{_import_title(job)}: записано {job.imported_rows} из {job.valid_rows}{_import_speed(job)}",
+        )
+
+
+def render_full_report_status():
+    version = st.session_state.get("analyst_report_version")
+    job = get_report(version) if version else None
+    if job is None:
+        return
+    if job.status == "running":
+        render_full_report_progress()
+    elif job.status == "error":
+        st.error(f"Не удалось сформировать отчёт: {job.error}")
+    else:
+        st.download_button(
+            "Скачать полный отчёт",
+            data=job.payload,
+            file_name=job.file_name,
+            mime=EXPORT_FORMATS["xlsx"][1],
+            key="analyst_full_report_download",
+        )
+
+
+@st.fragment(run_every=2)
+def render_full_report_progress():
+    version = st.session_state.get("analyst_report_version")
+    job = get_report(version) if version else None
+    if job is None or job.status != "running":
+        # Опрос нужен только пока отчет формируется: перезапуск страницы показывает результат и снимает таймер.
+        st.rerun()
+    st.caption("Отчёт формируется в фоне, можно продолжать работу с дашбордом…")
 
 
 def render_analyst_view():
@@ -727,79 +1212,187 @@ def render_analyst_view():
     with col4:
         render_kpi("Объектов", counts.get("attractions_count", 0))
 
-    render_section("Динамика оценок по дням")
-    timeline = get_ratings_timeline(90)
+    bundle = get_analytics_bundle()
+    st.caption(f"Версия данных: {bundle.version} · собрано {bundle.built_at:%Y-%m-%d %H:%M}")
+    render_analyst_report()
+    render_analyst_trends()
+    render_analyst_breakdown()
+    render_analyst_cohorts()
+    render_analyst_activity()
+    render_analyst_packages()
+    render_analyst_popular()
+
+
+@st.fragment
+def render_analyst_report():
+    if st.button("Сформировать полный отчёт (XLSX)", key="analyst_full_report"):
+        st.session_state["analyst_report_version"] = request_full_report(localize_columns).version
+    render_full_report_status()
+
+
+@st.fragment
+def render_analyst_trends():
+    # Скетчи считаются за период, выбранный для динамики, поэтому они в одном фрагменте.
+    import plotly.express as px
+
+    render_section("Динамика оценок")
+    col_gran, col_period = st.columns([1, 2])
+    with col_gran:
+        granularity = st.radio(
+            "Детализация",
+            GRANULARITIES,
+            format_func=GRANULARITY_LABELS.get,
+            horizontal=True,
+            key="analyst_trend_granularity",
+        )
+    with col_period:
+        today = date.today()
+        period = st.date_input(
+            "Период",
+            value=(today - timedelta(days=90), today),
+            key="analyst_trend_period",
+        )
+    start, end = (period[0], period[-1]) if isinstance(period, (tuple, list)) and period else (None, None)
+    timeline = get_rating_trend(start, end, granularity)
     if timeline.empty:
         st.info("Недостаточно данных для отображения тренда.")
     else:
-        fig = px.line(
-            timeline,
-            x="rated_date",
-            y="avg_rating",
-            markers=True,
-            title="Средняя оценка пользователей (90 дней)",
+        timeline_points = downsample_line(timeline, "rated_date", "avg_rating")
+        fig = cached_figure(
+            f"analyst_trend_{granularity}",
+            timeline_points.frame,
+            lambda frame: px.line(
+                frame,
+                x="rated_date",
+                y="avg_rating",
+                markers=True,
+                hover_data=["rating_count", "distinct_users"],
+                title=f"Средняя оценка пользователей ({GRANULARITY_LABELS[granularity].lower()})",
+            ),
         )
-        st.plotly_chart(fig, use_container_width=True)
+        render_figure(fig)
+        render_reduction_note(timeline_points)
         timeline_display = localize_columns(timeline)
         st.dataframe(timeline_display, use_container_width=True)
-        download_button_for_df(timeline_display, "ratings_timeline.xlsx", "Скачать динамику в XLSX")
+        download_button_for_df(timeline_display, "ratings_timeline.xlsx", "Скачать динамику")
+
+    render_section("Уникальные пользователи и распределение оценок")
+    sketch_dimension = st.radio(
+        "Разрез",
+        ("city", "category"),
+        format_func={"city": "Города", "category": "Категории"}.get,
+        horizontal=True,
+        key="analyst_sketch_dimension",
+    )
+    distinct_df = get_distinct_active_users(sketch_dimension, start, end)
+    quantiles_df = get_rating_quantiles(sketch_dimension, start, end)
+    if distinct_df.empty:
+        st.info("Нет оценок за выбранный период.")
+    else:
+        st.caption("Приближенные значения по скетчам HyperLogLog и KLL за период, выбранный для динамики.")
+        sketch_df = distinct_df.merge(
+            quantiles_df.drop(columns=["rating_count"]), on=sketch_dimension, how="left"
+        )
+        st.dataframe(localize_columns(sketch_df), use_container_width=True)
 
+
+@st.fragment
+def render_analyst_breakdown():
+    import plotly.express as px
+
+    bundle = get_analytics_bundle()
     col_a, col_b = st.columns(2)
     with col_a:
         render_section("Категории по активности")
-        cat_df = get_ratings_by_category()
+        cat_df = bundle.ratings_by_category
         if cat_df.empty:
             st.info("Нет категорий для отображения.")
         else:
-            fig = px.bar(
+            fig = cached_figure(
+                "analyst_categories",
                 cat_df,
-                x="category",
-                y="rating_count",
-                color="avg_user_rating",
-                title="Количество оценок по категориям",
+                lambda frame: px.bar(
+                    frame,
+                    x="category",
+                    y="rating_count",
+                    color="avg_user_rating",
+                    title="Количество оценок по категориям",
+                ),
             )
-            st.plotly_chart(fig, use_container_width=True)
+            render_figure(fig)
             cat_display = localize_columns(cat_df)
             st.dataframe(cat_display, use_container_width=True)
             download_button_for_df(cat_display, "categories_activity.xlsx", "Скачать категории")
     with col_b:
         render_section("Города по активности")
-        city_df = get_ratings_by_city()
+        city_df = bundle.ratings_by_city
         if city_df.empty:
             st.info("Нет городов для отображения.")
         else:
-            fig = px.bar(
+            fig = cached_figure(
+                "analyst_cities",
                 city_df,
-                x="city",
-                y="rating_count",
-                color="avg_user_rating",
-                title="Количество оценок по городам",
+                lambda frame: px.bar(
+                    frame,
+                    x="city",
+                    y="rating_count",
+                    color="avg_user_rating",
+                    title="Количество оценок по городам",
+                ),
             )
-            st.plotly_chart(fig, use_container_width=True)
+            render_figure(fig)
             city_display = localize_columns(city_df)
             st.dataframe(city_display, use_container_width=True)
             download_button_for_df(city_display, "cities_activity.xlsx", "Скачать города")
 
+
+@st.fragment
+def render_analyst_cohorts():
+    import plotly.express as px
+
+    render_section("Удержание когорт")
+    retention = get_cohort_retention()
+    if retention.empty:
+        st.info("Недостаточно данных для когортного анализа.")
+    else:
+        retention_view = retention.copy()
+        retention_view.index = [format_date(value) for value in retention_view.index]
+        fig = cached_figure(
+            "analyst_cohorts",
+            retention_view,
+            lambda frame: px.imshow(
+                frame,
+                text_auto=".0%",
+                aspect="auto",
+                color_continuous_scale="Blues",
+                labels={"x": "Месяцев с первой оценки", "y": "Когорта (месяц первой оценки)", "color": "Доля активных"},
+                title="Доля пользователей когорты, ставивших оценки в каждом следующем месяце",
+            ),
+        )
+        render_figure(fig)
+
+
+@st.fragment
+def render_analyst_activity():
     render_section("Активность пользователей")
-    activity_df = get_user_activity()
+    search_query = st.text_input(
+        "Поиск пользователя по ID или локации",
+        key="analyst_user_search",
+        help="ID сравнивается целиком, локация — по началу названия.",
+    ).strip()
+    activity_df = render_users_pager("analyst_activity", 20, search_query)
     if activity_df.empty:
         st.info("Нет данных об активности пользователей.")
     else:
-        search_query = st.text_input(
-            "Поиск пользователя по ID или локации",
-            key="analyst_user_search",
-        ).strip()
-        filtered_activity = activity_df.copy()
-        if search_query:
-            filtered_activity = filtered_activity[
-                filtered_activity["user_id"].astype(str).str.contains(search_query, case=False, na=False)
-                | filtered_activity["location"].astype(str).str.contains(search_query, case=False, na=False)
-            ]
-            st.caption(f"Найдено записей: {len(filtered_activity)}")
-        activity_display = localize_columns(filtered_activity)
+        activity_display = localize_columns(activity_df.drop(columns=["age"], errors="ignore"))
         st.dataframe(activity_display, use_container_width=True)
         download_button_for_df(activity_display, "user_activity.xlsx", "Скачать активность пользователей")
 
+
+@st.fragment
+def render_analyst_packages():
+    import plotly.express as px
+
     render_section("Покрытие пакетами и ценовые сегменты")
     packages_df = get_package_coverage()
     price_df = get_price_segments()
@@ -808,14 +1401,18 @@ def render_analyst_view():
         if packages_df.empty:
             st.info("Нет данных по пакетам.")
         else:
-            fig = px.bar(
+            fig = cached_figure(
+                "analyst_packages",
                 packages_df,
-                x="city",
-                y="package_count",
-                title="Пакеты по городам",
-                text="total_stops",
+                lambda frame: px.bar(
+                    frame,
+                    x="city",
+                    y="package_count",
+                    title="Пакеты по городам",
+                    text="total_stops",
+                ),
             )
-            st.plotly_chart(fig, use_container_width=True)
+            render_figure(fig)
             packages_display = localize_columns(packages_df)
             st.dataframe(packages_display, use_container_width=True)
             download_button_for_df(packages_display, "packages_coverage.xlsx", "Скачать покрытие пакетов")
@@ -823,19 +1420,26 @@ def render_analyst_view():
         if price_df.empty:
             st.info("Нет данных по ценовым сегментам.")
         else:
-            fig = px.pie(
+            fig = cached_figure(
+                "analyst_price_segments",
                 price_df,
-                names="price_segment",
-                values="attractions",
-                title="Распределение объектов по сегментам",
+                lambda frame: px.pie(
+                    frame,
+                    names="price_segment",
+                    values="attractions",
+                    title="Распределение объектов по сегментам",
+                ),
             )
-            st.plotly_chart(fig, use_container_width=True)
+            render_figure(fig)
             price_display = localize_columns(price_df)
             st.dataframe(price_display, use_container_width=True)
             download_button_for_df(price_display, "price_segments.xlsx", "Скачать сегменты")
 
+
+@st.fragment
+def render_analyst_popular():
     render_section("ТОП популярные места")
-    popular = get_popular_places(15)
+    popular = get_analytics_bundle().popular_places.head(15)
     if popular.empty:
         st.info("Нет популярных мест для отображения.")
     else:
@@ -846,6 +1450,7 @@ def render_analyst_view():
 
 def dashboard():
     inject_global_styles()
+    start_background_jobs()
     user = st.session_state.get("auth_user")
     if not user:
         login_screen()
@@ -865,25 +1470,23 @@ def dashboard():
         render_analyst_view()
         return
 
-    pref_df = cached_preferences(user["user_id"])
-    preference_vector = build_preference_vector(pref_df)
+    context = get_user_context(user["user_id"])
+    preference_vector = context.preference_vector
 
-    tab1, tab2, tab3, tab4 = st.tabs(
-        [
-            "Предпочтения и оценки",
-            "Персональные предложения",
-            "Поиск туров",
-            "Аналитика популярности",
-        ]
+    active_tab = st.radio(
+        "Раздел",
+        USER_TABS,
+        horizontal=True,
+        key="user_active_tab",
+        label_visibility="collapsed",
     )
-
-    with tab1:
-        render_preferences_tab(user["user_id"])
-    with tab2:
+    if active_tab == USER_TABS[0]:
+        render_preferences_tab(context)
+    elif active_tab == USER_TABS[1]:
         render_recommendations_tab(user["user_id"], preference_vector)
-    with tab3:
+    elif active_tab == USER_TABS[2]:
         render_search_tab(user["user_id"], preference_vector)
-    with tab4:
+    else:
         render_analytics_tab()
 
 
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.synthetic import (
+    RATING_DAYS,
+    RATINGS_END_DATE,
+    generate_tables,
+    load_tables,
+    synthetic_password,
+    table_sizes,
+    use_database,
+)
+
+
+DEFAULT_SCALES = (1.0, 10.0, 100.0)
+SAMPLE_USERS = 5
+REGRESSION_THRESHOLD = 1.2
+
+
+def clear_service_caches():
+    """Холодный старт процесса: сбрасывает все кэши сервисов, но не буферы MySQL."""
+    from services.cache import analytics_cache
+    from services.credentials import clear_credential_cache
+    from services.user_cache import user_cache
+
+    analytics_cache.clear()
+    user_cache.clear()
+    clear_credential_cache()
+
+
+def _result_size(value: Any) -> Optional[int]:
+    if hasattr(value, "popular_places"):
+        return len(value.popular_places)
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def build_cases(scale: float) -> List[Tuple[str, Callable[[], Any]]]:
+    """Вызовы сервисов с фиксированными аргументами; пользователи берутся равномерно по диапазону id."""
+    from services.analytics import (
+        get_analytics_bundle,
+        get_category_satisfaction,
+        get_city_demand,
+        get_cohort_retention,
+        get_distinct_active_users,
+        get_entity_counts,
+        get_package_coverage,
+        get_popular_places,
+        get_price_segments,
+        get_rating_quantiles,
+        get_rating_trend,
+        get_ratings_timeline,
+        get_recent_ratings,
+        get_users_page,
+    )
+    from services.auth import authenticate
+    from services.recommendations import get_recommendations
+    from services.search import get_available_categories, get_available_cities, search_packages
+    from services.user_context import get_user_context, load_user_context
+
+    users = table_sizes(scale)["users"]
+    user_ids = sorted({1 + index * users // SAMPLE_USERS for index in range(SAMPLE_USERS)})
+    start, end = RATINGS_END_DATE - timedelta(days=RATING_DAYS // 4), RATINGS_END_DATE
+    vectors = {user_id: load_user_context(user_id).preference_vector for user_id in user_ids}
+
+    def for_users(call: Callable[[int], Any]) -> Callable[[], Any]:
+        return lambda: [call(user_id) for user_id in user_ids]
+
+    def recommendations(user_id: int):
+        return get_recommendations(user_id, vectors[user_id])
+
+    def search(user_id: int, city: Optional[str] = None):
+        return search_packages(city, None, (None, 150000.0), vectors[user_id])
+
+    return [
+        ("authenticate", for_users(lambda user_id: authenticate(f"user{user_id}", synthetic_password(user_id)))),
+        ("user_context", for_users(get_user_context)),
+        ("recommendations", for_users(recommendations)),
+        ("search_packages", for_users(search)),
+        ("search_packages_city", for_users(lambda user_id: search(user_id, "Bandung"))),
+        ("available_cities", get_available_cities),
+        ("available_categories", get_available_categories),
+        ("entity_counts", get_entity_counts),
+        ("analytics_bundle", get_analytics_bundle),
+        ("popular_places", get_popular_places),
+        ("city_demand", get_city_demand),
+        ("category_satisfaction", get_category_satisfaction),
+        ("price_segments", get_price_segments),
+        ("ratings_timeline", get_ratings_timeline),
+        ("rating_trend_week", lambda: get_rating_trend(start, end, "week")),
+        ("distinct_active_users", lambda: get_distinct_active_users("city", start, end)),
+        ("rating_quantiles", lambda: get_rating_quantiles("category", start, end)),
+        ("cohort_retention", get_cohort_retention),
+        ("users_page", lambda: get_users_page(limit=100)),
+        ("recent_ratings", get_recent_ratings),
+        ("package_coverage", get_package_coverage),
+    ]
+
+
+def _summary(samples: List[float]) -> Dict[str, Any]:
+    return {
+        "runs": len(samples),
+        "min": round(min(samples), 6),
+        "median": round(statistics.median(samples), 6),
+        "max": round(max(samples), 6),
+    }
+
+
+def time_case(call: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Холодные замеры — после сброса кэшей перед каждым вызовом, теплые — подряд после прогрева."""
+    cold, warm = [], []
+    result = None
+    for _ in range(repeat):
+        clear_service_caches()
+        started = time.perf_counter()
+        result = call()
+        cold.append(time.perf_counter() - started)
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        warm.append(time.perf_counter() - started)
+    return {"rows": _result_size(result), "cold": _summary(cold), "warm": _summary(warm)}
+
+
+def run_benchmarks(
+    scales=DEFAULT_SCALES, seed: int = 42, repeat: int = 5, generate: bool = True
+) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for scale in scales:
+        scale_key = f"{scale:g}"
+        entry: Dict[str, Any] = {"sizes": table_sizes(scale), "cases": {}}
+        if generate:
+            started = time.perf_counter()
+            entry["loaded_rows"] = load_tables(generate_tables(scale, seed), replace=True)
+            entry["load_seconds"] = round(time.perf_counter() - started, 3)
+        for name, call in build_cases(scale):
+            try:
+                entry["cases"][name] = time_case(call, repeat)
+            except Exception as exc:
+                entry["cases"][name] = {"error": str(exc)}
+            print(f"[{scale_key}x] {name}: {_format_case(entry['cases'][name])}", file=sys.stderr)
+        results[scale_key] = entry
+    return results
+
+
+def _format_case(case: Dict[str, Any]) -> str:
+    if "error" in case:
+        return f"ошибка: {case['error']}"
+    return f"cold {case['cold']['median'] * 1000:.1f} мс, warm {case['warm']['median'] * 1000:.1f} мс"
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = REGRESSION_THRESHOLD):
+    """Случаи, чья медиана выросла более чем в threshold раз: (масштаб, случай, режим, отношение)."""
+    regressions = []
+    for scale_key, entry in current["results"].items():
+        base_cases = baseline.get("results", {}).get(scale_key, {}).get("cases", {})
+        for name, case in entry["cases"].items():
+            base = base_cases.get(name)
+            if not base or "error" in base or "error" in case:
+                continue
+            for mode in ("cold", "warm"):
+                before, after = base[mode]["median"], case[mode]["median"]
+                if before > 0 and after / before > threshold:
+                    regressions.append((scale_key, name, mode, round(after / before, 2)))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Замеры сервисов на синтетических данных разного масштаба.")
+    parser.add_argument("--database", required=True, help="имя отдельной базы для бенчмарков; данные в ней перезаписываются")
+    parser.add_argument("--scales", type=float, nargs="+", default=list(DEFAULT_SCALES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-generate", action="store_true", help="замерять на уже загруженных данных (один масштаб)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="JSON прошлого запуска для сравнения")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    use_database(args.database)
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "database": args.database,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": run_benchmarks(args.scales, args.seed, args.repeat, generate=not args.skip_generate),
+    }
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}", file=sys.stderr)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as handle:
+        regressions = compare_results(json.load(handle), report, args.threshold)
+    for scale_key, name, mode, ratio in regressions:
+        print(f"Замедление [{scale_key}x] {name} ({mode}): в {ratio} раза", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+from datetime import date, timedelta
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+BASE_SIZES = {"users": 300, "attractions": 437, "ratings": 10000, "packages": 100}
+CITIES = {
+    "Jakarta": "DKI Jakarta",
+    "Yogyakarta": "DIY",
+    "Bandung": "Jawa Barat",
+    "Semarang": "Jawa Tengah",
+    "Surabaya": "Jawa Timur",
+}
+CATEGORIES = ("Budaya", "Taman Hiburan", "Cagar Alam", "Bahari", "Pusat Perbelanjaan", "Tempat Ibadah")
+RATING_DAYS = 730
+RATINGS_END_DATE = date(2025, 12, 31)
+INSERT_CHUNK = 5000
+
+# Порядок важен: при очистке и загрузке зависимые таблицы идут после справочников.
+TABLE_DDL = {
+    "users": """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INT PRIMARY KEY,
+            location VARCHAR(255),
+            age INT
+        )
+    """,
+    "users_credentials": """
+        CREATE TABLE IF NOT EXISTS users_credentials (
+            user_id INT PRIMARY KEY,
+            login VARCHAR(64) NOT NULL UNIQUE,
+            password_hash CHAR(64) NOT NULL,
+            is_blocked TINYINT(1) DEFAULT 0
+        )
+    """,
+    "tourism_attractions": """
+        CREATE TABLE IF NOT EXISTS tourism_attractions (
+            place_id INT PRIMARY KEY,
+            place_name VARCHAR(255) NOT NULL,
+            category VARCHAR(255),
+            city VARCHAR(255),
+            price INT,
+            overall_rating DOUBLE
+        )
+    """,
+    "ratings": """
+        CREATE TABLE IF NOT EXISTS ratings (
+            user_id INT NOT NULL,
+            place_id INT NOT NULL,
+            rating DOUBLE NOT NULL,
+            rated_at DATE,
+            PRIMARY KEY (user_id, place_id)
+        )
+    """,
+    "tourism_packages": """
+        CREATE TABLE IF NOT EXISTS tourism_packages (
+            Package_id INT PRIMARY KEY,
+            City VARCHAR(255),
+            Place_Tourism1_id INT,
+            Place_Tourism2_id INT,
+            Place_Tourism3_id INT,
+            Place_Tourism4_id INT,
+            Place_Tourism5_id INT
+        )
+    """,
+    "package_places": """
+        CREATE TABLE IF NOT EXISTS package_places (
+            package_id INT NOT NULL,
+            place_id INT NOT NULL,
+            position INT NOT NULL,
+            PRIMARY KEY (package_id, position)
+        )
+    """,
+    "user_preferences": """
+        CREATE TABLE IF NOT EXISTS user_preferences (
+            user_id INT NOT NULL,
+            preference_type VARCHAR(64) NOT NULL,
+            preference_key VARCHAR(255) NOT NULL,
+            preference_value DOUBLE NOT NULL,
+            PRIMARY KEY (user_id, preference_type, preference_key)
+        )
+    """,
+}
+
+
+def synthetic_password(user_id: int) -> str:
+    """Пароль синтетического пользователя: бенчмарк входит под ним без отдельного хранения."""
+    return f"bench-{user_id}"
+
+
+def table_sizes(scale: float) -> Dict[str, int]:
+    return {name: max(int(round(size * scale)), 1) for name, size in BASE_SIZES.items()}
+
+
+def _users(rng: np.random.Generator, count: int) -> pd.DataFrame:
+    cities = rng.choice(list(CITIES), size=count)
+    return pd.DataFrame(
+        {
+            "user_id": np.arange(1, count + 1),
+            "location": [f"{city}, {CITIES[city]}" for city in cities],
+            "age": rng.integers(18, 41, size=count),
+        }
+    )
+
+
+def _credentials(users: pd.DataFrame) -> pd.DataFrame:
+    user_ids = users["user_id"].tolist()
+    return pd.DataFrame(
+        {
+            "user_id": user_ids,
+            "login": [f"user{user_id}" for user_id in user_ids],
+            "password_hash": [
+                hashlib.sha256(synthetic_password(user_id).encode("utf-8")).hexdigest() for user_id in user_ids
+            ],
+            "is_blocked": 0,
+        }
+    )
+
+
+def _attractions(rng: np.random.Generator, count: int) -> pd.DataFrame:
+    categories = rng.choice(CATEGORIES, size=count)
+    cities = rng.choice(list(CITIES), size=count)
+    paid = rng.random(count) > 0.3
+    prices = np.where(paid, np.round(rng.lognormal(10.2, 1.0, size=count), -3), 0).astype(int)
+    return pd.DataFrame(
+        {
+            "place_id": np.arange(1, count + 1),
+            "place_name": [f"{category} {city} #{index}" for index, (category, city) in enumerate(zip(categories, cities), 1)],
+            "category": categories,
+            "city": cities,
+            "price": prices,
+            "overall_rating": np.round(rng.uniform(3.4, 5.0, size=count), 1),
+        }
+    )
+
+
+def _ratings(rng: np.random.Generator, count: int, users: pd.DataFrame, places: pd.DataFrame) -> pd.DataFrame:
+    # Популярность мест убывает по степенному закону, как в реальном журнале оценок.
+    popularity = 1.0 / np.arange(1, len(places) + 1) ** 0.8
+    popularity = rng.permutation(popularity / popularity.sum())
+    count = min(count, len(users) * len(places))
+    parts: List[pd.DataFrame] = []
+    drawn = 0
+    while drawn < count:
+        draw = int((count - drawn) * 1.3) + 16
+        parts.append(
+            pd.DataFrame(
+                {
+                    "user_id": rng.integers(1, len(users) + 1, size=draw),
+                    "place_index": rng.choice(len(places), size=draw, p=popularity),
+                }
+            )
+        )
+        frame = pd.concat(parts, ignore_index=True).drop_duplicates(["user_id", "place_index"])
+        drawn = len(frame)
+    frame = frame.head(count)
+    quality = places["overall_rating"].to_numpy()[frame["place_index"].to_numpy()]
+    ratings = np.clip(np.round(quality - 1.5 + rng.normal(0, 1.0, size=count)), 1, 5)
+    offsets = rng.integers(0, RATING_DAYS, size=count)
+    return pd.DataFrame(
+        {
+            "user_id": frame["user_id"].to_numpy(),
+            "place_id": places["place_id"].to_numpy()[frame["place_index"].to_numpy()],
+            "rating": ratings,
+            "rated_at": [RATINGS_END_DATE - timedelta(days=int(offset)) for offset in offsets],
+        }
+    )
+
+
+def _packages(rng: np.random.Generator, count: int, places: pd.DataFrame):
+    by_city = {city: group["place_id"].to_numpy() for city, group in places.groupby("city")}
+    cities = rng.choice(sorted(by_city), size=count)
+    packages: List[Dict] = []
+    package_places: List[Dict] = []
+    for package_id, city in enumerate(cities, 1):
+        stops = rng.choice(by_city[city], size=min(int(rng.integers(2, 6)), len(by_city[city])), replace=False)
+        row = {"Package_id": package_id, "City": str(city)}
+        for position in range(1, 6):
+            place_id = int(stops[position - 1]) if position <= len(stops) else None
+            row[f"Place_Tourism{position}_id"] = place_id
+            if place_id is not None:
+                package_places.append({"package_id": package_id, "place_id": place_id, "position": position})
+        packages.append(row)
+    place_columns = {f"Place_Tourism{position}_id": "Int64" for position in range(1, 6)}
+    return pd.DataFrame(packages).astype(place_columns), pd.DataFrame(package_places)
+
+
+def _preferences(rng: np.random.Generator, users: pd.DataFrame) -> pd.DataFrame:
+    rows = []
+    for user_id in users["user_id"].tolist():
+        for category in rng.choice(CATEGORIES, size=int(rng.integers(1, 4)), replace=False):
+            rows.append((user_id, "category_preference", category, round(float(rng.uniform(0.2, 1.0)), 4)))
+        city = rng.choice(list(CITIES))
+        rows.append((user_id, "city_preference", city, round(float(rng.uniform(0.2, 1.0)), 4)))
+    return pd.DataFrame(rows, columns=["user_id", "preference_type", "preference_key", "preference_value"])
+
+
+def generate_tables(scale: float = 1.0, seed: int = 42) -> Dict[str, pd.DataFrame]:
+    """Синтетические данные для семи таблиц; одинаковые scale и seed дают одинаковый результат.
+
+    Масштаб 1 соответствует исходному набору: 300 пользователей, 437 мест,
+    10 000 оценок и 100 турпакетов.
+    """
+    rng = np.random.default_rng(seed)
+    sizes = table_sizes(scale)
+    users = _users(rng, sizes["users"])
+    places = _attractions(rng, sizes["attractions"])
+    packages, package_places = _packages(rng, sizes["packages"], places)
+    return {
+        "users": users,
+        "users_credentials": _credentials(users),
+        "tourism_attractions": places,
+        "ratings": _ratings(rng, sizes["ratings"], users, places),
+        "tourism_packages": packages,
+        "package_places": package_places,
+        "user_preferences": _preferences(rng, users),
+    }
+
+
+def use_database(name: str):
+    """Направляет пул соединений в указанную базу; вызывать до первого запроса.
+
+    Для встроенной базы (DB_BACKEND=sqlite) имя — путь к файлу или ":memory:".
+    """
+    from config import get_settings
+    from db import reset_backends
+
+    os.environ["MYSQL_DB"] = name
+    os.environ["EMBEDDED_DB_PATH"] = name
+    get_settings.cache_clear()
+    reset_backends()
+
+
+def _native(value):
+    if value is None or value is pd.NA:
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _rows(frame: pd.DataFrame) -> List[tuple]:
+    values = frame.astype(object).where(frame.notna(), None)
+    return [tuple(map(_native, row)) for row in values.itertuples(index=False, name=None)]
+
+
+def load_tables(tables: Dict[str, pd.DataFrame], replace: bool = False) -> Dict[str, int]:
+    """Создает недостающие таблицы и загружает в них данные пакетами.
+
+    Без replace загрузка в базу, где уже есть пользователи, отклоняется.
+    Производные данные (агрегаты, счетчики, бакеты, скетчи, когорты, выученные предпочтения,
+    а также колоночный снимок или встроенная копия аналитики, если она выбрана в ANALYTICS_SOURCE)
+    после загрузки пересчитываются полностью.
+    """
+    from db import execute_query, fetch_one_dict, transaction
+
+    for ddl in TABLE_DDL.values():
+        execute_query(ddl)
+    existing = fetch_one_dict("SELECT COUNT(*) AS cnt FROM users")
+    if existing and existing["cnt"] and not replace:
+        raise RuntimeError("В базе уже есть данные; для перезаписи укажите replace=True (--replace)")
+    for table in reversed(list(TABLE_DDL)):
+        execute_query(f"DELETE FROM {table}")
+    loaded = {}
+    for table in TABLE_DDL:
+        frame = tables[table]
+        columns = ", ".join(frame.columns)
+        placeholders = ", ".join(["%s"] * len(frame.columns))
+        rows = _rows(frame)
+        for offset in range(0, len(rows), INSERT_CHUNK):
+            with transaction() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {table} ({columns}) VALUES ({placeholders})",
+                    rows[offset : offset + INSERT_CHUNK],
+                )
+        loaded[table] = len(rows)
+    _rebuild_derived_state()
+    return loaded
+
+
+def _rebuild_derived_state():
+    from config import get_settings
+    from db import execute_query
+    from services.aggregates import ensure_aggregate_tables, reconcile_aggregates
+    from services.analytics_mirror import refresh_mirror
+    from services.cohorts import ensure_cohort_tables, refresh_cohorts
+    from services.columnar_store import refresh_snapshot
+    from services.counters import ensure_counter_table, reconcile_counters
+    from services.preference_learner import ensure_learned_table, learn_preferences
+    from services.rollups import ensure_rollup_table, refresh_rollups
+    from services.sketches import ensure_sketch_table, refresh_sketches
+
+    ensure_aggregate_tables()
+    reconcile_aggregates()
+    ensure_counter_table()
+    reconcile_counters()
+    ensure_rollup_table()
+    refresh_rollups(full=True)
+    ensure_sketch_table()
+    refresh_sketches(full=True)
+    ensure_cohort_tables()
+    refresh_cohorts(full=True)
+    # Снимок и копия лежат вне базы и пережили бы перезагрузку со старыми данными;
+    # пересобирается только источник, выбранный в ANALYTICS_SOURCE.
+    analytics_source = get_settings().analytics_source
+    if analytics_source == "snapshot":
+        refresh_snapshot(full=True)
+    elif analytics_source == "embedded":
+        refresh_mirror()
+    ensure_learned_table()
+    execute_query("DELETE FROM learned_preferences")
+    learn_preferences(full=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Заполняет локальную базу синтетическими данными.")
+    parser.add_argument("--database", required=True, help="имя отдельной базы для бенчмарков")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--replace", action="store_true", help="удалить данные, уже лежащие в базе")
+    args = parser.parse_args(argv)
+    use_database(args.database)
+    loaded = load_tables(generate_tables(args.scale, args.seed), replace=args.replace)
+    for table, count in loaded.items():
+        print(f"{table}: {count}")
+
+
+if __name__ == "__main__":
+    main()
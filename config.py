@@ -12,7 +12,30 @@ class Settings:
     mysql_db: str
     mysql_pool_name: str
     mysql_pool_size: int
+    db_backend: str
+    embedded_db_path: str
     enable_query_logging: bool
+    aggregates_reconcile_interval: int
+    kpi_counter_mode: str
+    kpi_stats_refresh_interval: int
+    rollup_refresh_interval: int
+    sketch_refresh_interval: int
+    cohort_refresh_interval: int
+    analytics_source: str
+    analytics_snapshot_dir: str
+    analytics_snapshot_interval: int
+    analytics_embedded_engine: str
+    analytics_embedded_path: str
+    credential_cache_ttl: int
+    user_cache_max_mb: int
+    user_cache_ttl: int
+    cache_sync_interval: int
+    rating_flush_interval: float
+    rating_flush_size: int
+    rating_journal_dir: str
+    preference_learn_interval: int
+    warmup_delay: float
+    chart_point_budget: int
 
 
 @lru_cache(maxsize=1)
@@ -26,6 +49,29 @@ def get_settings() -> Settings:
         mysql_db=os.getenv("MYSQL_DB", "tink1"),
         mysql_pool_name=os.getenv("MYSQL_POOL_NAME", "tourism_pool"),
         mysql_pool_size=int(os.getenv("MYSQL_POOL_SIZE", "6")),
+        db_backend=os.getenv("DB_BACKEND", "mysql").lower(),
+        embedded_db_path=os.getenv("EMBEDDED_DB_PATH", ":memory:"),
         enable_query_logging=os.getenv("ENABLE_QUERY_LOGGING", "0") == "1",
+        aggregates_reconcile_interval=int(os.getenv("AGGREGATES_RECONCILE_INTERVAL", "3600")),
+        kpi_counter_mode=os.getenv("KPI_COUNTER_MODE", "exact").lower(),
+        kpi_stats_refresh_interval=int(os.getenv("KPI_STATS_REFRESH_INTERVAL", "60")),
+        rollup_refresh_interval=int(os.getenv("ROLLUP_REFRESH_INTERVAL", "300")),
+        sketch_refresh_interval=int(os.getenv("SKETCH_REFRESH_INTERVAL", "600")),
+        cohort_refresh_interval=int(os.getenv("COHORT_REFRESH_INTERVAL", "3600")),
+        analytics_source=os.getenv("ANALYTICS_SOURCE", "mysql").lower(),
+        analytics_snapshot_dir=os.getenv("ANALYTICS_SNAPSHOT_DIR", "analytics_snapshot"),
+        analytics_snapshot_interval=int(os.getenv("ANALYTICS_SNAPSHOT_INTERVAL", "900")),
+        analytics_embedded_engine=os.getenv("ANALYTICS_EMBEDDED_ENGINE", "duckdb").lower(),
+        analytics_embedded_path=os.getenv("ANALYTICS_EMBEDDED_PATH", "analytics_mirror.duckdb"),
+        credential_cache_ttl=int(os.getenv("CREDENTIAL_CACHE_TTL", "60")),
+        user_cache_max_mb=int(os.getenv("USER_CACHE_MAX_MB", "64")),
+        user_cache_ttl=int(os.getenv("USER_CACHE_TTL", "900")),
+        cache_sync_interval=int(os.getenv("CACHE_SYNC_INTERVAL", "5")),
+        rating_flush_interval=float(os.getenv("RATING_FLUSH_INTERVAL", "2")),
+        rating_flush_size=int(os.getenv("RATING_FLUSH_SIZE", "200")),
+        rating_journal_dir=os.getenv("RATING_JOURNAL_DIR", "rating_journal"),
+        preference_learn_interval=int(os.getenv("PREFERENCE_LEARN_INTERVAL", "3600")),
+        warmup_delay=float(os.getenv("WARMUP_DELAY", "30")),
+        chart_point_budget=int(os.getenv("CHART_POINT_BUDGET", "2000")),
     )
 
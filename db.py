@@ -1,67 +1,282 @@
 from __future__ import annotations
 
+import threading
 from contextlib import contextmanager
-from typing import Any, Dict, List, Optional, Sequence
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
-import mysql.connector
 from mysql.connector import Error
 from mysql.connector.pooling import MySQLConnectionPool
 
 from config import get_settings
+from db_embedded import EMBEDDED_BACKENDS
 
 
-_pool: Optional[MySQLConnectionPool] = None
+class MySQLBackend:
+    """Рабочая база: пул соединений mysql-connector."""
 
+    streams_results = True
 
-def _ensure_pool() -> MySQLConnectionPool:
-    global _pool
-    if _pool is None:
-        settings = get_settings()
-        _pool = MySQLConnectionPool(
-            pool_name=settings.mysql_pool_name,
-            pool_size=settings.mysql_pool_size,
-            host=settings.mysql_host,
-            port=settings.mysql_port,
-            user=settings.mysql_user,
-            password=settings.mysql_password,
-            database=settings.mysql_db,
-            charset="utf8mb4",
-            autocommit=True,
+    def __init__(self):
+        self._pool: Optional[MySQLConnectionPool] = None
+        self._pool_lock = threading.Lock()
+
+    def _ensure_pool(self) -> MySQLConnectionPool:
+        with self._pool_lock:
+            if self._pool is None:
+                settings = get_settings()
+                self._pool = MySQLConnectionPool(
+                    pool_name=settings.mysql_pool_name,
+                    pool_size=settings.mysql_pool_size,
+                    host=settings.mysql_host,
+                    port=settings.mysql_port,
+                    user=settings.mysql_user,
+                    password=settings.mysql_password,
+                    database=settings.mysql_db,
+                    charset="utf8mb4",
+                    autocommit=True,
+                )
+            return self._pool
+
+    @contextmanager
+    def connect(self):
+        conn = self._ensure_pool().get_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def cursor(self, conn, dictionary: bool = False, prepared: bool = False, buffered: Optional[bool] = None):
+        options: Dict[str, Any] = {}
+        if dictionary:
+            options["dictionary"] = True
+        if prepared:
+            options["prepared"] = True
+        if buffered is not None:
+            options["buffered"] = buffered
+        return conn.cursor(**options)
+
+    def begin(self, conn) -> bool:
+        conn.autocommit = False
+        return True
+
+    def commit(self, conn):
+        conn.commit()
+
+    def rollback(self, conn):
+        conn.rollback()
+
+    def finish(self, conn, owner: bool):
+        conn.autocommit = True
+
+    def discard_unread(self, conn):
+        if conn.unread_result:
+            conn.consume_results()
+
+    def fetch_result_sets(self, conn, statements: Sequence[str], params: Sequence[Any]) -> List[List[Dict[str, Any]]]:
+        results: List[List[Dict[str, Any]]] = []
+        cursor = conn.cursor(dictionary=True)
+        for result in cursor.execute(";\n".join(statements), params, multi=True):
+            if result.with_rows:
+                results.append(result.fetchall())
+        cursor.close()
+        return results
+
+    def call_procedure(self, conn, proc_name: str, args: Sequence[Any]) -> List[Dict[str, Any]]:
+        cursor = conn.cursor(dictionary=True)
+        cursor.callproc(proc_name, args)
+        result_sets: List[Dict[str, Any]] = []
+        for result in cursor.stored_results():
+            result_sets.extend(result.fetchall())
+        cursor.close()
+        return result_sets
+
+    def index_exists(self, table_name: str, index_name: str) -> bool:
+        row = fetch_one_dict(
+            """
+            SELECT 1 AS present
+            FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND TABLE_NAME = %s
+              AND INDEX_NAME = %s
+            LIMIT 1
+            """,
+            (table_name, index_name),
         )
-    return _pool
+        return bool(row)
+
+    def column_names(self, table_name: str) -> List[str]:
+        query = """
+            SELECT COLUMN_NAME
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND TABLE_NAME = %s
+        """
+        rows = fetch_all_dicts(query, (table_name,))
+        return [row["COLUMN_NAME"] for row in rows]
+
+
+def create_backend(kind: str, path: str = ""):
+    """Движок по имени: mysql, sqlite или duckdb (последний — только для аналитики на чтение)."""
+    if kind == "mysql":
+        return MySQLBackend()
+    if kind in EMBEDDED_BACKENDS:
+        return EMBEDDED_BACKENDS[kind](path)
+    raise ValueError(f"Неизвестный движок базы: {kind}")
+
+
+_primary_backend = None
+_primary_lock = threading.Lock()
+_active_backend: ContextVar[Optional[Any]] = ContextVar("active_backend", default=None)
+
+
+def primary_backend():
+    """Основная база процесса, выбранная DB_BACKEND."""
+    global _primary_backend
+    with _primary_lock:
+        if _primary_backend is None:
+            settings = get_settings()
+            _primary_backend = create_backend(settings.db_backend, settings.embedded_db_path)
+        return _primary_backend
+
+
+def get_backend():
+    return _active_backend.get() or primary_backend()
 
 
 @contextmanager
-def get_connection():
-    pool = _ensure_pool()
-    conn = pool.get_connection()
+def use_backend(backend):
+    """Направляет запросы текущего потока (контекста) в другой движок, например в аналитическую копию."""
+    token = _active_backend.set(backend)
     try:
-        yield conn
+        yield backend
     finally:
-        conn.close()
+        _active_backend.reset(token)
+
+
+def reset_backends():
+    """Забывает основной движок; следующий запрос создаст его по текущим настройкам."""
+    global _primary_backend
+    with _primary_lock:
+        _primary_backend = None
+
+
+@contextmanager
+def get_connection():
+    with get_backend().connect() as conn:
+        yield conn
+
+
+@contextmanager
+def transaction():
+    """Открывает соединение с явной транзакцией и отдает курсор-словарь."""
+    backend = get_backend()
+    with backend.connect() as conn:
+        owner = backend.begin(conn)
+        cursor = backend.cursor(conn, dictionary=True)
+        try:
+            yield cursor
+            if owner:
+                backend.commit(conn)
+        except Exception:
+            if owner:
+                backend.rollback(conn)
+            raise
+        finally:
+            cursor.close()
+            backend.finish(conn, owner)
 
 
 def fetch_all_dicts(query: str, params: Optional[Sequence[Any]] = None) -> List[Dict[str, Any]]:
-    with get_connection() as conn:
-        cursor = conn.cursor(dictionary=True)
+    backend = get_backend()
+    with backend.connect() as conn:
+        cursor = backend.cursor(conn, dictionary=True)
         cursor.execute(query, params or ())
         rows = cursor.fetchall()
         cursor.close()
     return rows
 
 
+def fetch_columns(
+    query: str, params: Optional[Sequence[Any]] = None
+) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+    """Возвращает имена колонок и строки-кортежи без накладных расходов на словари."""
+    backend = get_backend()
+    with backend.connect() as conn:
+        cursor = backend.cursor(conn)
+        cursor.execute(query, params or ())
+        rows = cursor.fetchall()
+        columns = [desc[0] for desc in cursor.description or ()]
+        cursor.close()
+    return columns, rows
+
+
+def iter_row_chunks(
+    query: str, params: Optional[Sequence[Any]] = None, chunk_size: int = 10000, describe: bool = False
+) -> Iterator[Tuple[List[Any], List[Tuple[Any, ...]]]]:
+    """Потоково читает результат небуферизованным курсором порциями по chunk_size строк.
+
+    describe=True отдает вместо имен колонок пары (имя, код типа) из описания курсора;
+    у встроенных движков код типа — None.
+    """
+    backend = get_backend()
+    if not backend.streams_results:
+        # У встроенной базы одно соединение: результат читается целиком, чтобы не занимать его между порциями.
+        columns, rows = fetch_columns(query, params)
+        if describe:
+            columns = [(name, None) for name in columns]
+        for offset in range(0, len(rows), chunk_size):
+            yield columns, rows[offset : offset + chunk_size]
+        return
+    with backend.connect() as conn:
+        cursor = backend.cursor(conn, buffered=False)
+        try:
+            cursor.execute(query, params or ())
+            columns = [(desc[0], desc[1]) if describe else desc[0] for desc in cursor.description or ()]
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield columns, rows
+        finally:
+            backend.discard_unread(conn)
+            cursor.close()
+
+
 def fetch_one_dict(query: str, params: Optional[Sequence[Any]] = None) -> Optional[Dict[str, Any]]:
-    with get_connection() as conn:
-        cursor = conn.cursor(dictionary=True)
+    backend = get_backend()
+    with backend.connect() as conn:
+        cursor = backend.cursor(conn, dictionary=True)
         cursor.execute(query, params or ())
         row = cursor.fetchone()
         cursor.close()
     return row
 
 
+def fetch_one_prepared(query: str, params: Optional[Sequence[Any]] = None) -> Optional[Dict[str, Any]]:
+    """Выполняет запрос как серверный prepared statement и возвращает первую строку."""
+    backend = get_backend()
+    with backend.connect() as conn:
+        cursor = backend.cursor(conn, prepared=True)
+        cursor.execute(query, params or ())
+        row = cursor.fetchone()
+        columns = [desc[0] for desc in cursor.description or ()]
+        cursor.fetchall()
+        cursor.close()
+    return dict(zip(columns, row)) if row else None
+
+
+def fetch_result_sets(statements: Sequence[str], params: Optional[Sequence[Any]] = None) -> List[List[Dict[str, Any]]]:
+    """Отправляет несколько SELECT одним multi-statement запросом: один сетевой обмен."""
+    backend = get_backend()
+    with backend.connect() as conn:
+        return backend.fetch_result_sets(conn, statements, params or ())
+
+
 def execute_query(query: str, params: Optional[Sequence[Any]] = None) -> int:
-    with get_connection() as conn:
-        cursor = conn.cursor()
+    backend = get_backend()
+    with backend.connect() as conn:
+        cursor = backend.cursor(conn)
         cursor.execute(query, params or ())
         affected = cursor.rowcount
         cursor.close()
@@ -69,23 +284,18 @@ def execute_query(query: str, params: Optional[Sequence[Any]] = None) -> int:
 
 
 def call_procedure(proc_name: str, args: Optional[Sequence[Any]] = None) -> List[Dict[str, Any]]:
-    with get_connection() as conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.callproc(proc_name, args or ())
-        result_sets: List[Dict[str, Any]] = []
-        for result in cursor.stored_results():
-            result_sets.extend(result.fetchall())
-        cursor.close()
-    return result_sets
+    backend = get_backend()
+    with backend.connect() as conn:
+        return backend.call_procedure(conn, proc_name, args or ())
 
 
-def column_names(table_name: str) -> List[str]:
-    query = """
-        SELECT COLUMN_NAME
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = DATABASE()
-          AND TABLE_NAME = %s
-    """
-    rows = fetch_all_dicts(query, (table_name,))
-    return [row["COLUMN_NAME"] for row in rows]
+def ensure_index(table_name: str, index_name: str, columns: str) -> bool:
+    """Создает индекс, если его еще нет; возвращает True при создании."""
+    if get_backend().index_exists(table_name, index_name):
+        return False
+    execute_query(f"CREATE INDEX {index_name} ON {table_name} ({columns})")
+    return True
 
+
+def column_names(table_name: str) -> List[str]:
+    return get_backend().column_names(table_name)
@@ -0,0 +1,562 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import mysql.connector
+import numpy as np
+import pandas as pd
+
+
+class EmbeddedError(mysql.connector.Error):
+    """Ошибка встроенной базы; наследует ошибку MySQL, чтобы ее ловили те же обработчики."""
+
+
+# Хранимые функции MySQL подставляются в запрос как выражения: каждый аргумент
+# используется в шаблоне ровно один раз, чтобы не сбить порядок параметров.
+STORED_FUNCTIONS: Dict[str, str] = {
+    "get_recommendation_score": """(
+        SELECT COALESCE(ta_fn.overall_rating, 0) * 0.6 + COALESCE(up_fn.preference_value, 0.3) * 4
+        FROM tourism_attractions ta_fn
+        LEFT JOIN user_preferences up_fn
+            ON up_fn.user_id = {0}
+           AND up_fn.preference_type = 'category_preference'
+           AND up_fn.preference_key = ta_fn.category
+        WHERE ta_fn.place_id = {1}
+    )""",
+}
+
+
+def _find_closing(sql: str, open_index: int) -> int:
+    """Индекс закрывающей скобки с учетом вложенности и строковых литералов."""
+    depth, quote = 0, None
+    for index in range(open_index, len(sql)):
+        char = sql[index]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return index
+    raise EmbeddedError(f"Несбалансированные скобки в запросе: {sql[:80]}")
+
+
+def _split_args(text: str) -> List[str]:
+    args, depth, quote, start = [], 0, None, 0
+    for index, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            args.append(text[start:index].strip())
+            start = index + 1
+    args.append(text[start:].strip())
+    return [arg for arg in args if arg]
+
+
+def _rewrite_calls(sql: str, renderers: Dict[str, Callable[[List[str]], str]]) -> str:
+    """Заменяет вызовы функций по именам; аргументы переписываются рекурсивно."""
+    if not renderers:
+        return sql
+    pattern = re.compile(r"\b(" + "|".join(renderers) + r")\s*\(", re.IGNORECASE)
+    result, position = [], 0
+    while True:
+        match = pattern.search(sql, position)
+        if match is None:
+            break
+        open_index = match.end() - 1
+        close_index = _find_closing(sql, open_index)
+        args = [_rewrite_calls(arg, renderers) for arg in _split_args(sql[open_index + 1 : close_index])]
+        result.append(sql[position : match.start()])
+        result.append(renderers[match.group(1).lower()](args))
+        position = close_index + 1
+    result.append(sql[position:])
+    return "".join(result)
+
+
+_GROUP_CONCAT = re.compile(
+    r"^(?P<distinct>DISTINCT\s+)?(?P<expr>.+?)(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+SEPARATOR\s+(?P<sep>'[^']*'))?$",
+    re.IGNORECASE | re.DOTALL,
+)
+_INTERVAL_DAYS = re.compile(r"^INTERVAL\s+(?P<amount>.+)\s+DAY$", re.IGNORECASE | re.DOTALL)
+_ON_DUPLICATE = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.IGNORECASE)
+_VALUES_REFERENCE = re.compile(r"\bVALUES\(\s*(\w+)\s*\)", re.IGNORECASE)
+_NULL_TEST = re.compile(r"\(\s*([\w.]+)\s+IS\s+(NOT\s+)?NULL\s*\)", re.IGNORECASE)
+_TRIGGER = re.compile(r"^\s*CREATE\s+TRIGGER\b.*?\bFOR\s+EACH\s+ROW\b", re.IGNORECASE | re.DOTALL)
+
+
+class Dialect(ABC):
+    """Переписывает запросы в диалекте MySQL для встроенного движка."""
+
+    name = ""
+
+    def renderers(self) -> Dict[str, Callable[[List[str]], str]]:
+        renderers = {
+            "group_concat": self._group_concat,
+            "date_sub": self._date_sub,
+            "curdate": lambda args: self.current_date,
+        }
+        for function_name, template in STORED_FUNCTIONS.items():
+            renderers[function_name] = lambda args, template=template: template.format(*args)
+        return renderers
+
+    current_date = "CURRENT_DATE"
+
+    def _group_concat(self, args: List[str]) -> str:
+        parts = _GROUP_CONCAT.match(args[0]).groupdict()
+        return self.string_agg(parts["expr"], parts["sep"] or "','", bool(parts["distinct"]), parts["order"])
+
+    @abstractmethod
+    def string_agg(self, expr: str, separator: str, distinct: bool, order: Optional[str]) -> str:
+        ...
+
+    def _date_sub(self, args: List[str]) -> str:
+        interval = _INTERVAL_DAYS.match(args[1])
+        if interval is None:
+            raise EmbeddedError(f"Поддерживается только INTERVAL ... DAY: {args[1]}")
+        return self.subtract_days(args[0], interval.group("amount"))
+
+    @abstractmethod
+    def subtract_days(self, value: str, amount: str) -> str:
+        ...
+
+    def translate_upsert(self, sql: str) -> str:
+        match = _ON_DUPLICATE.search(sql)
+        if match is None:
+            return sql
+        head, tail = sql[: match.start()], sql[match.end() :]
+        tail = _VALUES_REFERENCE.sub(r"excluded.\1", tail)
+        return f"{head.rstrip()} ON CONFLICT DO UPDATE SET{tail}"
+
+    def translate(self, sql: str) -> Optional[str]:
+        if re.match(r"^\s*SET\s+SESSION\b", sql, re.IGNORECASE):
+            return None
+        sql = sql.replace("%s", "?")
+        sql = re.sub(r"\bINSERT\s+IGNORE\b", "INSERT OR IGNORE", sql, flags=re.IGNORECASE)
+        sql = re.sub(r"\s+FOR\s+UPDATE\b", "", sql, flags=re.IGNORECASE)
+        sql = re.sub(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP\b", "", sql, flags=re.IGNORECASE)
+        sql = re.sub(r"\bLIKE\s+\?", r"LIKE ? ESCAPE '\\'", sql, flags=re.IGNORECASE)
+        sql = self.translate_upsert(sql)
+        return _rewrite_calls(sql, self.renderers())
+
+
+class SQLiteDialect(Dialect):
+    name = "sqlite"
+    current_date = "date('now', 'localtime')"
+
+    def renderers(self):
+        renderers = super().renderers()
+        renderers.update(
+            {
+                "greatest": lambda args: f"MAX({', '.join(args)})",
+                "least": lambda args: f"MIN({', '.join(args)})",
+                "weekday": lambda args: f"((CAST(strftime('%w', {args[0]}) AS INTEGER) + 6) % 7)",
+                "dayofmonth": lambda args: f"CAST(strftime('%d', {args[0]}) AS INTEGER)",
+                "month": lambda args: f"CAST(strftime('%m', {args[0]}) AS INTEGER)",
+            }
+        )
+        return renderers
+
+    def string_agg(self, expr, separator, distinct, order):
+        # DISTINCT в SQLite допускается только без разделителя; ORDER BY внутри агрегата — с 3.44.
+        if distinct:
+            return f"GROUP_CONCAT(DISTINCT {expr})"
+        if order and sqlite3.sqlite_version_info >= (3, 44, 0):
+            return f"GROUP_CONCAT({expr}, {separator} ORDER BY {order})"
+        return f"GROUP_CONCAT({expr}, {separator})"
+
+    def subtract_days(self, value, amount):
+        return f"date({value}, '-' || ({amount}) || ' days')"
+
+    def translate_upsert(self, sql):
+        match = _ON_DUPLICATE.search(sql)
+        if match is not None and re.search(r"\bSELECT\b", sql[: match.start()], re.IGNORECASE):
+            # INSERT ... SELECT ... ON CONFLICT неоднозначен для парсера SQLite без WHERE.
+            head = sql[: match.start()]
+            if not re.search(r"\b(WHERE|GROUP\s+BY)\b", head[re.search(r"\bSELECT\b", head, re.IGNORECASE).start() :], re.IGNORECASE):
+                sql = f"{head.rstrip()} WHERE true {sql[match.start():]}"
+        return super().translate_upsert(sql)
+
+    def translate(self, sql):
+        translated = super().translate(sql)
+        if translated is None:
+            return None
+        trigger = _TRIGGER.match(translated)
+        if trigger is not None:
+            body = translated[trigger.end() :].strip().rstrip(";")
+            translated = f"{trigger.group(0)} BEGIN {body}; END"
+        return translated
+
+
+class DuckDBDialect(Dialect):
+    name = "duckdb"
+
+    def renderers(self):
+        renderers = super().renderers()
+        # weekday() в DuckDB считает от воскресенья, в MySQL — от понедельника.
+        renderers["weekday"] = lambda args: f"(isodow({args[0]}) - 1)"
+        return renderers
+
+    def string_agg(self, expr, separator, distinct, order):
+        prefix = "DISTINCT " if distinct else ""
+        suffix = f" ORDER BY {order}" if order else ""
+        return f"STRING_AGG({prefix}CAST({expr} AS VARCHAR), {separator}{suffix})"
+
+    def subtract_days(self, value, amount):
+        return f"(CAST({value} AS DATE) - CAST({amount} AS INTEGER))"
+
+    def translate(self, sql):
+        translated = super().translate(sql)
+        if translated is None or _TRIGGER.match(translated):
+            return None
+        return self._cast_summed_null_tests(translated)
+
+    @staticmethod
+    def _cast_summed_null_tests(sql: str) -> str:
+        """MySQL складывает логические значения как 0/1, DuckDB требует явного приведения."""
+
+        def replace(match):
+            before = sql[: match.start()].rstrip()[-1:]
+            after = sql[match.end() :].lstrip()[:1]
+            if "+" not in (before, after):
+                return match.group(0)
+            return f"CAST({match.group(1)} IS {match.group(2) or ''}NULL AS INTEGER)"
+
+        return _NULL_TEST.sub(replace, sql)
+
+
+@lru_cache(maxsize=1024)
+def _translate_cached(dialect_name: str, sql: str) -> Optional[str]:
+    return _DIALECTS[dialect_name].translate(sql)
+
+
+_DIALECTS = {"sqlite": SQLiteDialect(), "duckdb": DuckDBDialect()}
+
+
+def translate(dialect_name: str, sql: str) -> Optional[str]:
+    """Запрос в диалекте движка; None — оператор не нужен (SET SESSION, триггер в DuckDB)."""
+    return _translate_cached(dialect_name, sql)
+
+
+def _parse_temporal(value: bytes):
+    text = value.decode("utf-8")
+    return datetime.fromisoformat(text) if len(text) > 10 else date.fromisoformat(text)
+
+
+def _parse_date(value: bytes) -> date:
+    parsed = _parse_temporal(value)
+    return parsed.date() if isinstance(parsed, datetime) else parsed
+
+
+def _parse_datetime(value: bytes) -> datetime:
+    parsed = _parse_temporal(value)
+    return parsed if isinstance(parsed, datetime) else datetime.combine(parsed, datetime.min.time())
+
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(pd.Timestamp, lambda value: value.isoformat(" "))
+for _numpy_type in (np.int64, np.int32, np.float64, np.float32, np.bool_):
+    sqlite3.register_adapter(_numpy_type, lambda value: value.item())
+sqlite3.register_converter("DATE", _parse_date)
+sqlite3.register_converter("DATETIME", _parse_datetime)
+sqlite3.register_converter("TIMESTAMP", _parse_datetime)
+
+
+class EmbeddedCursor:
+    """Курсор с интерфейсом mysql-connector поверх SQLite/DuckDB: перевод диалекта и строки-словари."""
+
+    def __init__(self, backend: "EmbeddedBackend", raw, dictionary: bool):
+        self._backend = backend
+        self._raw = raw
+        self._dictionary = dictionary
+        self._has_result = False
+        self.rowcount = -1
+
+    def _run(self, method: str, query: str, params) -> None:
+        sql = translate(self._backend.dialect, query)
+        if sql is None:
+            self._has_result = False
+            return
+        try:
+            getattr(self._raw, method)(sql, params)
+        except self._backend.driver_errors as exc:
+            raise EmbeddedError(str(exc)) from exc
+        self._has_result = bool(self._raw.description)
+        self.rowcount = self._backend.rowcount(self._raw)
+
+    def execute(self, query: str, params: Optional[Sequence[Any]] = None):
+        self._run("execute", query, tuple(params or ()))
+
+    def executemany(self, query: str, seq_params: Iterable[Sequence[Any]]):
+        rows = [tuple(params) for params in seq_params]
+        if rows:
+            self._run("executemany", query, rows)
+
+    @property
+    def description(self):
+        return self._raw.description if self._has_result else None
+
+    def _convert(self, rows: List[tuple]) -> List[Any]:
+        if not self._dictionary:
+            return [tuple(row) for row in rows]
+        columns = [column[0] for column in self._raw.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def fetchall(self) -> List[Any]:
+        return self._convert(self._raw.fetchall()) if self._has_result else []
+
+    def fetchmany(self, size: int) -> List[Any]:
+        return self._convert(self._raw.fetchmany(size)) if self._has_result else []
+
+    def fetchone(self):
+        if not self._has_result:
+            return None
+        row = self._raw.fetchone()
+        return None if row is None else self._convert([row])[0]
+
+    def close(self):
+        if self._raw is not self._backend.shared_connection:
+            self._raw.close()
+
+
+class EmbeddedBackend(ABC):
+    """Встроенная база в одном файле (или в памяти).
+
+    Одно соединение на процесс, доступ к нему сериализуется реентерабельной
+    блокировкой: вложенные вызовы из того же потока работают в его транзакции.
+    """
+
+    dialect = ""
+    driver_errors: Tuple[type, ...] = ()
+    streams_results = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ready = False
+        self.shared_connection = None
+        self._lock = threading.RLock()
+
+    @abstractmethod
+    def _open(self):
+        ...
+
+    @contextmanager
+    def connect(self) -> Iterator[Any]:
+        with self._lock:
+            if self.shared_connection is None:
+                self.shared_connection = self._open()
+            yield self.shared_connection
+
+    def cursor(self, conn, dictionary: bool = False, prepared: bool = False, buffered: Optional[bool] = None):
+        return EmbeddedCursor(self, self._raw_cursor(conn), dictionary)
+
+    def _raw_cursor(self, conn):
+        return conn.cursor()
+
+    @staticmethod
+    def rowcount(raw) -> int:
+        return getattr(raw, "rowcount", -1)
+
+    @abstractmethod
+    def in_transaction(self, conn) -> bool:
+        ...
+
+    def begin(self, conn) -> bool:
+        if self.in_transaction(conn):
+            return False
+        conn.execute("BEGIN")
+        return True
+
+    def commit(self, conn):
+        conn.execute("COMMIT")
+
+    def rollback(self, conn):
+        conn.execute("ROLLBACK")
+
+    def finish(self, conn, owner: bool):
+        return None
+
+    def discard_unread(self, conn):
+        return None
+
+    def fetch_result_sets(self, conn, statements: Sequence[str], params: Sequence[Any]) -> List[List[Dict[str, Any]]]:
+        """Выполняет запросы по очереди: у встроенной базы нет сетевых обменов, которые стоит экономить."""
+        results, offset = [], 0
+        cursor = self.cursor(conn, dictionary=True)
+        try:
+            for statement in statements:
+                count = statement.count("%s")
+                cursor.execute(statement, tuple(params[offset : offset + count]))
+                offset += count
+                results.append(cursor.fetchall())
+        finally:
+            cursor.close()
+        return results
+
+    def call_procedure(self, conn, proc_name: str, args: Sequence[Any]):
+        raise EmbeddedError(f"Хранимые процедуры не поддерживаются встроенной базой: {proc_name}")
+
+    @abstractmethod
+    def index_exists(self, table_name: str, index_name: str) -> bool:
+        ...
+
+    @abstractmethod
+    def column_names(self, table_name: str) -> List[str]:
+        ...
+
+    def has_table(self, table_name: str) -> bool:
+        return bool(self.column_names(table_name))
+
+    def replace_table(self, table_name: str, columns: Sequence[str], chunks: Iterable[pd.DataFrame]) -> int:
+        """Загружает таблицу целиком во временную и подменяет ею старую одной транзакцией."""
+        staging = f"{table_name}__staging"
+        loaded = 0
+        with self.connect() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {staging}")
+        for chunk in chunks:
+            with self.connect() as conn:
+                self._append_frame(conn, staging, chunk, create=loaded == 0)
+            loaded += len(chunk)
+        with self.connect() as conn:
+            if loaded == 0:
+                self._append_frame(conn, staging, pd.DataFrame(columns=list(columns)), create=True)
+            self.begin(conn)
+            try:
+                conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+                conn.execute(f"ALTER TABLE {staging} RENAME TO {table_name}")
+                self.commit(conn)
+            except Exception:
+                self.rollback(conn)
+                raise
+        return loaded
+
+    @abstractmethod
+    def _append_frame(self, conn, table_name: str, frame: pd.DataFrame, create: bool):
+        ...
+
+
+class SQLiteBackend(EmbeddedBackend):
+    dialect = "sqlite"
+    driver_errors = (sqlite3.Error,)
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+        )
+        conn.execute("PRAGMA journal_mode = WAL" if self.path != ":memory:" else "PRAGMA journal_mode = MEMORY")
+        return conn
+
+    def in_transaction(self, conn) -> bool:
+        return conn.in_transaction
+
+    def index_exists(self, table_name, index_name):
+        with self.connect() as conn:
+            rows = conn.execute(f"PRAGMA index_list({table_name})").fetchall()
+        return any(row[1] == index_name for row in rows)
+
+    def column_names(self, table_name):
+        with self.connect() as conn:
+            rows = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+        return [row[1] for row in rows]
+
+    def _append_frame(self, conn, table_name, frame, create):
+        frame.to_sql(table_name, conn, if_exists="replace" if create else "append", index=False)
+
+
+class DuckDBBackend(EmbeddedBackend):
+    """Колоночный движок для аналитики только на чтение; DuckDB — необязательная зависимость."""
+
+    dialect = "duckdb"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        try:
+            import duckdb
+        except ImportError as exc:
+            raise EmbeddedError("Для аналитики на DuckDB установите пакет duckdb") from exc
+        self._duckdb = duckdb
+        self.driver_errors = (duckdb.Error,)
+        # У соединения DuckDB нет признака открытой транзакции: состояние ведется здесь.
+        self._transaction_open = False
+
+    def _open(self):
+        return self._duckdb.connect(self.path)
+
+    def _raw_cursor(self, conn):
+        return conn
+
+    @staticmethod
+    def rowcount(raw) -> int:
+        return -1
+
+    def in_transaction(self, conn) -> bool:
+        return self._transaction_open
+
+    def begin(self, conn) -> bool:
+        owner = super().begin(conn)
+        if owner:
+            self._transaction_open = True
+        return owner
+
+    def commit(self, conn):
+        try:
+            super().commit(conn)
+        finally:
+            self._transaction_open = False
+
+    def rollback(self, conn):
+        try:
+            super().rollback(conn)
+        finally:
+            self._transaction_open = False
+
+    def index_exists(self, table_name, index_name):
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT 1 FROM duckdb_indexes() WHERE table_name = ? AND index_name = ?",
+                (table_name, index_name),
+            ).fetchall()
+        return bool(rows)
+
+    def column_names(self, table_name):
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = ? ORDER BY ordinal_position",
+                (table_name,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _append_frame(self, conn, table_name, frame, create):
+        conn.register("_mirror_chunk", frame)
+        try:
+            if create:
+                conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM _mirror_chunk")
+            else:
+                conn.execute(f"INSERT INTO {table_name} SELECT * FROM _mirror_chunk")
+        finally:
+            conn.unregister("_mirror_chunk")
+
+
+EMBEDDED_BACKENDS = {"sqlite": SQLiteBackend, "duckdb": DuckDBBackend}
@@ -4,17 +4,12 @@ from typing import List, Tuple
 
 import pandas as pd
 
-from db import column_names, execute_query, fetch_all_dicts
-
-BLOCK_COLUMN_CANDIDATES = ("is_blocked", "blocked")
+from db import execute_query, fetch_all_dicts
+from services.credentials import get_credential_schema, invalidate_user_credentials
 
 
 def _resolve_block_column() -> str | None:
-    cols = column_names("users_credentials")
-    for candidate in BLOCK_COLUMN_CANDIDATES:
-        if candidate in cols:
-            return candidate
-    return None
+    return get_credential_schema().block_column
 
 
 def get_credentials_overview() -> Tuple[pd.DataFrame, bool]:
@@ -37,6 +32,4 @@ def set_user_block_status(user_id: int, blocked: bool):
         f"UPDATE users_credentials SET {block_col} = %s WHERE user_id = %s",
         (1 if blocked else 0, user_id),
     )
-
-
-
+    invalidate_user_credentials(user_id)
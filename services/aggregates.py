@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Optional
+
+import pandas as pd
+
+from db import ensure_index, execute_query, fetch_one_dict, transaction
+from services.job_status import job_status
+
+
+AGGREGATE_DIMENSIONS = {
+    "agg_place_ratings": ("place_id", "INT NOT NULL"),
+    "agg_city_ratings": ("city", "VARCHAR(255) NOT NULL"),
+    "agg_category_ratings": ("category", "VARCHAR(255) NOT NULL"),
+    "agg_user_ratings": ("user_id", "INT NOT NULL"),
+}
+
+_RECONCILE_SOURCES = {
+    "agg_place_ratings": ("r.place_id", "ratings r"),
+    "agg_city_ratings": (
+        "ta.city",
+        "ratings r JOIN tourism_attractions ta ON ta.place_id = r.place_id WHERE ta.city IS NOT NULL",
+    ),
+    "agg_category_ratings": (
+        "ta.category",
+        "ratings r JOIN tourism_attractions ta ON ta.place_id = r.place_id WHERE ta.category IS NOT NULL",
+    ),
+    "agg_user_ratings": ("u.user_id", "users u LEFT JOIN ratings r ON r.user_id = u.user_id"),
+}
+
+_UPSERT_TAIL = """
+    ON DUPLICATE KEY UPDATE
+        rating_count = rating_count + VALUES(rating_count),
+        rating_sum = rating_sum + VALUES(rating_sum),
+        rating_sumsq = rating_sumsq + VALUES(rating_sumsq),
+        last_rated_at = GREATEST(
+            COALESCE(last_rated_at, VALUES(last_rated_at)),
+            COALESCE(VALUES(last_rated_at), last_rated_at)
+        )
+"""
+
+# Пересчет last_rated_at по ratings для одного ключа; нужен, когда удаляется или сдвигается
+# назад самая поздняя оценка ключа — инкрементальный GREATEST умеет только увеличивать.
+_LAST_RATED_AT_SOURCES = {
+    "agg_place_ratings": "SELECT MAX(r.rated_at) FROM ratings r WHERE r.place_id = %s",
+    "agg_user_ratings": "SELECT MAX(r.rated_at) FROM ratings r WHERE r.user_id = %s",
+    "agg_city_ratings": (
+        "SELECT MAX(r.rated_at) FROM ratings r "
+        "JOIN tourism_attractions ta ON ta.place_id = r.place_id WHERE ta.city = %s"
+    ),
+    "agg_category_ratings": (
+        "SELECT MAX(r.rated_at) FROM ratings r "
+        "JOIN tourism_attractions ta ON ta.place_id = r.place_id WHERE ta.category = %s"
+    ),
+}
+
+reconcile_status = job_status("aggregates_reconcile")
+
+_ready = False
+_ready_lock = threading.Lock()
+_reconcile_thread: Optional[threading.Thread] = None
+_fill_thread: Optional[threading.Thread] = None
+
+
+def ensure_aggregate_tables():
+    """Создает таблицы агрегатов; первичное заполнение уходит в фоновый поток."""
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        for table, (key_column, key_type) in AGGREGATE_DIMENSIONS.items():
+            execute_query(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    {key_column} {key_type} PRIMARY KEY,
+                    rating_count INT NOT NULL DEFAULT 0,
+                    rating_sum DOUBLE NOT NULL DEFAULT 0,
+                    rating_sumsq DOUBLE NOT NULL DEFAULT 0,
+                    last_rated_at DATETIME NULL
+                )
+                """
+            )
+        ensure_index("agg_user_ratings", "idx_agg_user_ratings_keyset", "rating_count, user_id")
+        ensure_index("users", "idx_users_location", "location")
+        _ensure_user_rows()
+        if _needs_initial_fill():
+            _start_initial_fill()
+        _ready = True
+
+
+def _ensure_user_rows():
+    """Пользователь получает нулевую строку агрегата при создании, в том числе вне приложения.
+
+    Иначе пейджер пользователей, идущий по agg_user_ratings, не видит его до сверки.
+    """
+    execute_query(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_users_agg_insert
+        AFTER INSERT ON users
+        FOR EACH ROW
+        INSERT IGNORE INTO agg_user_ratings (user_id) VALUES (NEW.user_id)
+        """
+    )
+    execute_query(
+        """
+        INSERT IGNORE INTO agg_user_ratings (user_id)
+        SELECT u.user_id
+        FROM users u
+        LEFT JOIN agg_user_ratings a ON a.user_id = u.user_id
+        WHERE a.user_id IS NULL
+        """
+    )
+
+
+def _needs_initial_fill() -> bool:
+    row = fetch_one_dict(
+        """
+        SELECT
+            EXISTS(SELECT 1 FROM agg_place_ratings) AS filled,
+            EXISTS(SELECT 1 FROM ratings) AS has_ratings
+        """
+    )
+    return bool(row and not row["filled"] and row["has_ratings"])
+
+
+def _run_reconcile():
+    try:
+        reconcile_aggregates()
+    except Exception as exc:
+        reconcile_status.record_error(exc)
+        return
+    reconcile_status.record_success()
+
+
+def _start_initial_fill():
+    global _fill_thread
+    if _fill_thread is not None and _fill_thread.is_alive():
+        return
+    _fill_thread = threading.Thread(target=_run_reconcile, name="aggregates-initial-fill", daemon=True)
+    _fill_thread.start()
+
+
+def _to_float(value: Any) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def apply_rating_delta(
+    cursor,
+    user_id: int,
+    place_id: int,
+    old_rating: Any,
+    new_rating: Any,
+    rated_at: Optional[date | datetime] = None,
+    old_rated_at: Optional[date | datetime] = None,
+):
+    """Применяет изменение одной оценки ко всем агрегатам внутри текущей транзакции.
+
+    old_rating=None означает вставку новой оценки, new_rating=None — удаление.
+    old_rated_at — прежняя дата оценки: по ней решается, нужно ли пересчитать last_rated_at.
+    """
+    old_value = _to_float(old_rating)
+    new_value = _to_float(new_rating)
+    count_delta = (new_value is not None) - (old_value is not None)
+    sum_delta = (new_value or 0.0) - (old_value or 0.0)
+    sumsq_delta = (new_value or 0.0) ** 2 - (old_value or 0.0) ** 2
+    if not count_delta and not sum_delta and rated_at is None:
+        return
+    deltas = (count_delta, sum_delta, sumsq_delta, rated_at)
+
+    cursor.execute(
+        "INSERT INTO agg_place_ratings (place_id, rating_count, rating_sum, rating_sumsq, last_rated_at) "
+        "VALUES (%s, %s, %s, %s, %s)" + _UPSERT_TAIL,
+        (place_id, *deltas),
+    )
+    cursor.execute(
+        "INSERT INTO agg_user_ratings (user_id, rating_count, rating_sum, rating_sumsq, last_rated_at) "
+        "VALUES (%s, %s, %s, %s, %s)" + _UPSERT_TAIL,
+        (user_id, *deltas),
+    )
+    for table, column in (("agg_city_ratings", "city"), ("agg_category_ratings", "category")):
+        cursor.execute(
+            f"INSERT INTO {table} ({column}, rating_count, rating_sum, rating_sumsq, last_rated_at) "
+            f"SELECT ta.{column}, %s, %s, %s, %s FROM tourism_attractions ta "
+            f"WHERE ta.place_id = %s AND ta.{column} IS NOT NULL" + _UPSERT_TAIL,
+            (*deltas, place_id),
+        )
+    if _moves_back(old_value, new_value, old_rated_at, rated_at):
+        cursor.execute("SELECT city, category FROM tourism_attractions WHERE place_id = %s", (place_id,))
+        place = cursor.fetchone() or {}
+        _lower_last_rated_at(
+            cursor,
+            {
+                "agg_place_ratings": [(place_id, old_rated_at)],
+                "agg_user_ratings": [(user_id, old_rated_at)],
+                "agg_city_ratings": [(place.get("city"), old_rated_at)],
+                "agg_category_ratings": [(place.get("category"), old_rated_at)],
+            },
+        )
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(value, datetime.min.time())
+
+
+def _moves_back(old_value, new_value, old_rated_at, rated_at) -> bool:
+    """Оценка с датой old_rated_at удалена или перенесена на более раннюю дату."""
+    if old_value is None or _as_datetime(old_rated_at) is None:
+        return False
+    new_at = _as_datetime(rated_at)
+    return new_value is None or (new_at is not None and new_at < _as_datetime(old_rated_at))
+
+
+def _lower_last_rated_at(cursor, keys_by_table):
+    """Пересчитывает last_rated_at по ratings только там, где ушедшая оценка могла быть самой поздней."""
+    for table, keys in keys_by_table.items():
+        key_column = AGGREGATE_DIMENSIONS[table][0]
+        rows = [
+            (key, key, _as_datetime(old_rated_at))
+            for key, old_rated_at in keys
+            if key is not None and _as_datetime(old_rated_at) is not None
+        ]
+        if rows:
+            cursor.executemany(
+                f"UPDATE {table} SET last_rated_at = ({_LAST_RATED_AT_SOURCES[table]}) "
+                f"WHERE {key_column} = %s AND last_rated_at <= %s",
+                rows,
+            )
+
+
+def apply_rating_deltas(cursor, changes: pd.DataFrame):
+    """Пакетный вариант apply_rating_delta: дельты группируются по ключам агрегатов.
+
+    Колонки changes: user_id, place_id, city, category, old_rating, new_rating, rated_at
+    и необязательная old_rated_at.
+    """
+    if changes.empty:
+        return
+    old_values = pd.to_numeric(changes["old_rating"], errors="coerce")
+    new_values = pd.to_numeric(changes["new_rating"], errors="coerce")
+    deltas = pd.DataFrame(
+        {
+            "count_delta": new_values.notna().astype(int) - old_values.notna().astype(int),
+            "sum_delta": new_values.fillna(0.0) - old_values.fillna(0.0),
+            "sumsq_delta": new_values.fillna(0.0) ** 2 - old_values.fillna(0.0) ** 2,
+            "rated_at": pd.to_datetime(changes["rated_at"], errors="coerce"),
+        }
+    )
+    for table, (key_column, _) in AGGREGATE_DIMENSIONS.items():
+        keyed = deltas.assign(key=changes[key_column].to_numpy()).dropna(subset=["key"])
+        grouped = keyed.groupby("key", sort=False).agg(
+            count_delta=("count_delta", "sum"),
+            sum_delta=("sum_delta", "sum"),
+            sumsq_delta=("sumsq_delta", "sum"),
+            rated_at=("rated_at", "max"),
+        )
+        rows = [
+            (
+                key.item() if hasattr(key, "item") else key,
+                int(count),
+                float(total),
+                float(total_sq),
+                None if pd.isna(rated_at) else rated_at.to_pydatetime(),
+            )
+            for key, count, total, total_sq, rated_at in grouped.itertuples(name=None)
+        ]
+        cursor.executemany(
+            f"INSERT INTO {table} ({key_column}, rating_count, rating_sum, rating_sumsq, last_rated_at) "
+            "VALUES (%s, %s, %s, %s, %s)" + _UPSERT_TAIL,
+            rows,
+        )
+    if "old_rated_at" not in changes:
+        return
+    old_rated_at = pd.to_datetime(changes["old_rated_at"], errors="coerce")
+    new_rated_at = deltas["rated_at"]
+    moved_back = old_values.notna() & old_rated_at.notna() & (
+        new_values.isna() | (new_rated_at.notna() & (new_rated_at < old_rated_at))
+    )
+    if not moved_back.any():
+        return
+    moved = changes[moved_back].assign(old_rated_at=old_rated_at[moved_back])
+    keys_by_table = {}
+    for table, (key_column, _) in AGGREGATE_DIMENSIONS.items():
+        latest = moved.dropna(subset=[key_column]).groupby(key_column)["old_rated_at"].max()
+        keys_by_table[table] = [
+            (key.item() if hasattr(key, "item") else key, value) for key, value in latest.items()
+        ]
+    _lower_last_rated_at(cursor, keys_by_table)
+
+
+def reconcile_aggregates():
+    """Полностью пересчитывает агрегаты по таблице ratings, устраняя накопленный дрейф."""
+    with transaction() as cursor:
+        for table, (key_column, _) in AGGREGATE_DIMENSIONS.items():
+            source_key, source = _RECONCILE_SOURCES[table]
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(
+                f"""
+                INSERT INTO {table} ({key_column}, rating_count, rating_sum, rating_sumsq, last_rated_at)
+                SELECT
+                    {source_key},
+                    COUNT(r.rating),
+                    COALESCE(SUM(r.rating), 0),
+                    COALESCE(SUM(r.rating * r.rating), 0),
+                    MAX(r.rated_at)
+                FROM {source}
+                GROUP BY {source_key}
+                """
+            )
+
+
+def _reconcile_loop(interval_seconds: int):
+    while True:
+        time.sleep(interval_seconds)
+        _run_reconcile()
+
+
+def start_reconcile_job(interval_seconds: int) -> bool:
+    """Запускает фоновую сверку агрегатов; повторный вызов не создает второй поток."""
+    global _reconcile_thread
+    if interval_seconds <= 0:
+        return False
+    if _reconcile_thread is not None and _reconcile_thread.is_alive():
+        return False
+    _reconcile_thread = threading.Thread(
+        target=_reconcile_loop,
+        args=(interval_seconds,),
+        name="aggregates-reconcile",
+        daemon=True,
+    )
+    _reconcile_thread.start()
+    return True
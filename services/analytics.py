@@ -1,22 +1,109 @@
 from __future__ import annotations
 
+import math
+from datetime import date
+from typing import Optional, Tuple
+
 import pandas as pd
 
-from db import fetch_all_dicts, fetch_one_dict
+from config import get_settings
+from db import fetch_all_dicts
+from services.aggregates import ensure_aggregate_tables
+from services.analytics_bundle import (
+    AnalyticsBundle,
+    build_analytics_bundle,
+    compute_trend,
+)
+from services.analytics_mirror import mirror_mode, reads_from_mirror
+from services.cache import analytics_cache, shared_cache
+from services.cohorts import get_cohort_retention as _read_cohort_retention
+from services.columnar_store import (
+    build_snapshot_bundle,
+    load_snapshot_ratings,
+    snapshot_version,
+)
+from services.counters import get_counts
+from services.rollups import read_rollups
+from services.sketches import load_merged_sketches
+
+
+TABLE_CACHE_DEPENDENCIES = {
+    "ratings": (
+        "analytics_bundle",
+        "popular_places",
+        "ratings_by_category",
+        "ratings_by_city",
+    ),
+    "users": ("analytics_bundle",),
+    "tourism_attractions": (
+        "analytics_bundle",
+        "popular_places",
+        "city_demand",
+        "category_satisfaction",
+        "price_segments",
+        "ratings_by_category",
+        "ratings_by_city",
+    ),
+    "tourism_packages": ("package_coverage",),
+}
+
+
+# Запросы, которые при ANALYTICS_SOURCE=embedded читают встроенную копию.
+MIRRORED_CACHE_NAMES = {
+    "analytics_bundle",
+    "city_demand",
+    "category_satisfaction",
+    "price_segments",
+    "package_coverage",
+}
+
+
+def invalidate_for_tables(tables, mirror_refreshed: bool = False) -> None:
+    """Помечает устаревшими только запросы аналитики, читающие измененные таблицы.
+
+    Прежний результат отдается, пока в фоне считается новый (stale-while-revalidate).
+    В режиме встроенной копии запросы к ней обновляются только после ее перезаливки
+    (mirror_refreshed=True): запись в рабочую базу их результат не меняет.
+    """
+    names = {name for table in tables for name in TABLE_CACHE_DEPENDENCIES.get(table, ())}
+    if mirror_mode():
+        names = {name for name in names if (name in MIRRORED_CACHE_NAMES) == mirror_refreshed}
+    if names:
+        analytics_cache.mark_stale_names(*names)
+
+
+def _snapshot_mode() -> bool:
+    return get_settings().analytics_source == "snapshot"
+
+
+def _snapshot_bundle() -> AnalyticsBundle:
+    return analytics_cache.get_or_load(
+        ("snapshot_bundle", snapshot_version()), build_snapshot_bundle, ttl=3600
+    )
+
+
+def get_analytics_bundle() -> AnalyticsBundle:
+    """Снимок аналитики для дашборда: из MySQL, локального колоночного снимка или встроенной копии."""
+    if _snapshot_mode():
+        return _snapshot_bundle()
+    return analytics_cache.get_or_load("analytics_bundle", reads_from_mirror(build_analytics_bundle), ttl=300)
 
 
+@shared_cache("popular_places", ttl=300)
 def get_popular_places(limit: int = 10) -> pd.DataFrame:
+    if _snapshot_mode():
+        return _snapshot_bundle().popular_places.head(limit)
+    ensure_aggregate_tables()
     rows = fetch_all_dicts(
         """
         SELECT
             ta.place_name,
             ta.city,
-            COUNT(r.rating) AS rating_count,
-            AVG(r.rating) AS avg_user_rating,
+            COALESCE(a.rating_count, 0) AS rating_count,
+            a.rating_sum / NULLIF(a.rating_count, 0) AS avg_user_rating,
             ta.overall_rating
         FROM tourism_attractions ta
-        LEFT JOIN ratings r ON r.place_id = ta.place_id
-        GROUP BY ta.place_id
+        LEFT JOIN agg_place_ratings a ON a.place_id = ta.place_id
         ORDER BY rating_count DESC, avg_user_rating DESC
         LIMIT %s
         """,
@@ -25,6 +112,8 @@ def get_popular_places(limit: int = 10) -> pd.DataFrame:
     return pd.DataFrame(rows)
 
 
+@shared_cache("city_demand", ttl=1800)
+@reads_from_mirror
 def get_city_demand() -> pd.DataFrame:
     rows = fetch_all_dicts(
         """
@@ -37,6 +126,8 @@ def get_city_demand() -> pd.DataFrame:
     return pd.DataFrame(rows)
 
 
+@shared_cache("category_satisfaction", ttl=1800)
+@reads_from_mirror
 def get_category_satisfaction() -> pd.DataFrame:
     rows = fetch_all_dicts(
         """
@@ -49,6 +140,8 @@ def get_category_satisfaction() -> pd.DataFrame:
     return pd.DataFrame(rows)
 
 
+@shared_cache("price_segments", ttl=1800)
+@reads_from_mirror
 def get_price_segments() -> pd.DataFrame:
     rows = fetch_all_dicts(
         """
@@ -69,61 +162,139 @@ def get_price_segments() -> pd.DataFrame:
     return pd.DataFrame(rows)
 
 
+@shared_cache("ratings_timeline", ttl=600)
 def get_ratings_timeline(limit: int = 30) -> pd.DataFrame:
-    rows = fetch_all_dicts(
-        """
-        SELECT
-            DATE(rated_at) AS rated_date,
-            AVG(rating) AS avg_rating,
-            COUNT(*) AS rating_count
-        FROM ratings
-        WHERE rated_at IS NOT NULL
-        GROUP BY rated_date
-        ORDER BY rated_date DESC
-        LIMIT %s
-        """,
-        (limit,),
-    )
+    if _snapshot_mode():
+        return _snapshot_bundle().ratings_timeline.tail(limit).reset_index(drop=True)
+    return read_rollups("day", limit=limit)
+
+
+@shared_cache("rating_trend", ttl=600)
+def get_rating_trend(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: str = "day",
+) -> pd.DataFrame:
+    """Динамика оценок за произвольный период по бакетам дня, недели или месяца."""
+    if _snapshot_mode():
+        frame = load_snapshot_ratings(
+            start_month=start.strftime("%Y-%m") if start else None,
+            end_month=end.strftime("%Y-%m") if end else None,
+        )
+        return compute_trend(frame, granularity, start=start, end=end)
+    return read_rollups(granularity, start=start, end=end)
+
+
+@shared_cache("distinct_active_users", ttl=600)
+def get_distinct_active_users(
+    dimension: str = "city",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> pd.DataFrame:
+    """Уникальные активные пользователи по HyperLogLog: ошибка ±3.3% с вероятностью 95%."""
+    rows = []
+    for key, (rating_count, users_hll, _) in load_merged_sketches(dimension, start, end).items():
+        estimate = users_hll.estimate()
+        rows.append(
+            {
+                dimension: key,
+                "rating_count": rating_count,
+                "distinct_users": int(round(estimate)),
+                "error_margin": int(math.ceil(estimate * 2 * users_hll.relative_error)),
+            }
+        )
+    df = pd.DataFrame(rows)
+    if not df.empty:
+        df.sort_values("distinct_users", ascending=False, inplace=True, ignore_index=True)
+    return df
+
+
+@shared_cache("rating_quantiles", ttl=600)
+def get_rating_quantiles(
+    dimension: str = "city",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> pd.DataFrame:
+    """Медиана и p90 оценок по KLL-скетчам: ошибка по рангу не более ~1%."""
+    rows = []
+    for key, (rating_count, _, ratings_kll) in load_merged_sketches(dimension, start, end).items():
+        median, p90 = ratings_kll.quantiles([0.5, 0.9])
+        rows.append(
+            {
+                dimension: key,
+                "rating_count": rating_count,
+                "median_rating": median,
+                "p90_rating": p90,
+                "rank_error": round(ratings_kll.rank_error, 4),
+            }
+        )
     df = pd.DataFrame(rows)
     if not df.empty:
-        df.sort_values("rated_date", inplace=True)
+        df.sort_values("rating_count", ascending=False, inplace=True, ignore_index=True)
     return df
 
 
+@shared_cache("cohort_retention", ttl=1800)
+def get_cohort_retention(max_months: int = 12) -> pd.DataFrame:
+    return _read_cohort_retention(max_months)
+
+
 def get_entity_counts() -> dict:
-    row = fetch_one_dict(
-        """
-        SELECT
-            (SELECT COUNT(*) FROM users) AS users_count,
-            (SELECT COUNT(*) FROM tourism_attractions) AS attractions_count,
-            (SELECT COUNT(*) FROM tourism_packages) AS packages_count,
-            (SELECT COUNT(*) FROM ratings) AS ratings_count
-        """
-    )
-    return row or {}
+    return get_counts()
+
 
+def get_users_page(
+    search: Optional[str] = None,
+    after: Optional[Tuple[int, int]] = None,
+    limit: int = 50,
+) -> Tuple[pd.DataFrame, Optional[Tuple[int, int]]]:
+    """Страница пользователей по (rating_count, user_id) по убыванию с фильтром в SQL.
 
-def get_users_overview(limit: int = 100) -> pd.DataFrame:
+    after — курсор последней строки предыдущей страницы. Поиск: число сравнивается с ID,
+    строка — с началом локации. Возвращает страницу и курсор следующей (или None).
+    """
+    ensure_aggregate_tables()
+    filters = []
+    params: list = []
+    term = (search or "").strip()
+    if term:
+        if term.isdigit():
+            filters.append("(a.user_id = %s OR u.location LIKE %s)")
+            params.extend([int(term), f"{term}%"])
+        else:
+            filters.append("u.location LIKE %s")
+            params.append(term.replace("%", r"\%").replace("_", r"\_") + "%")
+    if after is not None:
+        filters.append("(a.rating_count < %s OR (a.rating_count = %s AND a.user_id < %s))")
+        params.extend([after[0], after[0], after[1]])
+    where_clause = "WHERE " + " AND ".join(filters) if filters else ""
     rows = fetch_all_dicts(
-        """
+        f"""
         SELECT
-            u.user_id,
+            a.user_id,
             u.location,
             u.age,
-            COUNT(r.rating) AS rating_count,
-            AVG(r.rating) AS avg_user_rating
-        FROM users u
-        LEFT JOIN ratings r ON r.user_id = u.user_id
-        GROUP BY u.user_id, u.location, u.age
-        ORDER BY rating_count DESC
+            a.rating_count,
+            a.rating_sum / NULLIF(a.rating_count, 0) AS avg_user_rating
+        FROM agg_user_ratings a
+        JOIN users u ON u.user_id = a.user_id
+        {where_clause}
+        ORDER BY a.rating_count DESC, a.user_id DESC
         LIMIT %s
         """,
-        (limit,),
+        tuple(params + [limit + 1]),
     )
-    return pd.DataFrame(rows)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]["rating_count"], rows[-1]["user_id"])
+    return pd.DataFrame(rows), next_cursor
 
 
+@reads_from_mirror
 def get_recent_ratings(limit: int = 50) -> pd.DataFrame:
+    if _snapshot_mode():
+        return _snapshot_bundle().recent_ratings.head(limit)
     rows = fetch_all_dicts(
         """
         SELECT
@@ -145,32 +316,38 @@ def get_recent_ratings(limit: int = 50) -> pd.DataFrame:
     return pd.DataFrame(rows)
 
 
+@shared_cache("ratings_by_category", ttl=300)
 def get_ratings_by_category() -> pd.DataFrame:
+    if _snapshot_mode():
+        return _snapshot_bundle().ratings_by_category
+    ensure_aggregate_tables()
     rows = fetch_all_dicts(
         """
         SELECT
-            ta.category,
-            COUNT(*) AS rating_count,
-            AVG(r.rating) AS avg_user_rating
-        FROM ratings r
-        JOIN tourism_attractions ta ON ta.place_id = r.place_id
-        GROUP BY ta.category
+            category,
+            rating_count,
+            rating_sum / rating_count AS avg_user_rating
+        FROM agg_category_ratings
+        WHERE rating_count > 0
         ORDER BY rating_count DESC
         """
     )
     return pd.DataFrame(rows)
 
 
+@shared_cache("ratings_by_city", ttl=300)
 def get_ratings_by_city() -> pd.DataFrame:
+    if _snapshot_mode():
+        return _snapshot_bundle().ratings_by_city
+    ensure_aggregate_tables()
     rows = fetch_all_dicts(
         """
         SELECT
-            ta.city,
-            COUNT(*) AS rating_count,
-            AVG(r.rating) AS avg_user_rating
-        FROM ratings r
-        JOIN tourism_attractions ta ON ta.place_id = r.place_id
-        GROUP BY ta.city
+            city,
+            rating_count,
+            rating_sum / rating_count AS avg_user_rating
+        FROM agg_city_ratings
+        WHERE rating_count > 0
         ORDER BY rating_count DESC
         """
     )
@@ -178,16 +355,18 @@ def get_ratings_by_city() -> pd.DataFrame:
 
 
 def get_user_activity(limit: int = 20) -> pd.DataFrame:
+    if _snapshot_mode():
+        return _snapshot_bundle().user_activity.head(limit)
+    ensure_aggregate_tables()
     rows = fetch_all_dicts(
         """
         SELECT
             u.user_id,
             u.location,
-            COUNT(r.rating) AS rating_count,
-            AVG(r.rating) AS avg_user_rating
+            COALESCE(a.rating_count, 0) AS rating_count,
+            a.rating_sum / NULLIF(a.rating_count, 0) AS avg_user_rating
         FROM users u
-        LEFT JOIN ratings r ON r.user_id = u.user_id
-        GROUP BY u.user_id, u.location
+        LEFT JOIN agg_user_ratings a ON a.user_id = u.user_id
         ORDER BY rating_count DESC
         LIMIT %s
         """,
@@ -196,6 +375,8 @@ def get_user_activity(limit: int = 20) -> pd.DataFrame:
     return pd.DataFrame(rows)
 
 
+@shared_cache("package_coverage", ttl=1800)
+@reads_from_mirror
 def get_package_coverage() -> pd.DataFrame:
     rows = fetch_all_dicts(
         """
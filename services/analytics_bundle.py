@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from db import fetch_all_dicts, fetch_columns
+from services.rollups import bucket_start
+
+
+BUNDLE_SCHEMA_VERSION = 1
+TIMELINE_POINTS = 90
+RECENT_RATINGS_LIMIT = 50
+RATING_COLUMNS = ["user_id", "place_id", "rating", "rated_at"]
+
+
+@dataclass
+class AnalyticsBundle:
+    version: str
+    built_at: datetime
+    ratings_count: int
+    popular_places: pd.DataFrame
+    ratings_by_category: pd.DataFrame
+    ratings_by_city: pd.DataFrame
+    ratings_timeline: pd.DataFrame
+    user_activity: pd.DataFrame
+    recent_ratings: pd.DataFrame
+
+
+def load_catalog_frame() -> pd.DataFrame:
+    rows = fetch_all_dicts(
+        """
+        SELECT place_id, place_name, city, category, price, overall_rating
+        FROM tourism_attractions
+        """
+    )
+    catalog = pd.DataFrame(
+        rows, columns=["place_id", "place_name", "city", "category", "price", "overall_rating"]
+    )
+    catalog["place_id"] = catalog["place_id"].astype("int32")
+    catalog["city"] = catalog["city"].astype("category")
+    catalog["category"] = catalog["category"].astype("category")
+    catalog["price"] = pd.to_numeric(catalog["price"], errors="coerce")
+    catalog["overall_rating"] = pd.to_numeric(catalog["overall_rating"], errors="coerce")
+    return catalog
+
+
+def load_users_frame() -> pd.DataFrame:
+    rows = fetch_all_dicts("SELECT user_id, location, age FROM users")
+    users = pd.DataFrame(rows, columns=["user_id", "location", "age"])
+    users["user_id"] = users["user_id"].astype("int32")
+    users["location"] = users["location"].astype("category")
+    return users
+
+
+def load_ratings_frame(catalog: pd.DataFrame) -> pd.DataFrame:
+    """Единственный проход по ratings: компактные типизированные колонки с атрибутами мест."""
+    columns, rows = fetch_columns("SELECT user_id, place_id, rating, rated_at FROM ratings")
+    raw = pd.DataFrame.from_records(rows, columns=columns or RATING_COLUMNS)
+    frame = pd.DataFrame(
+        {
+            "user_id": raw["user_id"].astype("int32"),
+            "place_id": raw["place_id"].astype("int32"),
+            "rating": pd.to_numeric(raw["rating"], errors="coerce").astype("float32"),
+            "rated_at": pd.to_datetime(raw["rated_at"], errors="coerce"),
+        }
+    )
+    return attach_place_attributes(frame, catalog)
+
+
+def attach_place_attributes(frame: pd.DataFrame, catalog: pd.DataFrame) -> pd.DataFrame:
+    lookup = catalog.set_index("place_id")
+    positions = lookup.index.get_indexer(frame["place_id"])
+    for column in ("city", "category"):
+        codes = lookup[column].cat.codes.to_numpy()
+        mapped = np.where(positions >= 0, codes[positions] if len(codes) else -1, -1)
+        frame[column] = pd.Categorical.from_codes(mapped, categories=lookup[column].cat.categories)
+    return frame
+
+
+def _frame_version(frame: pd.DataFrame) -> str:
+    digest = hashlib.sha1()
+    digest.update(str(BUNDLE_SCHEMA_VERSION).encode())
+    digest.update(str(len(frame)).encode())
+    if not frame.empty:
+        row_hashes = pd.util.hash_pandas_object(frame[RATING_COLUMNS], index=False)
+        digest.update(str(int(row_hashes.sum())).encode())
+    return f"v{BUNDLE_SCHEMA_VERSION}-{digest.hexdigest()[:12]}"
+
+
+def _rating_stats(frame: pd.DataFrame, key: str) -> pd.DataFrame:
+    stats = frame.groupby(key, observed=True)["rating"].agg(["count", "mean"])
+    return stats.rename(columns={"count": "rating_count", "mean": "avg_user_rating"})
+
+
+def compute_bundle(
+    frame: pd.DataFrame, catalog: pd.DataFrame, users: pd.DataFrame
+) -> AnalyticsBundle:
+    """Считает все агрегаты дашборда из одного кадра оценок векторизованными groupby."""
+    place_stats = _rating_stats(frame, "place_id")
+    popular = catalog.join(place_stats, on="place_id")
+    popular["rating_count"] = popular["rating_count"].fillna(0).astype("int64")
+    popular = popular.sort_values(
+        ["rating_count", "avg_user_rating"], ascending=False, na_position="last"
+    )[["place_name", "city", "rating_count", "avg_user_rating", "overall_rating"]]
+
+    by_category = (
+        _rating_stats(frame, "category").sort_values("rating_count", ascending=False).reset_index()
+    )
+    by_city = _rating_stats(frame, "city").sort_values("rating_count", ascending=False).reset_index()
+
+    dated = frame.dropna(subset=["rated_at"])
+    timeline = (
+        dated.groupby(dated["rated_at"].dt.normalize().rename("rated_date"))["rating"]
+        .agg(avg_rating="mean", rating_count="count")
+        .reset_index()
+        .tail(TIMELINE_POINTS)
+    )
+    timeline["rated_date"] = timeline["rated_date"].dt.date
+
+    activity = users.join(_rating_stats(frame, "user_id"), on="user_id")
+    activity["rating_count"] = activity["rating_count"].fillna(0).astype("int64")
+    activity = activity.sort_values("rating_count", ascending=False, kind="stable")[
+        ["user_id", "location", "rating_count", "avg_user_rating"]
+    ]
+
+    recent = frame.nlargest(RECENT_RATINGS_LIMIT, "rated_at")
+    recent = recent.merge(users[["user_id", "location"]], on="user_id", how="left").merge(
+        catalog[["place_id", "place_name"]], on="place_id", how="left"
+    )[["user_id", "location", "place_id", "place_name", "city", "rating", "rated_at"]]
+
+    return AnalyticsBundle(
+        version=_frame_version(frame),
+        built_at=datetime.now(),
+        ratings_count=len(frame),
+        popular_places=popular.reset_index(drop=True),
+        ratings_by_category=by_category,
+        ratings_by_city=by_city,
+        ratings_timeline=timeline.reset_index(drop=True),
+        user_activity=activity.reset_index(drop=True),
+        recent_ratings=recent.reset_index(drop=True),
+    )
+
+
+def compute_trend(
+    frame: pd.DataFrame,
+    granularity: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> pd.DataFrame:
+    """Динамика по дням, неделям (с понедельника) или месяцам из кадра оценок."""
+    dated = frame.dropna(subset=["rated_at"])
+    days = dated["rated_at"].dt.normalize()
+    if granularity == "week":
+        buckets = days - pd.to_timedelta(days.dt.weekday, unit="D")
+    elif granularity == "month":
+        buckets = days.dt.to_period("M").dt.start_time
+    else:
+        buckets = days
+    trend = (
+        dated.groupby(buckets.rename("rated_date"))
+        .agg(
+            avg_rating=("rating", "mean"),
+            rating_count=("rating", "count"),
+            distinct_users=("user_id", "nunique"),
+        )
+        .reset_index()
+    )
+    if start is not None:
+        trend = trend[trend["rated_date"] >= pd.Timestamp(bucket_start(start, granularity))]
+    if end is not None:
+        trend = trend[trend["rated_date"] <= pd.Timestamp(end)]
+    trend["rated_date"] = trend["rated_date"].dt.date
+    return trend.reset_index(drop=True)
+
+
+def build_analytics_bundle() -> AnalyticsBundle:
+    catalog = load_catalog_frame()
+    users = load_users_frame()
+    frame = load_ratings_frame(catalog)
+    return compute_bundle(frame, catalog, users)
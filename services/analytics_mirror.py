@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import threading
+import time
+from functools import wraps
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+from config import get_settings
+from db import create_backend, iter_row_chunks, primary_backend, use_backend
+from db_embedded import EmbeddedError
+from services.job_status import job_status
+
+
+# Таблицы, которые читает аналитика на встроенном движке.
+MIRRORED_TABLES: Dict[str, Tuple[str, ...]] = {
+    "tourism_attractions": ("place_id", "place_name", "category", "city", "price", "overall_rating"),
+    "users": ("user_id", "location", "age"),
+    "ratings": ("user_id", "place_id", "rating", "rated_at"),
+    "tourism_packages": (
+        "Package_id",
+        "City",
+        "Place_Tourism1_id",
+        "Place_Tourism2_id",
+        "Place_Tourism3_id",
+        "Place_Tourism4_id",
+        "Place_Tourism5_id",
+    ),
+}
+DATE_COLUMNS = ("rated_at",)
+MIRROR_CHUNK_ROWS = 50000
+
+_backend = None
+_backend_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_mirror_thread: Optional[threading.Thread] = None
+mirror_status = job_status("analytics_mirror")
+
+
+def mirror_mode() -> bool:
+    return get_settings().analytics_source == "embedded"
+
+
+def mirror_backend():
+    """Встроенная база с копией таблиц: DuckDB по умолчанию, SQLite, если пакет duckdb не установлен."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            settings = get_settings()
+            engine, path = settings.analytics_embedded_engine, settings.analytics_embedded_path
+            try:
+                _backend = create_backend(engine, path)
+            except EmbeddedError:
+                if engine != "duckdb":
+                    raise
+                _backend = create_backend("sqlite", path if path == ":memory:" else str(Path(path).with_suffix(".sqlite")))
+        return _backend
+
+
+def _frames(table: str, columns: Tuple[str, ...]):
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    for names, rows in iter_row_chunks(query, chunk_size=MIRROR_CHUNK_ROWS):
+        frame = pd.DataFrame.from_records(rows, columns=names)
+        for column in DATE_COLUMNS:
+            if column in frame:
+                frame[column] = pd.to_datetime(frame[column], errors="coerce")
+        yield frame
+
+
+def refresh_mirror() -> Dict[str, int]:
+    """Полностью перезаливает таблицы из рабочей базы; возвращает число строк по таблицам.
+
+    Каждая таблица грузится во временную и подменяется одной транзакцией, поэтому
+    запросы аналитики во время обновления видят старую копию целиком.
+    """
+    backend = mirror_backend()
+    loaded = {}
+    with _refresh_lock, use_backend(primary_backend()):
+        for table, columns in MIRRORED_TABLES.items():
+            loaded[table] = backend.replace_table(table, columns, _frames(table, columns))
+        backend.ready = True
+    return loaded
+
+
+def _mirror_ready():
+    backend = mirror_backend()
+    return backend if backend.ready else None
+
+
+def reads_from_mirror(func):
+    """Декоратор: при ANALYTICS_SOURCE=embedded запросы функции идут во встроенную копию.
+
+    Пока фоновая задача не загрузила копию, запросы идут в рабочую базу.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        backend = _mirror_ready() if mirror_mode() else None
+        if backend is None:
+            return func(*args, **kwargs)
+        with use_backend(backend):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _mirror_loop(interval_seconds: int):
+    from services.analytics import invalidate_for_tables
+
+    backend = mirror_backend()
+    # Копия, оставшаяся с прошлого запуска, отдается сразу и обновляется первой же перезаливкой.
+    backend.ready = all(backend.has_table(table) for table in MIRRORED_TABLES)
+    while True:
+        try:
+            refresh_mirror()
+        except Exception as exc:
+            mirror_status.record_error(exc)
+        else:
+            mirror_status.record_success()
+            invalidate_for_tables(MIRRORED_TABLES, mirror_refreshed=True)
+        if interval_seconds <= 0:
+            return
+        time.sleep(interval_seconds)
+
+
+def start_mirror_job(interval_seconds: int) -> bool:
+    """Загружает копию в фоне и перезаливает ее раз в interval_seconds (0 — только первая загрузка)."""
+    global _mirror_thread
+    if not mirror_mode():
+        return False
+    if _mirror_thread is not None and _mirror_thread.is_alive():
+        return False
+    _mirror_thread = threading.Thread(
+        target=_mirror_loop,
+        args=(interval_seconds,),
+        name="analytics-mirror",
+        daemon=True,
+    )
+    _mirror_thread.start()
+    return True
+
+
+if __name__ == "__main__":
+    for table, count in refresh_mirror().items():
+        print(f"{table}: {count}")
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+@dataclass
+class _Entry:
+    value: Any
+    stored_at: float
+    ttl: float
+
+
+@dataclass
+class CacheMetrics:
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    refreshes: int = 0
+    refresh_errors: int = 0
+    expired: int = 0
+    evictions: int = 0
+    refresh_seconds: Dict[str, float] = field(default_factory=dict)
+
+
+def _key_label(key: Hashable) -> str:
+    return str(key[0]) if isinstance(key, tuple) and key else str(key)
+
+
+class SharedCache:
+    """Процессный кэш с TTL, single-flight загрузкой и stale-while-revalidate.
+
+    Свежая запись отдается сразу. Устаревшая (не старше ttl * stale_factor) тоже
+    отдается сразу, а обновление уходит в фоновый поток. При промахе параллельные
+    запросы одного ключа ждут единственную загрузку. Записей не больше max_entries:
+    сверх лимита вытесняются давно не читанные, записи старше окна устаревания
+    удаляются при каждой загрузке.
+
+    Один и тот же объект отдается всем сессиям: вызывающий код не должен его менять
+    (для DataFrame — работать с копией или assign/rename без inplace).
+    """
+
+    def __init__(self, stale_factor: float = 10.0, max_entries: int = 256):
+        self.stale_factor = stale_factor
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.metrics = CacheMetrics()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: float) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                age = now - entry.stored_at
+                if age < entry.ttl:
+                    self.metrics.hits += 1
+                    return entry.value
+                if age < entry.ttl * self.stale_factor:
+                    self.metrics.stale_hits += 1
+                    if key not in self._inflight:
+                        self._inflight[key] = Future()
+                        threading.Thread(
+                            target=self._load,
+                            args=(key, loader, ttl, self._generation),
+                            name="shared-cache-refresh",
+                            daemon=True,
+                        ).start()
+                    return entry.value
+            self.metrics.misses += 1
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            generation = self._generation
+        if owner:
+            self._load(key, loader, ttl, generation)
+        return future.result()
+
+    def _load(self, key: Hashable, loader: Callable[[], Any], ttl: float, generation: int):
+        future = self._inflight[key]
+        started = time.monotonic()
+        try:
+            value = loader()
+        except Exception as exc:
+            with self._lock:
+                self.metrics.refresh_errors += 1
+                self._inflight.pop(key, None)
+            future.set_exception(exc)
+            return
+        finished = time.monotonic()
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = _Entry(value=value, stored_at=finished, ttl=ttl)
+                self._entries.move_to_end(key)
+                self._prune(finished)
+            self.metrics.refreshes += 1
+            self.metrics.refresh_seconds[_key_label(key)] = round(finished - started, 4)
+            self._inflight.pop(key, None)
+        future.set_result(value)
+
+    def _prune(self, now: float):
+        """Удаляет записи за пределами окна устаревания и вытесняет лишние по LRU."""
+        for key in [k for k, e in self._entries.items() if now - e.stored_at >= e.ttl * self.stale_factor]:
+            del self._entries[key]
+            self.metrics.expired += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.metrics.evictions += 1
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None):
+        with self._lock:
+            self._generation += 1
+            if predicate is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if predicate(k)]:
+                    del self._entries[key]
+
+    def invalidate_names(self, *names: str):
+        wanted = set(names)
+        self.invalidate(lambda key: _key_label(key) in wanted)
+
+    def mark_stale(self, predicate: Callable[[Hashable], bool]):
+        """Помечает записи устаревшими: их еще отдают, а первое чтение запускает фоновое обновление.
+
+        Загрузки, начатые до пометки, результат не сохранят — он мог не учесть изменение.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._generation += 1
+            for key, entry in self._entries.items():
+                if predicate(key):
+                    entry.stored_at = min(entry.stored_at, now - entry.ttl)
+
+    def mark_stale_names(self, *names: str):
+        wanted = set(names)
+        self.mark_stale(lambda key: _key_label(key) in wanted)
+
+    def clear(self):
+        self.invalidate()
+        with self._lock:
+            self.metrics = CacheMetrics()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            served = self.metrics.hits + self.metrics.stale_hits
+            lookups = served + self.metrics.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.metrics.hits,
+                "stale_hits": self.metrics.stale_hits,
+                "misses": self.metrics.misses,
+                "hit_ratio": round(served / lookups, 3) if lookups else None,
+                "refreshes": self.metrics.refreshes,
+                "refresh_errors": self.metrics.refresh_errors,
+                "expired": self.metrics.expired,
+                "evictions": self.metrics.evictions,
+                "refresh_seconds": dict(self.metrics.refresh_seconds),
+            }
+
+
+analytics_cache = SharedCache()
+
+
+def shared_cache(name: str, ttl: float, cache: SharedCache = analytics_cache):
+    """Декоратор: результат функции общий для всех сессий процесса и не должен изменяться."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (name, args, tuple(sorted(kwargs.items())))
+            return cache.get_or_load(key, lambda: func(*args, **kwargs), ttl)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional
+
+from db import execute_query, fetch_all_dicts, transaction
+from services.job_status import job_status
+
+
+TRACKED_TABLES = (
+    "ratings",
+    "users",
+    "user_preferences",
+    "users_credentials",
+    "tourism_attractions",
+    "tourism_packages",
+)
+ALL_TABLES = "__all__"
+# Эти таблицы пишет только приложение через tracked_transaction: построчный триггер на
+# горячей таблице держал бы блокировку строки версии до конца каждой транзакции записи.
+APP_TRACKED_TABLES = ("ratings",)
+MAX_LOGGED_USERS = 1000
+CHANGE_LOG_RETENTION = timedelta(hours=1)
+
+# Таблица -> пользователи, чьи строки изменились; None — изменения неизвестны или массовые.
+Changes = Dict[str, Optional[FrozenSet[int]]]
+
+_BUMP_SQL = (
+    "INSERT INTO table_versions (table_name, version) VALUES ('{table}', 1) "
+    "ON DUPLICATE KEY UPDATE version = version + 1"
+)
+
+_ready = False
+_ready_lock = threading.Lock()
+_seen: Dict[str, int] = {}
+_seen_lock = threading.Lock()
+_listeners: List[Callable[[Changes], None]] = []
+_poller_thread: Optional[threading.Thread] = None
+poller_status = job_status("cache_change_poller")
+
+
+def ensure_change_tracking():
+    """Создает таблицы версий и журнала изменений и триггеры версий.
+
+    Таблицы из APP_TRACKED_TABLES триггеров не имеют: их версию один раз на транзакцию
+    увеличивает tracked_transaction.
+    """
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        execute_query(
+            """
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name VARCHAR(64) PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+            """
+        )
+        execute_query(
+            """
+            CREATE TABLE IF NOT EXISTS table_changes (
+                table_name VARCHAR(64) NOT NULL,
+                version BIGINT NOT NULL,
+                user_id INT NOT NULL,
+                changed_at DATETIME NOT NULL,
+                PRIMARY KEY (table_name, version, user_id)
+            )
+            """
+        )
+        for table in (*TRACKED_TABLES, ALL_TABLES):
+            execute_query(
+                "INSERT IGNORE INTO table_versions (table_name, version) VALUES (%s, 0)",
+                (table,),
+            )
+        for table in TRACKED_TABLES:
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                trigger = f"trg_{table}_version_{event.lower()}"
+                if table in APP_TRACKED_TABLES:
+                    execute_query(f"DROP TRIGGER IF EXISTS {trigger}")
+                    continue
+                execute_query(
+                    f"""
+                    CREATE TRIGGER IF NOT EXISTS {trigger}
+                    AFTER {event} ON {table}
+                    FOR EACH ROW
+                    {_BUMP_SQL.format(table=table)}
+                    """
+                )
+        _ready = True
+
+
+def read_versions() -> Dict[str, int]:
+    ensure_change_tracking()
+    return {
+        row["table_name"]: int(row["version"])
+        for row in fetch_all_dicts("SELECT table_name, version FROM table_versions")
+    }
+
+
+def _bump_version(cursor, table: str, user_ids: Optional[FrozenSet[int]]) -> int:
+    cursor.execute(_BUMP_SQL.format(table=table))
+    cursor.execute("SELECT version FROM table_versions WHERE table_name = %s", (table,))
+    version = int(cursor.fetchone()["version"])
+    if user_ids:
+        changed_at = datetime.now()
+        cursor.executemany(
+            "INSERT INTO table_changes (table_name, version, user_id, changed_at) VALUES (%s, %s, %s, %s)",
+            [(table, version, user_id, changed_at) for user_id in sorted(user_ids)],
+        )
+    return version
+
+
+@contextmanager
+def tracked_transaction(*tables: str, user_ids: Optional[Iterable[int]] = None):
+    """Транзакция записи, увеличивающая версии tables один раз перед коммитом.
+
+    user_ids — пользователи, чьи строки меняются: они пишутся в журнал, и другие процессы
+    сбрасывают кэши только этих пользователей (больше MAX_LOGGED_USERS — сброс всех).
+    Строка версии блокируется лишь от увеличения до коммита. После коммита слушатели этого
+    процесса оповещаются сразу, не дожидаясь опроса.
+    """
+    ensure_change_tracking()
+    users = None if user_ids is None else frozenset(int(user_id) for user_id in user_ids)
+    if users is not None and len(users) > MAX_LOGGED_USERS:
+        users = None
+    with transaction() as cursor:
+        yield cursor
+        versions = {table: _bump_version(cursor, table, users) for table in tables}
+    with _seen_lock:
+        for table, version in versions.items():
+            # Своя запись — единственная с прошлого опроса: опросу повторять оповещение не нужно.
+            if _seen.get(table) == version - 1:
+                _seen[table] = version
+    _notify({table: users for table in tables})
+
+
+def broadcast_cache_reset():
+    """Просит все процессы сбросить кэши при следующей проверке версий."""
+    ensure_change_tracking()
+    execute_query(_BUMP_SQL.format(table=ALL_TABLES))
+
+
+def register_change_listener(listener: Callable[[Changes], None]):
+    """Слушатель получает изменения по таблицам: таблица -> пользователи или None (ALL_TABLES — сбросить все)."""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def _notify(changes: Changes):
+    for listener in list(_listeners):
+        try:
+            listener(changes)
+        except Exception:
+            continue
+
+
+def _changed_users(table: str, old_version: int, new_version: int) -> Optional[FrozenSet[int]]:
+    """Пользователи из журнала, если он покрывает каждую версию диапазона, иначе None."""
+    if table == ALL_TABLES or new_version <= old_version:
+        return None
+    rows = fetch_all_dicts(
+        "SELECT version, user_id FROM table_changes WHERE table_name = %s AND version > %s AND version <= %s",
+        (table, old_version, new_version),
+    )
+    if len({row["version"] for row in rows}) != new_version - old_version:
+        return None
+    return frozenset(int(row["user_id"]) for row in rows)
+
+
+def poll_changes() -> Changes:
+    """Сравнивает версии с последними увиденными и оповещает слушателей."""
+    versions = read_versions()
+    with _seen_lock:
+        ranges = {
+            table: (_seen[table], version)
+            for table, version in versions.items()
+            if table in _seen and _seen[table] != version
+        }
+        _seen.update(versions)
+    changes = {table: _changed_users(table, *bounds) for table, bounds in ranges.items()}
+    if changes:
+        _notify(changes)
+    return changes
+
+
+def prune_change_log(retention: timedelta = CHANGE_LOG_RETENTION) -> int:
+    """Удаляет старые записи журнала; отставший процесс сбросит кэши таблицы целиком."""
+    ensure_change_tracking()
+    return execute_query("DELETE FROM table_changes WHERE changed_at < %s", (datetime.now() - retention,))
+
+
+def _poll_loop(interval_seconds: int):
+    last_prune = time.monotonic()
+    while True:
+        try:
+            poll_changes()
+            if time.monotonic() - last_prune >= CHANGE_LOG_RETENTION.total_seconds():
+                prune_change_log()
+                last_prune = time.monotonic()
+        except Exception as exc:
+            poller_status.record_error(exc)
+        else:
+            poller_status.record_success()
+        time.sleep(interval_seconds)
+
+
+def start_change_poller(interval_seconds: int) -> bool:
+    """Запускает фоновую проверку версий таблиц; повторный вызов не создает второй поток."""
+    global _poller_thread
+    if interval_seconds <= 0:
+        return False
+    if _poller_thread is not None and _poller_thread.is_alive():
+        return False
+    _poller_thread = threading.Thread(
+        target=_poll_loop,
+        args=(interval_seconds,),
+        name="cache-change-poller",
+        daemon=True,
+    )
+    _poller_thread.start()
+    return True
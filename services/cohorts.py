@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import date, datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from db import execute_query, fetch_all_dicts, fetch_columns, transaction
+from services.cache import analytics_cache
+from services.job_status import job_status
+from services.watermarks import get_watermark, set_watermark
+
+
+WATERMARK_JOB = "rating_cohorts"
+FULL_REBUILD_INTERVAL = 24 * 3600
+
+_ready = False
+_ready_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_cohort_thread: Optional[threading.Thread] = None
+_initial_thread: Optional[threading.Thread] = None
+cohort_status = job_status("rating_cohorts")
+
+
+def ensure_cohort_tables():
+    """Создает таблицы когорт; первое полное заполнение идет в фоне, до него данных нет."""
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        execute_query(
+            """
+            CREATE TABLE IF NOT EXISTS user_cohorts (
+                user_id INT PRIMARY KEY,
+                cohort_month DATE NOT NULL
+            )
+            """
+        )
+        execute_query(
+            """
+            CREATE TABLE IF NOT EXISTS cohort_activity (
+                cohort_month DATE NOT NULL,
+                activity_month DATE NOT NULL,
+                active_users INT NOT NULL,
+                PRIMARY KEY (cohort_month, activity_month)
+            )
+            """
+        )
+        if get_watermark(WATERMARK_JOB) is None:
+            _start_initial_build()
+        _ready = True
+
+
+def _run_refresh(full: bool = False, if_missing: bool = False) -> bool:
+    try:
+        refresh_cohorts(full=full, if_missing=if_missing)
+    except Exception as exc:
+        cohort_status.record_error(exc)
+        return False
+    cohort_status.record_success()
+    return True
+
+
+def _initial_build():
+    if _run_refresh(full=True, if_missing=True):
+        # Пустая матрица, закэшированная до заполнения, иначе жила бы до конца TTL.
+        analytics_cache.mark_stale_names("cohort_retention")
+
+
+def _start_initial_build():
+    global _initial_thread
+    if _initial_thread is not None and _initial_thread.is_alive():
+        return
+    _initial_thread = threading.Thread(target=_initial_build, name="rating-cohorts-initial", daemon=True)
+    _initial_thread.start()
+
+
+def _month_start(value: date | datetime) -> date:
+    day = value.date() if isinstance(value, datetime) else value
+    return day.replace(day=1)
+
+
+def refresh_cohorts(full: bool = False, if_missing: bool = False) -> int:
+    """Обрабатывает только месяцы начиная с месяца отметки; возвращает число новых пользователей.
+
+    Когорта пользователя — месяц первой оценки; она фиксируется один раз и хранится
+    в user_cohorts. Месяц отметки пересчитывается целиком, так как мог быть неполным.
+    Правки (они переносят rated_at на текущий день) и удаления старых оценок учитываются
+    полной перестройкой (full=True), которую фоновая задача делает раз в сутки.
+    if_missing=True пропускает сборку, если когорты уже построены.
+    """
+    with _refresh_lock:
+        if if_missing and get_watermark(WATERMARK_JOB) is not None:
+            return 0
+        watermark = None if full else get_watermark(WATERMARK_JOB)
+        since = _month_start(watermark) if watermark else None
+        where, params = ("WHERE rated_at >= %s", (since,)) if since else ("WHERE rated_at IS NOT NULL", ())
+        columns, records = fetch_columns(
+            f"""
+            SELECT DISTINCT
+                user_id,
+                DATE_SUB(DATE(rated_at), INTERVAL DAYOFMONTH(rated_at) - 1 DAY) AS activity_month
+            FROM ratings
+            {where}
+            """,
+            params,
+        )
+        activity = pd.DataFrame.from_records(records, columns=columns or ["user_id", "activity_month"])
+        activity["activity_month"] = pd.to_datetime(activity["activity_month"])
+
+        known = pd.DataFrame(
+            [] if since is None else fetch_all_dicts("SELECT user_id, cohort_month FROM user_cohorts"),
+            columns=["user_id", "cohort_month"],
+        )
+        known["cohort_month"] = pd.to_datetime(known["cohort_month"])
+        first_seen = activity.groupby("user_id")["activity_month"].min().rename("cohort_month")
+        new_cohorts = first_seen[~first_seen.index.isin(known["user_id"])]
+        cohorts = (
+            new_cohorts
+            if known.empty
+            else pd.concat([known.set_index("user_id")["cohort_month"], new_cohorts])
+        )
+
+        activity["cohort_month"] = cohorts.reindex(activity["user_id"]).to_numpy()
+        activity = activity.dropna(subset=["cohort_month"])
+        cohort_values, cohort_index = np.unique(activity["cohort_month"].to_numpy(), return_inverse=True)
+        month_values, month_index = np.unique(activity["activity_month"].to_numpy(), return_inverse=True)
+        counts = np.bincount(
+            cohort_index * len(month_values) + month_index,
+            minlength=len(cohort_values) * len(month_values),
+        ).reshape(len(cohort_values), len(month_values))
+        cohort_pos, month_pos = np.nonzero(counts)
+        activity_rows = [
+            (
+                pd.Timestamp(cohort_values[c]).date(),
+                pd.Timestamp(month_values[m]).date(),
+                int(counts[c, m]),
+            )
+            for c, m in zip(cohort_pos, month_pos)
+        ]
+
+        with transaction() as cursor:
+            if since is None:
+                cursor.execute("DELETE FROM user_cohorts")
+                cursor.execute("DELETE FROM cohort_activity")
+            else:
+                cursor.execute("DELETE FROM cohort_activity WHERE activity_month >= %s", (since,))
+            if not new_cohorts.empty:
+                cursor.executemany(
+                    "INSERT INTO user_cohorts (user_id, cohort_month) VALUES (%s, %s)",
+                    [(int(uid), month.date()) for uid, month in new_cohorts.items()],
+                )
+            if activity_rows:
+                cursor.executemany(
+                    """
+                    INSERT INTO cohort_activity (cohort_month, activity_month, active_users)
+                    VALUES (%s, %s, %s)
+                    """,
+                    activity_rows,
+                )
+            latest = month_values.max() if len(month_values) else None
+            set_watermark(
+                WATERMARK_JOB,
+                pd.Timestamp(latest).to_pydatetime() if latest is not None else watermark,
+                cursor=cursor,
+            )
+        return len(new_cohorts)
+
+
+def get_cohort_retention(max_months: int = 12) -> pd.DataFrame:
+    """Матрица удержания: строки — когорты, колонки — месяцы с первой оценки, значения — доля активных."""
+    ensure_cohort_tables()
+    columns, records = fetch_columns(
+        "SELECT cohort_month, activity_month, active_users FROM cohort_activity"
+    )
+    activity = pd.DataFrame.from_records(
+        records, columns=columns or ["cohort_month", "activity_month", "active_users"]
+    )
+    if activity.empty:
+        return pd.DataFrame()
+    cohort = pd.to_datetime(activity["cohort_month"])
+    month = pd.to_datetime(activity["activity_month"])
+    activity["month_offset"] = (month.dt.year - cohort.dt.year) * 12 + (month.dt.month - cohort.dt.month)
+    activity = activity[activity["month_offset"].between(0, max_months)]
+    matrix = activity.pivot_table(
+        index="cohort_month", columns="month_offset", values="active_users", aggfunc="sum"
+    )
+    sizes = matrix[0] if 0 in matrix.columns else matrix.max(axis=1)
+    return matrix.div(sizes, axis=0).sort_index()
+
+
+def _cohort_loop(interval_seconds: int):
+    last_full = time.monotonic()
+    while True:
+        time.sleep(interval_seconds)
+        full = time.monotonic() - last_full >= FULL_REBUILD_INTERVAL
+        if _run_refresh(full=full) and full:
+            last_full = time.monotonic()
+
+
+def start_cohort_job(interval_seconds: int) -> bool:
+    global _cohort_thread
+    if interval_seconds <= 0:
+        return False
+    if _cohort_thread is not None and _cohort_thread.is_alive():
+        return False
+    _cohort_thread = threading.Thread(
+        target=_cohort_loop,
+        args=(interval_seconds,),
+        name="rating-cohorts",
+        daemon=True,
+    )
+    _cohort_thread.start()
+    return True
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from config import get_settings
+from db import fetch_columns
+from services.analytics_bundle import (
+    AnalyticsBundle,
+    compute_bundle,
+    load_catalog_frame,
+    load_users_frame,
+)
+from services.job_status import job_status
+from utils.export import dataframe_digest
+
+
+STATE_FILE = "_state.json"
+RATINGS_DIR = "ratings"
+SNAPSHOT_COLUMNS = ["user_id", "place_id", "rating", "rated_at", "city", "category", "price"]
+SNAPSHOT_DTYPES = {
+    "user_id": "int32",
+    "place_id": "int32",
+    "rating": "float32",
+    "rated_at": "datetime64[ns]",
+    "city": "category",
+    "category": "category",
+    "price": "float64",
+}
+FULL_REBUILD_INTERVAL = 24 * 3600
+
+_refresh_lock = threading.Lock()
+_snapshot_thread: Optional[threading.Thread] = None
+snapshot_status = job_status("analytics_snapshot")
+
+
+def snapshot_root() -> Path:
+    return Path(get_settings().analytics_snapshot_dir)
+
+
+def _read_state() -> dict:
+    path = snapshot_root() / STATE_FILE
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _write_state(state: dict):
+    path = snapshot_root() / STATE_FILE
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(state, ensure_ascii=False, default=str), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def snapshot_version() -> Optional[str]:
+    """Версия снимка меняется при каждом успешном обновлении."""
+    return _read_state().get("version")
+
+
+def _write_table(path: Path, df: pd.DataFrame):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = path.with_suffix(".tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _read_table(path: Path) -> pa.Table:
+    with pa.memory_map(str(path), "r") as source:
+        return ipc.open_file(source).read_all()
+
+
+def _partition_path(month: str) -> Path:
+    return snapshot_root() / RATINGS_DIR / f"month={month}" / "part.arrow"
+
+
+def _fetch_ratings(since: Optional[date]) -> pd.DataFrame:
+    where, params = ("WHERE r.rated_at >= %s", (since,)) if since else ("", ())
+    columns, rows = fetch_columns(
+        f"""
+        SELECT r.user_id, r.place_id, r.rating, r.rated_at, ta.city, ta.category, ta.price
+        FROM ratings r
+        LEFT JOIN tourism_attractions ta ON ta.place_id = r.place_id
+        {where}
+        """,
+        params,
+    )
+    df = pd.DataFrame.from_records(rows, columns=columns or SNAPSHOT_COLUMNS)
+    return df.astype({"user_id": "int32", "place_id": "int32"}).assign(
+        rating=pd.to_numeric(df["rating"], errors="coerce").astype("float32"),
+        rated_at=pd.to_datetime(df["rated_at"], errors="coerce"),
+        price=pd.to_numeric(df["price"], errors="coerce"),
+    )
+
+
+def refresh_snapshot(full: bool = False) -> int:
+    """Дописывает в снимок оценки начиная с отметки rated_at; возвращает число выгруженных строк.
+
+    Данные лежат в Arrow IPC (Feather v2) по месяцам. День отметки выгружается повторно,
+    поскольку rated_at хранит дату. Правка оценки переносит ее на текущий день, а старая
+    строка и удаленные оценки остаются в снимке до полной перестройки (full=True), которую
+    фоновая задача делает раз в сутки. Версия снимка меняется, только если изменились данные.
+    """
+    with _refresh_lock:
+        state = {} if full else _read_state()
+        watermark = state.get("watermark")
+        since = date.fromisoformat(watermark[:10]) if watermark else None
+        fresh = _fetch_ratings(since)
+        fresh = fresh.dropna(subset=["rated_at"]).sort_values(["rated_at", "user_id", "place_id"], ignore_index=True)
+        catalog = load_catalog_frame()
+        users = load_users_frame()
+        latest = fresh["rated_at"].max() if not fresh.empty else None
+        # Хеш хвоста от дня новой отметки: следующий инкрементальный запуск прочитает ровно его.
+        tail = fresh if latest is None else fresh[fresh["rated_at"] >= latest.normalize()]
+        digests = {
+            "ratings_digest": dataframe_digest(tail.reset_index(drop=True)),
+            "catalog_digest": dataframe_digest(catalog),
+            "users_digest": dataframe_digest(users),
+        }
+        if since is not None and state.get("version") and all(state.get(k) == v for k, v in digests.items()):
+            return 0
+
+        if since is None:
+            for path in (snapshot_root() / RATINGS_DIR).glob("month=*/part.arrow"):
+                path.unlink()
+        months = fresh["rated_at"].dt.strftime("%Y-%m")
+        for month, part in fresh.groupby(months):
+            path = _partition_path(month)
+            if since is not None and path.exists():
+                existing = _read_table(path).to_pandas()
+                existing = existing[existing["rated_at"] < pd.Timestamp(since)]
+                part = pd.concat([existing, part], ignore_index=True)
+            _write_table(path, part[SNAPSHOT_COLUMNS])
+
+        _write_table(snapshot_root() / "catalog.arrow", catalog)
+        _write_table(snapshot_root() / "users.arrow", users)
+
+        _write_state(
+            {
+                "watermark": str(latest) if latest is not None else watermark,
+                "version": datetime.now().strftime("%Y%m%d%H%M%S%f"),
+                "rows_last_refresh": len(fresh),
+                **digests,
+            }
+        )
+        return len(fresh)
+
+
+def rewind_snapshot(oldest: Optional[datetime]):
+    """Сдвигает отметку снимка назад (None — полная перестройка) для оценок, записанных задним числом."""
+    with _refresh_lock:
+        state = _read_state()
+        if not state.get("watermark"):
+            return
+        if oldest is None or pd.Timestamp(oldest) < pd.Timestamp(state["watermark"]):
+            # Партиции месяцев от новой отметки перепишутся целиком: строки после нее удаляются при записи.
+            state["watermark"] = None if oldest is None else str(pd.Timestamp(oldest).normalize())
+            state.pop("ratings_digest", None)
+            _write_state(state)
+
+
+def snapshot_months() -> List[str]:
+    return sorted(
+        path.parent.name.split("=", 1)[1]
+        for path in (snapshot_root() / RATINGS_DIR).glob("month=*/part.arrow")
+    )
+
+
+def load_snapshot_ratings(
+    start_month: Optional[str] = None, end_month: Optional[str] = None
+) -> pd.DataFrame:
+    """Читает партиции снимка через memory-map, пропуская месяцы вне диапазона."""
+    tables = [
+        _read_table(_partition_path(month))
+        for month in snapshot_months()
+        if (start_month is None or month >= start_month) and (end_month is None or month <= end_month)
+    ]
+    if not tables:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in SNAPSHOT_DTYPES.items()})
+    df = pa.concat_tables(tables, promote_options="default").to_pandas()
+    return df.astype({"city": "category", "category": "category"})
+
+
+def load_snapshot_catalog() -> pd.DataFrame:
+    return _read_table(snapshot_root() / "catalog.arrow").to_pandas()
+
+
+def load_snapshot_users() -> pd.DataFrame:
+    return _read_table(snapshot_root() / "users.arrow").to_pandas()
+
+
+def build_snapshot_bundle() -> AnalyticsBundle:
+    if snapshot_version() is None:
+        refresh_snapshot(full=True)
+    return compute_bundle(load_snapshot_ratings(), load_snapshot_catalog(), load_snapshot_users())
+
+
+def _snapshot_loop(interval_seconds: int):
+    last_full = None
+    while True:
+        full = last_full is None or time.monotonic() - last_full >= FULL_REBUILD_INTERVAL
+        try:
+            refresh_snapshot(full=full)
+        except Exception as exc:
+            snapshot_status.record_error(exc)
+        else:
+            snapshot_status.record_success()
+            if full:
+                last_full = time.monotonic()
+        time.sleep(interval_seconds)
+
+
+def start_snapshot_job(interval_seconds: int) -> bool:
+    global _snapshot_thread
+    if get_settings().analytics_source != "snapshot" or interval_seconds <= 0:
+        return False
+    if _snapshot_thread is not None and _snapshot_thread.is_alive():
+        return False
+    _snapshot_thread = threading.Thread(
+        target=_snapshot_loop,
+        args=(interval_seconds,),
+        name="analytics-snapshot",
+        daemon=True,
+    )
+    _snapshot_thread.start()
+    return True
+
+
+if __name__ == "__main__":
+    exported = refresh_snapshot(full="--full" in sys.argv)
+    print(f"Выгружено строк: {exported}")
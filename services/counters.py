@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional
+
+from config import get_settings
+from db import execute_query, fetch_all_dicts, transaction
+from services.job_status import job_status
+
+
+COUNTED_TABLES = {
+    "users_count": "users",
+    "attractions_count": "tourism_attractions",
+    "packages_count": "tourism_packages",
+    "ratings_count": "ratings",
+}
+
+_ready = False
+_ready_lock = threading.Lock()
+_estimates: Dict[str, int] = {}
+_estimates_lock = threading.Lock()
+_stats_thread: Optional[threading.Thread] = None
+stats_status = job_status("kpi_stats_refresh")
+
+
+def ensure_counter_table():
+    """Создает таблицу счетчиков и триггеры вставки/удаления для точного режима."""
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        execute_query(
+            """
+            CREATE TABLE IF NOT EXISTS entity_counters (
+                table_name VARCHAR(64) PRIMARY KEY,
+                row_count BIGINT NOT NULL DEFAULT 0
+            )
+            """
+        )
+        for table in COUNTED_TABLES.values():
+            for event, delta in (("INSERT", 1), ("DELETE", -1)):
+                execute_query(
+                    f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_count_{event.lower()}
+                    AFTER {event} ON {table}
+                    FOR EACH ROW
+                    UPDATE entity_counters SET row_count = row_count + ({delta})
+                    WHERE table_name = '{table}'
+                    """
+                )
+        seeded = {row["table_name"] for row in fetch_all_dicts("SELECT table_name FROM entity_counters")}
+        if seeded != set(COUNTED_TABLES.values()):
+            reconcile_counters()
+        _ready = True
+
+
+def reconcile_counters():
+    """Пересчитывает точные значения счетчиков через COUNT(*)."""
+    with transaction() as cursor:
+        for table in COUNTED_TABLES.values():
+            cursor.execute(
+                f"""
+                INSERT INTO entity_counters (table_name, row_count)
+                SELECT '{table}', COUNT(*) FROM {table}
+                ON DUPLICATE KEY UPDATE row_count = VALUES(row_count)
+                """
+            )
+
+
+def refresh_estimates() -> Dict[str, int]:
+    """Читает оценки числа строк из статистики таблиц InnoDB.
+
+    Переменная сессии возвращается к значению по умолчанию до возврата соединения
+    в пул, чтобы не влиять на следующие запросы через то же соединение.
+    """
+    placeholders = ", ".join(["%s"] * len(COUNTED_TABLES))
+    with transaction() as cursor:
+        cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+        try:
+            cursor.execute(
+                f"""
+                SELECT TABLE_NAME AS table_name, TABLE_ROWS AS row_count
+                FROM INFORMATION_SCHEMA.TABLES
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+                """,
+                tuple(COUNTED_TABLES.values()),
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.execute("SET SESSION information_schema_stats_expiry = DEFAULT")
+    by_table = {row["table_name"]: int(row["row_count"] or 0) for row in rows}
+    estimates = {key: by_table.get(table, 0) for key, table in COUNTED_TABLES.items()}
+    with _estimates_lock:
+        _estimates.clear()
+        _estimates.update(estimates)
+    return estimates
+
+
+def _stats_loop(interval_seconds: int):
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            refresh_estimates()
+        except Exception as exc:
+            stats_status.record_error(exc)
+            continue
+        stats_status.record_success()
+
+
+def start_stats_job(interval_seconds: int) -> bool:
+    """Запускает фоновое обновление оценок для быстрого режима."""
+    global _stats_thread
+    if get_settings().kpi_counter_mode != "fast" or interval_seconds <= 0:
+        return False
+    if _stats_thread is not None and _stats_thread.is_alive():
+        return False
+    _stats_thread = threading.Thread(
+        target=_stats_loop,
+        args=(interval_seconds,),
+        name="kpi-stats-refresh",
+        daemon=True,
+    )
+    _stats_thread.start()
+    return True
+
+
+def get_counts() -> Dict[str, int]:
+    """Значения KPI за O(1): точные из entity_counters или оценочные из памяти."""
+    if get_settings().kpi_counter_mode == "fast":
+        with _estimates_lock:
+            if _estimates:
+                return dict(_estimates)
+        return refresh_estimates()
+
+    ensure_counter_table()
+    by_table = {
+        row["table_name"]: int(row["row_count"])
+        for row in fetch_all_dicts("SELECT table_name, row_count FROM entity_counters")
+    }
+    return {key: by_table.get(table, 0) for key, table in COUNTED_TABLES.items()}
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import string
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from config import get_settings
+from db import column_names, fetch_one_prepared
+
+
+LOGIN_COLUMN_CANDIDATES = ("login", "username", "user_name", "email", "user_email")
+PASSWORD_COLUMN_CANDIDATES = ("password_value", "password_hash", "password", "pwd_hash", "pwd")
+BLOCK_COLUMN_CANDIDATES = ("is_blocked", "blocked")
+BLOCKED_VALUES = {"1", "true", "yes", "blocked"}
+MAX_CACHED_CREDENTIALS = 10000
+# ALTER TABLE не меняет версии таблиц, поэтому схема перечитывается и по времени.
+SCHEMA_TTL_SECONDS = 600
+
+_HASH_SCHEMES_BY_LENGTH = {64: "sha256", 40: "sha1", 32: "md5"}
+_HEX_DIGITS = set(string.hexdigits)
+
+
+@dataclass(frozen=True)
+class CredentialSchema:
+    login_column: Optional[str]
+    password_column: Optional[str]
+    block_column: Optional[str]
+
+
+@dataclass(frozen=True)
+class CredentialRecord:
+    user_id: int
+    stored_password: Optional[str]
+    is_blocked: bool
+
+
+_schema: Optional[CredentialSchema] = None
+_schema_expires_at = 0.0
+_schema_lock = threading.Lock()
+_records: Dict[str, Tuple[float, CredentialRecord]] = {}
+_logins_by_user: Dict[int, str] = {}
+_records_lock = threading.Lock()
+
+
+def _first_present(candidates, cols) -> Optional[str]:
+    for candidate in candidates:
+        if candidate in cols:
+            return candidate
+    return None
+
+
+def get_credential_schema(refresh: bool = False) -> CredentialSchema:
+    """Определяет колонки users_credentials; результат живет SCHEMA_TTL_SECONDS секунд."""
+    global _schema, _schema_expires_at
+    schema = _schema
+    if schema is not None and not refresh and _schema_expires_at > time.monotonic():
+        return schema
+    with _schema_lock:
+        if _schema is None or refresh or _schema_expires_at <= time.monotonic():
+            cols = set(column_names("users_credentials"))
+            _schema = CredentialSchema(
+                login_column=_first_present(LOGIN_COLUMN_CANDIDATES, cols),
+                password_column=_first_present(PASSWORD_COLUMN_CANDIDATES, cols),
+                block_column=_first_present(BLOCK_COLUMN_CANDIDATES, cols),
+            )
+            _schema_expires_at = time.monotonic() + SCHEMA_TTL_SECONDS
+        return _schema
+
+
+def detect_hash_scheme(stored_password: str) -> Optional[str]:
+    """Схема хеша по виду сохраненного значения: hex длиной 64/40/32 — sha256/sha1/md5."""
+    scheme = _HASH_SCHEMES_BY_LENGTH.get(len(stored_password))
+    if scheme and set(stored_password) <= _HEX_DIGITS:
+        return scheme
+    return None
+
+
+def verify_password(stored_password: str, password: str) -> bool:
+    if hmac.compare_digest(stored_password.encode("utf-8"), password.encode("utf-8")):
+        return True
+    scheme = detect_hash_scheme(stored_password)
+    if scheme is None:
+        return False
+    candidate = hashlib.new(scheme, password.encode("utf-8")).hexdigest()
+    return hmac.compare_digest(candidate, stored_password.lower())
+
+
+def _load_record(schema: CredentialSchema, username: str) -> Optional[CredentialRecord]:
+    block_select = f"{schema.block_column}" if schema.block_column else "NULL"
+    row = fetch_one_prepared(
+        f"""
+        SELECT user_id, {schema.password_column} AS password_value, {block_select} AS is_blocked
+        FROM users_credentials
+        WHERE {schema.login_column} = %s
+        LIMIT 1
+        """,
+        (username,),
+    )
+    if not row:
+        return None
+    stored = row["password_value"]
+    if isinstance(stored, (bytes, bytearray)):
+        stored = stored.decode("utf-8")
+    block_value = row["is_blocked"]
+    return CredentialRecord(
+        user_id=row["user_id"],
+        stored_password=None if stored is None else str(stored),
+        is_blocked=block_value is not None and str(block_value).lower() in BLOCKED_VALUES,
+    )
+
+
+def get_credential_record(username: str) -> Optional[CredentialRecord]:
+    """Учетная запись по логину с коротким TTL-кэшем (CREDENTIAL_CACHE_TTL секунд)."""
+    schema = get_credential_schema()
+    if not schema.login_column or not schema.password_column:
+        return None
+    now = time.monotonic()
+    with _records_lock:
+        cached = _records.get(username)
+        if cached and cached[0] > now:
+            return cached[1]
+    record = _load_record(schema, username)
+    if record is None:
+        return None
+    with _records_lock:
+        _records[username] = (now + get_settings().credential_cache_ttl, record)
+        _logins_by_user[record.user_id] = username
+        while len(_records) > MAX_CACHED_CREDENTIALS:
+            evicted_login = next(iter(_records))
+            evicted = _records.pop(evicted_login)[1]
+            _logins_by_user.pop(evicted.user_id, None)
+    return record
+
+
+def invalidate_user_credentials(user_id: int):
+    with _records_lock:
+        login = _logins_by_user.pop(user_id, None)
+        if login is not None:
+            _records.pop(login, None)
+
+
+def clear_credential_cache():
+    """Сбрасывает учетные записи и схему таблицы: следующий вход перечитает обе."""
+    global _schema
+    with _schema_lock:
+        _schema = None
+    with _records_lock:
+        _records.clear()
+        _logins_by_user.clear()
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import csv
+import gzip
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from mysql.connector.constants import FieldType
+
+from db import iter_row_chunks
+from services.counters import get_counts
+
+
+EXPORTABLE_TABLES = {
+    "ratings": (
+        "Оценки (ratings)",
+        "SELECT user_id, place_id, rating, rated_at FROM ratings",
+        "ratings_count",
+    ),
+    "users": (
+        "Пользователи (users)",
+        "SELECT user_id, location, age FROM users",
+        "users_count",
+    ),
+}
+
+STREAM_FORMATS = {
+    "csv.gz": ("CSV (gzip)", "application/gzip"),
+    "xlsx": ("XLSX", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+}
+
+CHUNK_SIZE = 20000
+XLSX_MAX_ROWS = 1_048_576
+EXPORT_TTL = timedelta(hours=1)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="table-export")
+_jobs: Dict[str, "ExportJob"] = {}
+_jobs_lock = threading.Lock()
+
+
+@dataclass
+class ExportJob:
+    job_id: str
+    table: str
+    fmt: str
+    status: str = "queued"
+    rows_written: int = 0
+    total_rows: Optional[int] = None
+    path: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+
+    @property
+    def file_name(self) -> str:
+        return f"{self.table}_{self.created_at:%Y%m%d_%H%M%S}.{self.fmt}"
+
+    @property
+    def progress(self) -> float:
+        if self.status == "done":
+            return 1.0
+        if not self.total_rows:
+            return 0.0
+        return min(self.rows_written / self.total_rows, 0.99)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+
+def _names(fields: Sequence[Tuple[str, Any]]) -> List[str]:
+    return [name for name, _ in fields]
+
+
+def _write_csv_gz(path: str, chunks, on_chunk: Callable[[int], None]):
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        header_written = False
+        for fields, rows in chunks:
+            if not header_written:
+                writer.writerow(_names(fields))
+                header_written = True
+            writer.writerows(rows)
+            on_chunk(len(rows))
+
+
+def _write_xlsx(path: str, chunks, on_chunk: Callable[[int], None]):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = XLSX_MAX_ROWS
+    for fields, rows in chunks:
+        for row in rows:
+            if sheet_rows >= XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"Данные {len(workbook.worksheets) + 1}")
+                sheet.append(_names(fields))
+                sheet_rows = 1
+            sheet.append(row)
+            sheet_rows += 1
+        on_chunk(len(rows))
+    if sheet is None:
+        workbook.create_sheet("Данные")
+    workbook.save(path)
+
+
+def _arrow_type(type_code: Any):
+    import pyarrow as pa
+
+    if type_code in (FieldType.TINY, FieldType.SHORT, FieldType.INT24, FieldType.LONG, FieldType.LONGLONG):
+        return pa.int64()
+    if type_code in (FieldType.FLOAT, FieldType.DOUBLE, FieldType.DECIMAL, FieldType.NEWDECIMAL):
+        return pa.float64()
+    if type_code in FieldType.get_timestamp_types():
+        return pa.timestamp("us")
+    if type_code == FieldType.DATE:
+        return pa.date32()
+    if type_code in FieldType.get_string_types():
+        return pa.string()
+    return None
+
+
+def _parquet_schema(fields: Sequence[Tuple[str, Any]], rows: List[Tuple[Any, ...]]):
+    """Схема файла по описанию запроса, а не по первой порции.
+
+    Колонка, целиком пустая в первой порции, иначе получила бы тип null, и следующие
+    порции не привелись бы к схеме. Неизвестный тип (встроенные движки) выводится по
+    первой порции, пустая колонка становится строковой.
+    """
+    import pyarrow as pa
+
+    schema_fields = []
+    for index, (name, type_code) in enumerate(fields):
+        arrow_type = _arrow_type(type_code)
+        if arrow_type is None:
+            arrow_type = pa.array([row[index] for row in rows]).type
+            if pa.types.is_null(arrow_type):
+                arrow_type = pa.string()
+        schema_fields.append(pa.field(name, arrow_type))
+    return pa.schema(schema_fields)
+
+
+def _arrow_column(values: Sequence[Any], arrow_type):
+    import pyarrow as pa
+
+    if pa.types.is_floating(arrow_type):
+        values = [None if value is None else float(value) for value in values]
+    elif pa.types.is_string(arrow_type):
+        values = [None if value is None else str(value) for value in values]
+    return pa.array(values, type=arrow_type)
+
+
+def _write_parquet(path: str, chunks, on_chunk: Callable[[int], None]):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for fields, rows in chunks:
+            if writer is None:
+                writer = pq.ParquetWriter(path, _parquet_schema(fields, rows))
+            columns = list(zip(*rows))
+            table = pa.Table.from_arrays(
+                [_arrow_column(values, field.type) for values, field in zip(columns, writer.schema)],
+                schema=writer.schema,
+            )
+            writer.write_table(table, row_group_size=len(rows))
+            on_chunk(len(rows))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pq.write_table(pa.table({}), path)
+
+
+_STREAM_WRITERS = {
+    "csv.gz": _write_csv_gz,
+    "xlsx": _write_xlsx,
+    "parquet": _write_parquet,
+}
+
+
+def _run_export(job: ExportJob):
+    _, query, count_key = EXPORTABLE_TABLES[job.table]
+    job.status = "running"
+    try:
+        job.total_rows = get_counts().get(count_key)
+    except Exception:
+        job.total_rows = None
+    fd, path = tempfile.mkstemp(prefix=f"export_{job.table}_", suffix=f".{job.fmt}")
+    os.close(fd)
+    job.path = path
+
+    def on_chunk(count: int):
+        job.rows_written += count
+
+    try:
+        _STREAM_WRITERS[job.fmt](path, iter_row_chunks(query, chunk_size=CHUNK_SIZE, describe=True), on_chunk)
+    except Exception as exc:
+        job.status = "error"
+        job.error = str(exc)
+        os.remove(path)
+        job.path = None
+    else:
+        job.status = "done"
+    job.finished_at = datetime.now()
+
+
+def start_export(table: str, fmt: str) -> ExportJob:
+    """Ставит полную выгрузку таблицы в фоновую очередь и сразу возвращает задачу."""
+    if table not in EXPORTABLE_TABLES:
+        raise ValueError(f"Таблица {table} недоступна для выгрузки")
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    job = ExportJob(job_id=uuid.uuid4().hex[:12], table=table, fmt=fmt)
+    expire_exports()
+    with _jobs_lock:
+        _jobs[job.job_id] = job
+    _executor.submit(_run_export, job)
+    return job
+
+
+def list_exports() -> List[ExportJob]:
+    expire_exports()
+    with _jobs_lock:
+        return sorted(_jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+
+def _remove_file(job: ExportJob):
+    if job.path and os.path.exists(job.path):
+        os.remove(job.path)
+
+
+def expire_exports(ttl: timedelta = EXPORT_TTL) -> int:
+    """Удаляет завершенные выгрузки старше ttl вместе с временными файлами."""
+    cutoff = datetime.now() - ttl
+    with _jobs_lock:
+        expired = [
+            job for job in _jobs.values() if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job in expired:
+            del _jobs[job.job_id]
+    for job in expired:
+        _remove_file(job)
+    return len(expired)
+
+
+def discard_export(job_id: str):
+    with _jobs_lock:
+        job = _jobs.pop(job_id, None)
+    if job:
+        _remove_file(job)
+
+
+def read_export(job: ExportJob) -> bytes:
+    with open(job.path, "rb") as handle:
+        return handle.read()
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from io import BytesIO
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from db import fetch_columns, transaction
+from services.aggregates import ensure_aggregate_tables
+from services.analytics_bundle import load_catalog_frame
+from services.change_tracking import tracked_transaction
+from services.cohorts import WATERMARK_JOB as COHORTS_WATERMARK_JOB
+from services.columnar_store import rewind_snapshot
+from services.preference_learner import WATERMARK_JOB as PREFERENCES_WATERMARK_JOB
+from services.rollups import WATERMARK_JOB as ROLLUPS_WATERMARK_JOB
+from services.sketches import WATERMARK_JOB as SKETCHES_WATERMARK_JOB
+from services.ratings import write_ratings_batch
+from services.watermarks import rewind_watermark
+
+
+IMPORT_COLUMNS = ("user_id", "place_id", "rating")
+MIN_RATING, MAX_RATING = 1.0, 5.0
+CHUNK_SIZE = 5000
+IMPORT_TTL = timedelta(hours=1)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ratings-import")
+_jobs: Dict[str, "ImportJob"] = {}
+_jobs_lock = threading.Lock()
+
+
+@dataclass
+class ImportJob:
+    job_id: str
+    file_name: str
+    status: str = "queued"
+    total_rows: int = 0
+    valid_rows: int = 0
+    imported_rows: int = 0
+    errors: pd.DataFrame = field(default_factory=pd.DataFrame)
+    error: Optional[str] = None
+    write_seconds: float = 0.0
+    created_at: datetime = field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+
+    @property
+    def progress(self) -> float:
+        if self.status == "done":
+            return 1.0
+        if not self.valid_rows:
+            return 0.0
+        return min(self.imported_rows / self.valid_rows, 0.99)
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if not self.write_seconds:
+            return None
+        return self.imported_rows / self.write_seconds
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+
+def read_ratings_file(file_name: str, payload: bytes) -> pd.DataFrame:
+    """Читает CSV или XLSX; заголовки приводятся к нижнему регистру."""
+    if file_name.lower().endswith(".xlsx"):
+        frame = pd.read_excel(BytesIO(payload), engine="openpyxl", dtype=str)
+    else:
+        frame = pd.read_csv(BytesIO(payload), dtype=str, encoding="utf-8-sig")
+        if len(frame.columns) == 1 and ";" in frame.columns[0]:
+            frame = pd.read_csv(BytesIO(payload), dtype=str, encoding="utf-8-sig", sep=";")
+    frame.columns = [str(column).strip().lower() for column in frame.columns]
+    missing = [column for column in IMPORT_COLUMNS if column not in frame.columns]
+    if missing:
+        raise ValueError(f"В файле нет обязательных колонок: {', '.join(missing)}")
+    return frame
+
+
+def validate_ratings(frame: pd.DataFrame, catalog: pd.DataFrame, user_ids: np.ndarray):
+    """Векторная проверка строк; возвращает (годные строки, отчет об ошибках).
+
+    Номер строки в отчете соответствует строке файла с учетом заголовка.
+    """
+    user_id = pd.to_numeric(frame["user_id"], errors="coerce")
+    place_id = pd.to_numeric(frame["place_id"], errors="coerce")
+    rating = pd.to_numeric(frame["rating"].str.replace(",", ".", regex=False), errors="coerce")
+    raw_dates = frame["rated_at"] if "rated_at" in frame.columns else pd.Series(pd.NA, index=frame.index)
+    rated_at = pd.to_datetime(raw_dates, errors="coerce")
+    has_date = raw_dates.notna() & (raw_dates.astype(str).str.strip() != "")
+
+    checks = [
+        (user_id.isna() | (user_id % 1 != 0), "user_id не является целым числом"),
+        (place_id.isna() | (place_id % 1 != 0), "place_id не является целым числом"),
+        (rating.isna(), "rating не является числом"),
+        ((rating < MIN_RATING) | (rating > MAX_RATING), f"rating вне диапазона {MIN_RATING:g}–{MAX_RATING:g}"),
+        (has_date & rated_at.isna(), "rated_at не распознана как дата"),
+        (~place_id.isin(catalog["place_id"]), "place_id отсутствует в каталоге достопримечательностей"),
+        (~user_id.isin(user_ids), "user_id отсутствует в таблице users"),
+    ]
+    reason = np.select([mask.fillna(True).to_numpy() for mask, _ in checks], [text for _, text in checks], "")
+    invalid = reason != ""
+
+    valid = pd.DataFrame(
+        {
+            "user_id": user_id[~invalid].astype("int64"),
+            "place_id": place_id[~invalid].astype("int64"),
+            "rating": rating[~invalid].astype(float),
+            "rated_at": rated_at[~invalid].fillna(pd.Timestamp(date.today())).dt.normalize(),
+        }
+    )
+    duplicated = valid.duplicated(["user_id", "place_id"], keep="last")
+    errors = pd.DataFrame(
+        {
+            "row_number": np.concatenate([frame.index[invalid], valid.index[duplicated]]) + 2,
+            "reason": np.concatenate(
+                [reason[invalid], np.full(int(duplicated.sum()), "повтор пары user_id/place_id, учтена последняя строка")]
+            ),
+        }
+    ).sort_values("row_number", ignore_index=True)
+    valid = valid[~duplicated]
+    return valid.reset_index(drop=True), errors
+
+
+def _load_user_ids() -> np.ndarray:
+    _, rows = fetch_columns("SELECT user_id FROM users")
+    return np.fromiter((row[0] for row in rows), dtype="int64", count=len(rows))
+
+
+def _write_chunk(chunk: pd.DataFrame) -> int:
+    with tracked_transaction("ratings", user_ids=chunk["user_id"].tolist()) as cursor:
+        return write_ratings_batch(cursor, chunk)
+
+
+def _rewind_incremental_jobs(oldest: datetime):
+    """Импорт может принести оценки задним числом: инкрементальные задачи пересчитают их."""
+    with transaction() as cursor:
+        rewind_watermark(ROLLUPS_WATERMARK_JOB, oldest, cursor=cursor)
+        rewind_watermark(SKETCHES_WATERMARK_JOB, oldest, cursor=cursor)
+        rewind_watermark(PREFERENCES_WATERMARK_JOB, oldest, cursor=cursor)
+        rewind_watermark(COHORTS_WATERMARK_JOB, None, cursor=cursor)
+    rewind_snapshot(oldest)
+
+
+def _run_import(job: ImportJob, payload: bytes):
+    job.status = "running"
+    try:
+        ensure_aggregate_tables()
+        frame = read_ratings_file(job.file_name, payload)
+        job.total_rows = len(frame)
+        valid, job.errors = validate_ratings(frame, load_catalog_frame(), _load_user_ids())
+        job.valid_rows = len(valid)
+        started = time.perf_counter()
+        for offset in range(0, len(valid), CHUNK_SIZE):
+            job.imported_rows += _write_chunk(valid.iloc[offset : offset + CHUNK_SIZE])
+            job.write_seconds = time.perf_counter() - started
+        if not valid.empty:
+            _rewind_incremental_jobs(valid["rated_at"].min().to_pydatetime())
+    except Exception as exc:
+        job.status = "error"
+        job.error = str(exc)
+    else:
+        job.status = "done"
+    job.finished_at = datetime.now()
+
+
+def start_import(file_name: str, payload: bytes) -> ImportJob:
+    """Ставит импорт файла оценок в фоновую очередь и сразу возвращает задачу."""
+    job = ImportJob(job_id=uuid.uuid4().hex[:12], file_name=file_name)
+    with _jobs_lock:
+        _jobs[job.job_id] = job
+    _executor.submit(_run_import, job, payload)
+    return job
+
+
+def list_imports() -> List[ImportJob]:
+    expire_imports()
+    with _jobs_lock:
+        return sorted(_jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+
+def expire_imports(ttl: timedelta = IMPORT_TTL) -> int:
+    """Удаляет завершенные импорты старше ttl вместе с отчетами об ошибках."""
+    cutoff = datetime.now() - ttl
+    with _jobs_lock:
+        expired = [
+            job_id for job_id, job in _jobs.items() if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del _jobs[job_id]
+    return len(expired)
+
+
+def discard_import(job_id: str):
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
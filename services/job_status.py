@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+class JobStatus:
+    """Итог последних запусков фоновой задачи: ошибки не теряются, а видны в админ-панели."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.runs = 0
+        self.errors = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def record_success(self):
+        with self._lock:
+            self.runs += 1
+            self.last_run_at = datetime.now()
+
+    def record_error(self, exc: BaseException):
+        with self._lock:
+            self.errors += 1
+            self.last_error = f"{type(exc).__name__}: {exc}"
+            self.last_error_at = datetime.now()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job": self.name,
+                "runs": self.runs,
+                "errors": self.errors,
+                "last_run_at": self.last_run_at,
+                "last_error": self.last_error,
+                "last_error_at": self.last_error_at,
+            }
+
+
+_jobs: Dict[str, JobStatus] = {}
+_jobs_lock = threading.Lock()
+
+
+def job_status(name: str) -> JobStatus:
+    with _jobs_lock:
+        status = _jobs.get(name)
+        if status is None:
+            status = _jobs[name] = JobStatus(name)
+        return status
+
+
+def job_statuses() -> List[Dict[str, Any]]:
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    return [job.snapshot() for job in sorted(jobs, key=lambda job: job.name)]
@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from db import execute_query, fetch_columns, fetch_one_dict, transaction
+from services.job_status import job_status
+from services.watermarks import get_watermark, set_watermark
+
+
+WATERMARK_JOB = "preference_learner"
+LEARNED_TYPES = ("category_preference", "city_preference", "price_preference")
+USERS_PER_BATCH = 1000
+FULL_RELEARN_INTERVAL = 24 * 3600
+
+_ready = False
+_ready_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_learner_thread: Optional[threading.Thread] = None
+learner_status = job_status("preference_learner")
+
+
+def ensure_learned_table():
+    """Создает реестр ключей, записанных обучением: только их оно вправе удалять."""
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        execute_query(
+            """
+            CREATE TABLE IF NOT EXISTS learned_preferences (
+                user_id INT NOT NULL,
+                preference_type VARCHAR(64) NOT NULL,
+                preference_key VARCHAR(255) NOT NULL,
+                PRIMARY KEY (user_id, preference_type, preference_key)
+            )
+            """
+        )
+        _ready = True
+
+
+def price_bucket(price: pd.Series) -> pd.Series:
+    """Ценовые сегменты в тех же границах, что и ранжирование в поиске туров."""
+    buckets = np.select([price < 50000, price <= 150000, price > 150000], ["low", "medium", "high"], "unknown")
+    return pd.Series(buckets, index=price.index)
+
+
+def compute_affinities(frame: pd.DataFrame) -> pd.DataFrame:
+    """Аффинити пользователя к категориям, городам и ценовым сегментам.
+
+    Для каждого ключа берется средняя оценка пользователя, деленная на его максимум
+    по тому же типу предпочтения: значения лежат в (0, 1].
+    """
+    frame = frame.assign(
+        rating=pd.to_numeric(frame["rating"], errors="coerce"),
+        price_bucket=price_bucket(pd.to_numeric(frame["price"], errors="coerce")),
+    ).dropna(subset=["rating"])
+    parts = []
+    for preference_type, column in zip(LEARNED_TYPES, ("category", "city", "price_bucket")):
+        means = (
+            frame.dropna(subset=[column])
+            .groupby(["user_id", column], observed=True)["rating"]
+            .mean()
+            .rename("preference_value")
+            .reset_index()
+            .rename(columns={column: "preference_key"})
+        )
+        means = means[means["preference_key"] != "unknown"]
+        user_max = means.groupby("user_id")["preference_value"].transform("max")
+        means["preference_value"] = (means["preference_value"] / user_max.where(user_max > 0)).round(4)
+        parts.append(means.dropna(subset=["preference_value"]).assign(preference_type=preference_type))
+    if not parts:
+        return pd.DataFrame(columns=["user_id", "preference_type", "preference_key", "preference_value"])
+    return pd.concat(parts, ignore_index=True)[["user_id", "preference_type", "preference_key", "preference_value"]]
+
+
+def _load_ratings(since) -> pd.DataFrame:
+    if since is None:
+        where, params = "", ()
+    else:
+        where = "WHERE r.user_id IN (SELECT DISTINCT user_id FROM ratings WHERE rated_at >= %s)"
+        params = (since,)
+    columns, records = fetch_columns(
+        f"""
+        SELECT r.user_id, r.rating, ta.category, ta.city, ta.price
+        FROM ratings r
+        JOIN tourism_attractions ta ON ta.place_id = r.place_id
+        {where}
+        """,
+        params,
+    )
+    return pd.DataFrame.from_records(
+        records, columns=columns or ["user_id", "rating", "category", "city", "price"]
+    )
+
+
+def _users_without_ratings() -> list:
+    """Пользователи с выученными ключами, у которых не осталось оценок."""
+    _, rows = fetch_columns(
+        """
+        SELECT DISTINCT lp.user_id
+        FROM learned_preferences lp
+        LEFT JOIN ratings r ON r.user_id = lp.user_id
+        WHERE r.user_id IS NULL
+        """
+    )
+    return [int(row[0]) for row in rows]
+
+
+def _write_preferences(affinities: pd.DataFrame, user_ids) -> None:
+    """Обновляет выученные ключи через upsert и удаляет те, что больше не выводятся.
+
+    Ключи, заданные пользователем (есть в user_preferences, но нет в learned_preferences),
+    не перезаписываются и не присваиваются обучением.
+    """
+    for offset in range(0, len(user_ids), USERS_PER_BATCH):
+        batch_users = user_ids[offset : offset + USERS_PER_BATCH]
+        batch = affinities[affinities["user_id"].isin(batch_users)]
+        rows = list(
+            zip(
+                batch["user_id"].astype(int).tolist(),
+                batch["preference_type"].tolist(),
+                batch["preference_key"].astype(str).tolist(),
+                batch["preference_value"].astype(float).tolist(),
+            )
+        )
+        placeholders = ", ".join(["%s"] * len(batch_users))
+        with transaction() as cursor:
+            cursor.execute(
+                f"""
+                SELECT user_id, preference_type, preference_key
+                FROM learned_preferences
+                WHERE user_id IN ({placeholders})
+                """,
+                tuple(batch_users),
+            )
+            previous = {
+                (int(row["user_id"]), row["preference_type"], row["preference_key"]) for row in cursor.fetchall()
+            }
+            cursor.execute(
+                f"""
+                SELECT user_id, preference_type, preference_key
+                FROM user_preferences
+                WHERE user_id IN ({placeholders})
+                  AND preference_type IN ({", ".join(["%s"] * len(LEARNED_TYPES))})
+                """,
+                tuple(batch_users) + LEARNED_TYPES,
+            )
+            user_set = {
+                (int(row["user_id"]), row["preference_type"], row["preference_key"]) for row in cursor.fetchall()
+            } - previous
+            rows = [row for row in rows if row[:3] not in user_set]
+            stale = sorted(previous - {row[:3] for row in rows})
+            if rows:
+                cursor.executemany(
+                    """
+                    INSERT INTO user_preferences (user_id, preference_type, preference_key, preference_value)
+                    VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE preference_value = VALUES(preference_value)
+                    """,
+                    rows,
+                )
+                cursor.executemany(
+                    """
+                    INSERT IGNORE INTO learned_preferences (user_id, preference_type, preference_key)
+                    VALUES (%s, %s, %s)
+                    """,
+                    [row[:3] for row in rows],
+                )
+            if stale:
+                for table in ("user_preferences", "learned_preferences"):
+                    cursor.executemany(
+                        f"DELETE FROM {table} WHERE user_id = %s AND preference_type = %s AND preference_key = %s",
+                        stale,
+                    )
+
+
+def learn_preferences(full: bool = False) -> int:
+    """Пересчитывает выученные предпочтения; возвращает число обработанных пользователей.
+
+    В инкрементальном режиме пересчитываются только пользователи с оценками не старше
+    дня отметки, а также удалившие все оценки: их выученные ключи снимаются. Правки
+    и удаления старых оценок учитываются полным проходом (full=True), который фоновая
+    задача делает раз в сутки.
+    """
+    ensure_learned_table()
+    with _refresh_lock:
+        latest = fetch_one_dict("SELECT MAX(rated_at) AS latest FROM ratings")
+        watermark = None if full else get_watermark(WATERMARK_JOB)
+        since = watermark.date() if hasattr(watermark, "date") else watermark
+        frame = _load_ratings(since)
+        affinities = compute_affinities(frame)
+        user_ids = sorted(set(frame["user_id"].astype(int).tolist()) | set(_users_without_ratings()))
+        if user_ids:
+            _write_preferences(affinities, user_ids)
+        set_watermark(WATERMARK_JOB, latest["latest"] if latest else watermark)
+        return len(user_ids)
+
+
+def _learner_loop(interval_seconds: int):
+    last_full = time.monotonic()
+    while True:
+        full = time.monotonic() - last_full >= FULL_RELEARN_INTERVAL
+        try:
+            learn_preferences(full=full)
+        except Exception as exc:
+            learner_status.record_error(exc)
+        else:
+            learner_status.record_success()
+            if full:
+                last_full = time.monotonic()
+        time.sleep(interval_seconds)
+
+
+def start_preference_job(interval_seconds: int) -> bool:
+    """Запускает фоновое обучение предпочтений; первый проход выполняется сразу."""
+    global _learner_thread
+    if interval_seconds <= 0:
+        return False
+    if _learner_thread is not None and _learner_thread.is_alive():
+        return False
+    _learner_thread = threading.Thread(
+        target=_learner_loop,
+        args=(interval_seconds,),
+        name="preference-learner",
+        daemon=True,
+    )
+    _learner_thread.start()
+    return True
@@ -7,45 +7,43 @@ import pandas as pd
 from db import fetch_all_dicts, fetch_one_dict
 
 
+PROFILE_SQL = "SELECT user_id, location, age FROM users WHERE user_id = %s"
+
+PREFERENCES_SQL = """
+    SELECT preference_type, preference_key, preference_value
+    FROM user_preferences
+    WHERE user_id = %s
+    ORDER BY preference_type, preference_key
+"""
+
+RATINGS_SQL = """
+    SELECT
+        r.place_id,
+        ta.place_name,
+        ta.category,
+        ta.city,
+        ta.price,
+        ta.overall_rating,
+        r.rating,
+        r.rated_at
+    FROM ratings r
+    JOIN tourism_attractions ta ON ta.place_id = r.place_id
+    WHERE r.user_id = %s
+    ORDER BY r.rated_at DESC
+"""
+
+
 def get_user_profile(user_id: int) -> Optional[Dict]:
-    return fetch_one_dict(
-        "SELECT user_id, location, age FROM users WHERE user_id = %s",
-        (user_id,),
-    )
+    return fetch_one_dict(PROFILE_SQL, (user_id,))
 
 
 def get_user_preferences(user_id: int) -> pd.DataFrame:
-    rows = fetch_all_dicts(
-        """
-        SELECT preference_type, preference_key, preference_value
-        FROM user_preferences
-        WHERE user_id = %s
-        ORDER BY preference_type, preference_key
-        """,
-        (user_id,),
-    )
+    rows = fetch_all_dicts(PREFERENCES_SQL, (user_id,))
     return pd.DataFrame(rows)
 
 
 def get_user_ratings(user_id: int) -> pd.DataFrame:
-    rows = fetch_all_dicts(
-        """
-        SELECT
-            r.place_id,
-            ta.place_name,
-            ta.category,
-            ta.city,
-            ta.price,
-            ta.overall_rating,
-            r.rating,
-            r.rated_at
-        FROM ratings r
-        JOIN tourism_attractions ta ON ta.place_id = r.place_id
-        WHERE r.user_id = %s
-        ORDER BY r.rated_at DESC
-        """,
-        (user_id,),
-    )
+    rows = fetch_all_dicts(RATINGS_SQL, (user_id,))
     return pd.DataFrame(rows)
 
 
@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import get_settings
+from services.aggregates import ensure_aggregate_tables
+from services.change_tracking import tracked_transaction
+from services.job_status import job_status
+from services.ratings import write_ratings_batch
+from services.user_cache import user_cache
+
+
+MAX_ROW_ATTEMPTS = 3
+buffer_status = job_status("rating_buffer")
+
+@dataclass
+class PendingRating:
+    rating: Optional[float]
+    rated_at: date
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RatingBuffer:
+    """Буфер отложенной записи оценок.
+
+    Повторные изменения одной пары (user_id, place_id) схлопываются в последнее.
+    Каждое изменение сначала дописывается в локальный журнал, затем пачкой уходит
+    в MySQL по таймеру или при достижении порога; журнал процесса, завершившегося
+    без сброса, подхватывается при следующем запуске. Если пачка не записалась, строки
+    пишутся по одной; строка, не записавшаяся MAX_ROW_ATTEMPTS раз, уходит в dead-letter.
+    """
+
+    def __init__(self, journal_dir: str, flush_interval: float, flush_size: int):
+        self.journal_dir = Path(journal_dir)
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending: Dict[Tuple[int, int], PendingRating] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._journal_path = self.journal_dir / f"ratings-{os.getpid()}.jsonl"
+        self._dead_letter_path = self.journal_dir / "dead-letter.jsonl"
+        self._row_failures: Dict[Tuple[int, int], int] = {}
+        self._dead_keys: Set[Tuple[int, int]] = set()
+        self._journal = None
+        self._thread: Optional[threading.Thread] = None
+        self.flushed_rows = 0
+        self.flush_errors = 0
+        self.dead_letters = 0
+        self.last_error: Optional[str] = None
+
+    def start(self) -> bool:
+        """Восстанавливает незаписанные журналы и запускает фоновый сброс."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.journal_dir.mkdir(parents=True, exist_ok=True)
+            self._recover_journals()
+            self._thread = threading.Thread(target=self._flush_loop, name="rating-write-behind", daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+        return True
+
+    def _recover_journals(self):
+        for path in self.journal_dir.glob("ratings-*.jsonl"):
+            pid = int(path.stem.split("-", 1)[1])
+            if path != self._journal_path and _pid_alive(pid):
+                continue
+            for line in path.read_text(encoding="utf-8").splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._pending[(entry["user_id"], entry["place_id"])] = PendingRating(
+                    rating=entry["rating"], rated_at=date.fromisoformat(entry["rated_at"])
+                )
+            if path != self._journal_path:
+                path.unlink()
+        self._rewrite_journal()
+
+    def _rewrite_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+        tmp_path = self._journal_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            for (user_id, place_id), pending in self._pending.items():
+                handle.write(self._journal_line(user_id, place_id, pending))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_path, self._journal_path)
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _journal_line(user_id: int, place_id: int, pending: PendingRating) -> str:
+        return json.dumps(
+            {
+                "user_id": user_id,
+                "place_id": place_id,
+                "rating": pending.rating,
+                "rated_at": pending.rated_at.isoformat(),
+            }
+        ) + "\n"
+
+    def submit(self, user_id: int, place_id: int, rating: Optional[float]):
+        """Ставит оценку (rating=None — удаление) в буфер; запись в журнал до возврата."""
+        pending = PendingRating(rating=None if rating is None else float(rating), rated_at=date.today())
+        with self._lock:
+            if self._journal is None:
+                self.journal_dir.mkdir(parents=True, exist_ok=True)
+                self._rewrite_journal()
+            self._journal.write(self._journal_line(user_id, place_id, pending))
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._pending[(user_id, place_id)] = pending
+            size = len(self._pending)
+        if self._thread is None:
+            self.flush()
+        elif size >= self.flush_size:
+            self._wakeup.set()
+
+    def pending_for_user(self, user_id: int) -> Dict[int, Optional[float]]:
+        with self._lock:
+            return {
+                place_id: pending.rating
+                for (pending_user, place_id), pending in self._pending.items()
+                if pending_user == user_id
+            }
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def is_pending(self, user_id: int, place_id: int) -> bool:
+        with self._lock:
+            return (user_id, place_id) in self._pending
+
+    @staticmethod
+    def _write(changes: pd.DataFrame):
+        ensure_aggregate_tables()
+        with tracked_transaction("ratings", user_ids=changes["user_id"].tolist()) as cursor:
+            write_ratings_batch(cursor, changes)
+
+    def _write_rows(self, changes: pd.DataFrame) -> Tuple[Set[Tuple[int, int]], Set[Tuple[int, int]]]:
+        """Пишет строки по одной; возвращает записанные пары и пары, отправленные в dead-letter.
+
+        Если не записалась ни одна строка, вероятнее недоступна база, а не плохи строки:
+        попытки не засчитываются.
+        """
+        written, failed = set(), {}
+        for index in range(len(changes)):
+            row = changes.iloc[[index]]
+            key = (int(row["user_id"].iloc[0]), int(row["place_id"].iloc[0]))
+            try:
+                self._write(row)
+            except Exception as exc:
+                failed[key] = exc
+            else:
+                written.add(key)
+        dead = set()
+        if written or len(changes) == 1:
+            for key, exc in failed.items():
+                attempts = self._row_failures.get(key, 0) + 1
+                self._row_failures[key] = attempts
+                if attempts >= MAX_ROW_ATTEMPTS:
+                    dead.add(key)
+        for key in written | dead:
+            self._row_failures.pop(key, None)
+        if failed:
+            exc = next(iter(failed.values()))
+            self.flush_errors += 1
+            self.last_error = str(exc)
+            buffer_status.record_error(exc)
+        return written, dead
+
+    def _append_dead_letters(self, entries: List[str]):
+        with open(self._dead_letter_path, "a", encoding="utf-8") as handle:
+            handle.writelines(entries)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def is_dead_letter(self, user_id: int, place_id: int) -> bool:
+        return (user_id, place_id) in self._dead_keys
+
+    def flush(self) -> Set[Tuple[int, int]]:
+        """Записывает накопленные изменения одной транзакцией; возвращает записанные пары.
+
+        Если транзакция не прошла, строки пишутся по одной, и записанные фиксируются;
+        текст последней ошибки — в last_error, незаписанные строки остаются в буфере.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = dict(self._pending)
+            if not batch:
+                return set()
+            changes = pd.DataFrame(
+                [
+                    (user_id, place_id, np.nan if pending.rating is None else pending.rating, pending.rated_at)
+                    for (user_id, place_id), pending in batch.items()
+                ],
+                columns=["user_id", "place_id", "rating", "rated_at"],
+            )
+            try:
+                self._write(changes)
+            except Exception:
+                written, dead = self._write_rows(changes)
+            else:
+                written, dead = set(batch), set()
+                self._row_failures.clear()
+                buffer_status.record_success()
+            if not written and not dead:
+                return set()
+            for user_id in {user_id for user_id, _ in written}:
+                user_cache.invalidate_user(user_id, "ratings")
+            if dead:
+                self._append_dead_letters(
+                    [self._journal_line(user_id, place_id, batch[(user_id, place_id)]) for user_id, place_id in dead]
+                )
+                self.dead_letters += len(dead)
+                self._dead_keys |= dead
+            with self._lock:
+                for key in written | dead:
+                    if self._pending.get(key) is batch[key]:
+                        del self._pending[key]
+                self._rewrite_journal()
+            self.flushed_rows += len(written)
+            return written
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "pending": self.pending_count(),
+            "flushed_rows": self.flushed_rows,
+            "flush_errors": self.flush_errors,
+            "dead_letters": self.dead_letters,
+            "last_error": self.last_error,
+        }
+
+
+_settings = get_settings()
+rating_buffer = RatingBuffer(
+    journal_dir=_settings.rating_journal_dir,
+    flush_interval=_settings.rating_flush_interval,
+    flush_size=_settings.rating_flush_size,
+)
+
+
+def overlay_pending_ratings(user_id: int, ratings_df: pd.DataFrame, places: List[Dict]) -> pd.DataFrame:
+    """Накладывает еще не записанные изменения пользователя на его оценки из БД."""
+    pending = rating_buffer.pending_for_user(user_id)
+    if not pending:
+        return ratings_df
+    result = ratings_df.copy()
+    known = set()
+    if not result.empty:
+        deleted = [place_id for place_id, rating in pending.items() if rating is None]
+        result = result[~result["place_id"].isin(deleted)]
+        updated = result["place_id"].map(pending)
+        changed = updated.notna()
+        result["rating"] = pd.to_numeric(result["rating"], errors="coerce")
+        result.loc[changed, "rating"] = updated[changed]
+        result.loc[changed, "rated_at"] = date.today()
+        known = set(result["place_id"].tolist())
+    by_place = {place["place_id"]: place for place in places}
+    added = pd.DataFrame(
+        [
+            {
+                "place_id": place_id,
+                **{key: by_place.get(place_id, {}).get(key) for key in ("place_name", "category", "city")},
+                "rating": rating,
+                "rated_at": date.today(),
+            }
+            for place_id, rating in pending.items()
+            if rating is not None and place_id not in known
+        ]
+    )
+    if added.empty:
+        return result.reset_index(drop=True)
+    if result.empty:
+        return added
+    return pd.concat([added, result], ignore_index=True)
@@ -1,8 +1,14 @@
 from __future__ import annotations
 
-from typing import Dict, List
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
 
-from db import execute_query, fetch_all_dicts
+import pandas as pd
+
+from db import fetch_all_dicts
+from services.aggregates import apply_rating_delta, apply_rating_deltas, ensure_aggregate_tables
+from services.change_tracking import tracked_transaction
+from services.user_cache import user_cache
 
 
 def list_attractions() -> List[Dict]:
@@ -15,7 +21,93 @@ def list_attractions() -> List[Dict]:
     )
 
 
+def _lock_current_rating(cursor, user_id: int, place_id: int) -> Tuple[Optional[float], Any]:
+    """Текущая оценка и ее дата под блокировкой строки; (None, None), если оценки нет."""
+    cursor.execute(
+        "SELECT rating, rated_at FROM ratings WHERE user_id = %s AND place_id = %s FOR UPDATE",
+        (user_id, place_id),
+    )
+    row = cursor.fetchone()
+    return (row["rating"], row["rated_at"]) if row else (None, None)
+
+
+_BATCH_UPSERT_SQL = """
+    INSERT INTO ratings (user_id, place_id, rating, rated_at)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        rating = VALUES(rating),
+        rated_at = VALUES(rated_at)
+"""
+
+
+def write_ratings_batch(cursor, changes: pd.DataFrame) -> int:
+    """Пакетная запись оценок в открытой транзакции вместе с агрегатами.
+
+    Колонки changes: user_id, place_id, rating (NaN — удаление), rated_at.
+    Пары (user_id, place_id) должны быть уникальны.
+    """
+    if changes.empty:
+        return 0
+    changes = changes.astype({"user_id": "int64", "place_id": "int64"})
+    pairs = list(zip(changes["user_id"].tolist(), changes["place_id"].tolist()))
+    pair_placeholders = ", ".join(["(%s, %s)"] * len(pairs))
+    flat_pairs = [value for pair in pairs for value in pair]
+    cursor.execute(
+        f"""
+        SELECT user_id, place_id, rating, rated_at FROM ratings
+        WHERE (user_id, place_id) IN ({pair_placeholders})
+        FOR UPDATE
+        """,
+        flat_pairs,
+    )
+    current = pd.DataFrame(cursor.fetchall(), columns=["user_id", "place_id", "rating", "rated_at"]).rename(
+        columns={"rating": "old_rating", "rated_at": "old_rated_at"}
+    )
+    place_ids = sorted(set(changes["place_id"].tolist()))
+    cursor.execute(
+        f"""
+        SELECT place_id, city, category FROM tourism_attractions
+        WHERE place_id IN ({", ".join(["%s"] * len(place_ids))})
+        """,
+        place_ids,
+    )
+    places = pd.DataFrame(cursor.fetchall(), columns=["place_id", "city", "category"])
+
+    new_rating = pd.to_numeric(changes["rating"], errors="coerce")
+    rated_at = pd.to_datetime(changes["rated_at"], errors="coerce").where(new_rating.notna())
+    upserts = changes[new_rating.notna()]
+    if not upserts.empty:
+        cursor.executemany(
+            _BATCH_UPSERT_SQL,
+            list(
+                zip(
+                    upserts["user_id"].tolist(),
+                    upserts["place_id"].tolist(),
+                    new_rating[new_rating.notna()].tolist(),
+                    rated_at[new_rating.notna()].dt.date.tolist(),
+                )
+            ),
+        )
+    deletes = changes[new_rating.isna()]
+    if not deletes.empty:
+        cursor.execute(
+            f"DELETE FROM ratings WHERE (user_id, place_id) IN ({', '.join(['(%s, %s)'] * len(deletes))})",
+            [value for pair in zip(deletes["user_id"].tolist(), deletes["place_id"].tolist()) for value in pair],
+        )
+
+    deltas = (
+        changes[["user_id", "place_id"]]
+        .assign(new_rating=new_rating, rated_at=rated_at)
+        .merge(current.astype({"user_id": "int64", "place_id": "int64"}), on=["user_id", "place_id"], how="left")
+        .merge(places.astype({"place_id": "int64"}), on="place_id", how="left")
+    )
+    deltas = deltas[deltas["new_rating"].notna() | deltas["old_rating"].notna()]
+    apply_rating_deltas(cursor, deltas)
+    return len(changes)
+
+
 def upsert_rating(user_id: int, place_id: int, rating: float) -> int:
+    ensure_aggregate_tables()
     query = """
     INSERT INTO ratings (user_id, place_id, rating, rated_at)
     VALUES (%s, %s, %s, CURDATE())
@@ -23,12 +115,26 @@ def upsert_rating(user_id: int, place_id: int, rating: float) -> int:
         rating = VALUES(rating),
         rated_at = VALUES(rated_at)
     """
-    return execute_query(query, (user_id, place_id, rating))
+    with tracked_transaction("ratings", user_ids=(user_id,)) as cursor:
+        old_rating, old_rated_at = _lock_current_rating(cursor, user_id, place_id)
+        cursor.execute(query, (user_id, place_id, rating))
+        affected = cursor.rowcount
+        apply_rating_delta(cursor, user_id, place_id, old_rating, rating, date.today(), old_rated_at)
+    user_cache.invalidate_user(user_id, "ratings")
+    return affected
 
 
 def delete_rating(user_id: int, place_id: int) -> int:
-    return execute_query(
-        "DELETE FROM ratings WHERE user_id = %s AND place_id = %s",
-        (user_id, place_id),
-    )
-
+    ensure_aggregate_tables()
+    with tracked_transaction("ratings", user_ids=(user_id,)) as cursor:
+        old_rating, old_rated_at = _lock_current_rating(cursor, user_id, place_id)
+        if old_rating is None:
+            return 0
+        cursor.execute(
+            "DELETE FROM ratings WHERE user_id = %s AND place_id = %s",
+            (user_id, place_id),
+        )
+        affected = cursor.rowcount
+        apply_rating_delta(cursor, user_id, place_id, old_rating, None, old_rated_at=old_rated_at)
+    user_cache.invalidate_user(user_id, "ratings")
+    return affected
@@ -67,22 +67,18 @@ def _compute_category_scores(ratings_df: pd.DataFrame) -> Dict[str, float]:
 def build_fallback_recommendations(
     user_id: int, preference_vector: Dict[str, Dict[str, float]]
 ) -> pd.DataFrame:
-    past_ratings = fetch_all_dicts(
-        """
-        SELECT r.rating, ta.category, ta.place_id, ta.place_name, ta.city,
-               ta.overall_rating, ta.price
-        FROM ratings r
-        JOIN tourism_attractions ta ON ta.place_id = r.place_id
-        WHERE r.user_id = %s
-        """,
-        (user_id,),
-    )
-    ratings_df = pd.DataFrame(past_ratings)
-    cat_scores = (
-        preference_vector.get("category_preference")
-        or preference_vector.get("category")
-        or _compute_category_scores(ratings_df)
-    )
+    cat_scores = preference_vector.get("category_preference") or preference_vector.get("category")
+    if not cat_scores:
+        past_ratings = fetch_all_dicts(
+            """
+            SELECT r.rating, ta.category
+            FROM ratings r
+            JOIN tourism_attractions ta ON ta.place_id = r.place_id
+            WHERE r.user_id = %s
+            """,
+            (user_id,),
+        )
+        cat_scores = _compute_category_scores(pd.DataFrame(past_ratings))
 
     attractions = pd.DataFrame(
         fetch_all_dicts(
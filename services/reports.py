@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from services.analytics import (
+    get_analytics_bundle,
+    get_cohort_retention,
+    get_package_coverage,
+    get_price_segments,
+)
+from services.analytics_bundle import AnalyticsBundle
+
+
+MAX_CACHED_REPORTS = 3
+# Предел строк листа Excel вместе со строкой заголовка.
+XLSX_MAX_ROWS = 1_048_576
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="full-report")
+_reports: Dict[str, "ReportJob"] = {}
+_reports_lock = threading.Lock()
+
+
+@dataclass
+class ReportJob:
+    version: str
+    status: str = "running"
+    payload: Optional[bytes] = None
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.now)
+
+    @property
+    def file_name(self) -> str:
+        return f"analyst_report_{self.created_at:%Y%m%d_%H%M}.xlsx"
+
+
+@dataclass
+class _SheetSpec:
+    title: str
+    df: pd.DataFrame
+    chart: Optional[str] = None
+    category_column: Optional[str] = None
+    value_columns: Tuple[str, ...] = ()
+    chart_title: str = ""
+
+
+def _extra_frames() -> Dict[str, pd.DataFrame]:
+    """Данные отчета вне снимка аналитики: пакеты, ценовые сегменты и удержание когорт."""
+    retention = get_cohort_retention()
+    if not retention.empty:
+        retention = retention.reset_index()
+        retention.columns = [str(column) for column in retention.columns]
+    return {
+        "package_coverage": get_package_coverage(),
+        "price_segments": get_price_segments(),
+        "retention": retention,
+    }
+
+
+def _report_version(bundle: AnalyticsBundle, extra: Dict[str, pd.DataFrame]) -> str:
+    """Версия снимка дополняется хэшами остальных листов: версия снимка их не учитывает."""
+    digest = hashlib.sha1(bundle.version.encode())
+    for name, frame in sorted(extra.items()):
+        digest.update(name.encode())
+        digest.update(str(frame.shape).encode())
+        if not frame.empty:
+            digest.update(str(int(pd.util.hash_pandas_object(frame, index=False).sum())).encode())
+    return f"{bundle.version}-{digest.hexdigest()[:8]}"
+
+
+def _collect_sheets(bundle: AnalyticsBundle, extra: Dict[str, pd.DataFrame]) -> List[_SheetSpec]:
+    return [
+        _SheetSpec(
+            title="Динамика",
+            df=bundle.ratings_timeline,
+            chart="line",
+            category_column="rated_date",
+            value_columns=("avg_rating",),
+            chart_title="Средняя оценка пользователей по дням",
+        ),
+        _SheetSpec(
+            title="Категории",
+            df=bundle.ratings_by_category,
+            chart="bar",
+            category_column="category",
+            value_columns=("rating_count",),
+            chart_title="Количество оценок по категориям",
+        ),
+        _SheetSpec(
+            title="Города",
+            df=bundle.ratings_by_city,
+            chart="bar",
+            category_column="city",
+            value_columns=("rating_count",),
+            chart_title="Количество оценок по городам",
+        ),
+        _SheetSpec(
+            title="Популярные места",
+            df=bundle.popular_places.head(50),
+            chart="bar",
+            category_column="place_name",
+            value_columns=("rating_count",),
+            chart_title="ТОП мест по количеству оценок",
+        ),
+        _SheetSpec(title="Активность пользователей", df=bundle.user_activity),
+        _SheetSpec(
+            title="Покрытие пакетами",
+            df=extra["package_coverage"],
+            chart="bar",
+            category_column="city",
+            value_columns=("package_count",),
+            chart_title="Пакеты по городам",
+        ),
+        _SheetSpec(
+            title="Ценовые сегменты",
+            df=extra["price_segments"],
+            chart="pie",
+            category_column="price_segment",
+            value_columns=("attractions",),
+            chart_title="Распределение объектов по сегментам",
+        ),
+        _SheetSpec(title="Удержание когорт", df=extra["retention"]),
+    ]
+
+
+def _add_chart(worksheet, spec: _SheetSpec, rows: int):
+    from openpyxl.chart import BarChart, LineChart, PieChart, Reference
+    from openpyxl.utils import get_column_letter
+
+    columns = list(spec.df.columns)
+    category_idx = columns.index(spec.category_column) + 1
+    chart = {"line": LineChart, "bar": BarChart, "pie": PieChart}[spec.chart]()
+    chart.title = spec.chart_title
+    for value_column in spec.value_columns:
+        value_idx = columns.index(value_column) + 1
+        data = Reference(worksheet, min_col=value_idx, min_row=1, max_row=rows + 1)
+        chart.add_data(data, titles_from_data=True)
+    chart.set_categories(Reference(worksheet, min_col=category_idx, min_row=2, max_row=rows + 1))
+    chart.width, chart.height = 24, 12
+    worksheet.add_chart(chart, f"{get_column_letter(len(columns) + 2)}2")
+
+
+def _write_workbook(sheets: List[_SheetSpec], localize: Callable[[pd.DataFrame], pd.DataFrame]) -> bytes:
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        for spec in sheets:
+            if spec.df.empty:
+                continue
+            df = spec.df.head(XLSX_MAX_ROWS - 1)
+            localize(df).to_excel(writer, index=False, sheet_name=spec.title)
+            if spec.chart:
+                _add_chart(writer.sheets[spec.title], spec, len(df))
+        if not writer.sheets:
+            pd.DataFrame({"Сообщение": ["Нет данных"]}).to_excel(writer, index=False, sheet_name="Отчёт")
+    return output.getvalue()
+
+
+def _build(job: ReportJob, bundle: AnalyticsBundle, extra: Dict[str, pd.DataFrame], localize):
+    try:
+        job.payload = _write_workbook(_collect_sheets(bundle, extra), localize)
+    except Exception as exc:
+        job.status = "error"
+        job.error = str(exc)
+    else:
+        job.status = "done"
+
+
+def request_full_report(localize: Callable[[pd.DataFrame], pd.DataFrame] = lambda df: df) -> ReportJob:
+    """Возвращает отчет для текущей версии данных: готовый из кэша или строящийся в фоне."""
+    bundle = get_analytics_bundle()
+    extra = _extra_frames()
+    version = _report_version(bundle, extra)
+    with _reports_lock:
+        job = _reports.get(version)
+        if job is not None and job.status != "error":
+            return job
+        job = ReportJob(version=version)
+        _reports.pop(version, None)
+        _reports[version] = job
+        # Вытесняются самые старые готовые отчеты; строящиеся остаются, пока не завершатся.
+        finished = [key for key, cached in _reports.items() if cached.status != "running"]
+        for key in finished[: max(0, len(_reports) - MAX_CACHED_REPORTS)]:
+            del _reports[key]
+    _executor.submit(_build, job, bundle, extra, localize)
+    return job
+
+
+def get_report(version: str) -> Optional[ReportJob]:
+    with _reports_lock:
+        return _reports.get(version)
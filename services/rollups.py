@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import pandas as pd
+
+from db import ensure_index, execute_query, fetch_all_dicts, fetch_one_dict, transaction
+from services.job_status import job_status
+from services.watermarks import get_watermark, set_watermark
+
+
+GRANULARITIES = ("day", "week", "month")
+GRANULARITY_LABELS = {"day": "День", "week": "Неделя", "month": "Месяц"}
+WATERMARK_JOB = "rating_rollups"
+FULL_REBUILD_INTERVAL = 24 * 3600
+
+_BUCKET_EXPRESSIONS = {
+    "day": "DATE(rated_at)",
+    "week": "DATE_SUB(DATE(rated_at), INTERVAL WEEKDAY(rated_at) DAY)",
+    "month": "DATE_SUB(DATE(rated_at), INTERVAL DAYOFMONTH(rated_at) - 1 DAY)",
+}
+
+_ready = False
+_ready_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_rollup_thread: Optional[threading.Thread] = None
+_initial_thread: Optional[threading.Thread] = None
+_built = False
+rollup_status = job_status("rating_rollups")
+
+
+def bucket_start(value: date | datetime, granularity: str) -> date:
+    day = value.date() if isinstance(value, datetime) else value
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def ensure_rollup_table():
+    """Создает таблицу бакетов; индекс по rated_at и первая сборка идут в фоне.
+
+    До ее окончания read_rollups считает бакеты прямым запросом к ratings.
+    """
+    global _ready, _built
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        execute_query(
+            """
+            CREATE TABLE IF NOT EXISTS rating_rollups (
+                granularity VARCHAR(8) NOT NULL,
+                bucket_start DATE NOT NULL,
+                rating_count INT NOT NULL,
+                rating_sum DOUBLE NOT NULL,
+                distinct_users INT NOT NULL,
+                PRIMARY KEY (granularity, bucket_start)
+            )
+            """
+        )
+        _built = get_watermark(WATERMARK_JOB) is not None
+        if not _built:
+            _start_initial_build()
+        _ready = True
+
+
+def _run_refresh(full: bool = False) -> bool:
+    global _built
+    try:
+        refresh_rollups(full=full)
+    except Exception as exc:
+        rollup_status.record_error(exc)
+        return False
+    rollup_status.record_success()
+    _built = True
+    return True
+
+
+def _initial_build():
+    try:
+        ensure_index("ratings", "idx_ratings_rated_at", "rated_at")
+    except Exception as exc:
+        rollup_status.record_error(exc)
+    _run_refresh(full=True)
+
+
+def _start_initial_build():
+    global _initial_thread
+    if _initial_thread is not None and _initial_thread.is_alive():
+        return
+    _initial_thread = threading.Thread(target=_initial_build, name="rating-rollups-initial", daemon=True)
+    _initial_thread.start()
+
+
+def refresh_rollups(full: bool = False) -> int:
+    """Досчитывает бакеты после отметки rated_at; возвращает число обновленных бакетов.
+
+    Бакеты, в которые попадает отметка, пересчитываются целиком: rated_at хранит дату,
+    и новые оценки того же дня имеют то же значение. Изменения и удаления старых оценок
+    учитываются полной перестройкой (full=True), которую фоновая задача делает раз в сутки.
+    """
+    with _refresh_lock:
+        latest = fetch_one_dict("SELECT MAX(rated_at) AS latest FROM ratings")
+        latest_rated_at = latest["latest"] if latest else None
+        watermark = None if full else get_watermark(WATERMARK_JOB)
+        updated = 0
+        with transaction() as cursor:
+            for granularity in GRANULARITIES:
+                expression = _BUCKET_EXPRESSIONS[granularity]
+                if watermark is None:
+                    cursor.execute("DELETE FROM rating_rollups WHERE granularity = %s", (granularity,))
+                    where, params = "WHERE rated_at IS NOT NULL", (granularity,)
+                else:
+                    since = bucket_start(watermark, granularity)
+                    cursor.execute(
+                        "DELETE FROM rating_rollups WHERE granularity = %s AND bucket_start >= %s",
+                        (granularity, since),
+                    )
+                    where, params = "WHERE rated_at >= %s", (granularity, since)
+                cursor.execute(
+                    f"""
+                    INSERT INTO rating_rollups
+                        (granularity, bucket_start, rating_count, rating_sum, distinct_users)
+                    SELECT
+                        %s,
+                        {expression} AS bucket,
+                        COUNT(*),
+                        SUM(rating),
+                        COUNT(DISTINCT user_id)
+                    FROM ratings
+                    {where}
+                    GROUP BY bucket
+                    """,
+                    params,
+                )
+                updated += cursor.rowcount
+            set_watermark(WATERMARK_JOB, latest_rated_at, cursor=cursor)
+    return updated
+
+
+def _rollup_loop(interval_seconds: int):
+    last_full = time.monotonic()
+    while True:
+        time.sleep(interval_seconds)
+        full = time.monotonic() - last_full >= FULL_REBUILD_INTERVAL
+        if _run_refresh(full=full) and full:
+            last_full = time.monotonic()
+
+
+def start_rollup_job(interval_seconds: int) -> bool:
+    global _rollup_thread
+    if interval_seconds <= 0:
+        return False
+    if _rollup_thread is not None and _rollup_thread.is_alive():
+        return False
+    _rollup_thread = threading.Thread(
+        target=_rollup_loop,
+        args=(interval_seconds,),
+        name="rating-rollups",
+        daemon=True,
+    )
+    _rollup_thread.start()
+    return True
+
+
+def read_rollups(
+    granularity: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: Optional[int] = None,
+) -> pd.DataFrame:
+    """Читает бакеты за период; при limit возвращает последние limit бакетов."""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Неизвестная детализация: {granularity}")
+    ensure_rollup_table()
+    if not _built:
+        return _live_rollups(granularity, start, end, limit)
+    filters = ["granularity = %s"]
+    params: list = [granularity]
+    if start is not None:
+        filters.append("bucket_start >= %s")
+        params.append(bucket_start(start, granularity))
+    if end is not None:
+        filters.append("bucket_start <= %s")
+        params.append(end)
+    rows = fetch_all_dicts(
+        f"""
+        SELECT
+            bucket_start AS rated_date,
+            rating_sum / rating_count AS avg_rating,
+            rating_count,
+            distinct_users
+        FROM rating_rollups
+        WHERE {" AND ".join(filters)}
+        ORDER BY bucket_start DESC
+        {"LIMIT %s" if limit else ""}
+        """,
+        tuple(params + [limit] if limit else params),
+    )
+    return _sorted_frame(rows)
+
+
+def _live_rollups(
+    granularity: str,
+    start: Optional[date],
+    end: Optional[date],
+    limit: Optional[int],
+) -> pd.DataFrame:
+    """Те же бакеты прямым запросом к ratings, пока таблица бакетов не построена."""
+    expression = _BUCKET_EXPRESSIONS[granularity]
+    filters = ["rated_at IS NOT NULL"]
+    params: list = []
+    if start is not None:
+        filters.append("rated_at >= %s")
+        params.append(bucket_start(start, granularity))
+    if end is not None:
+        filters.append(f"{expression} <= %s")
+        params.append(end)
+    rows = fetch_all_dicts(
+        f"""
+        SELECT
+            {expression} AS rated_date,
+            SUM(rating) / COUNT(*) AS avg_rating,
+            COUNT(*) AS rating_count,
+            COUNT(DISTINCT user_id) AS distinct_users
+        FROM ratings
+        WHERE {" AND ".join(filters)}
+        GROUP BY rated_date
+        ORDER BY rated_date DESC
+        {"LIMIT %s" if limit else ""}
+        """,
+        tuple(params + [limit] if limit else params),
+    )
+    df = _sorted_frame(rows)
+    if not df.empty:
+        df["rated_date"] = pd.to_datetime(df["rated_date"]).dt.date
+    return df
+
+
+def _sorted_frame(rows) -> pd.DataFrame:
+    df = pd.DataFrame(rows)
+    if not df.empty:
+        df.sort_values("rated_date", inplace=True, ignore_index=True)
+    return df
@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import json
+import math
+import random
+import threading
+import time
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from db import execute_query, fetch_all_dicts, fetch_columns, fetch_one_dict, transaction
+from services.job_status import job_status
+from services.watermarks import get_watermark, set_watermark
+
+
+HLL_PRECISION = 12
+KLL_K = 200
+SKETCH_DIMENSIONS = ("city", "category", "all")
+WATERMARK_JOB = "rating_sketches"
+ALL_KEY = "*"
+FULL_REBUILD_INTERVAL = 24 * 3600
+
+_ready = False
+_ready_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_sketch_thread: Optional[threading.Thread] = None
+_initial_thread: Optional[threading.Thread] = None
+sketch_status = job_status("rating_sketches")
+
+
+def _splitmix64(values: np.ndarray) -> np.ndarray:
+    z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class HyperLogLog:
+    """Оценка числа уникальных значений.
+
+    Стандартная ошибка 1.04 / sqrt(2^precision): при precision=12 (4 КБ регистров)
+    около 1.6%, то есть в 95% случаев оценка отличается от точной не более чем на ~3.3%.
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.registers = (
+            registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+        )
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add_many(self, values: Iterable[int]):
+        hashed = _splitmix64(np.asarray(values, dtype=np.int64).view(np.uint64))
+        if not len(hashed):
+            return
+        tail_bits = 64 - self.precision
+        index = (hashed >> np.uint64(tail_bits)).astype(np.int64)
+        remainder = hashed & np.uint64((1 << tail_bits) - 1)
+        bit_length = np.zeros(len(remainder), dtype=np.int64)
+        nonzero = remainder > 0
+        bit_length[nonzero] = np.floor(np.log2(remainder[nonzero].astype(np.float64))).astype(np.int64) + 1
+        rank = (tail_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return float(raw)
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.precision]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "HyperLogLog":
+        return cls(payload[0], np.frombuffer(payload[1:], dtype=np.uint8).copy())
+
+
+class KLLSketch:
+    """Квантильный скетч KLL.
+
+    Ошибка по рангу около 1.65 / k: при k=200 квантиль, возвращенный для уровня q,
+    имеет истинный ранг в пределах q ± 0.01 с высокой вероятностью. Память O(k).
+    """
+
+    def __init__(self, k: int = KLL_K, levels: Optional[List[List[float]]] = None, n: int = 0, seed: int = 0):
+        self.k = k
+        self.levels: List[List[float]] = levels or [[]]
+        self.n = n
+        self._rng = random.Random(seed)
+
+    @property
+    def rank_error(self) -> float:
+        return 1.65 / self.k
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def _size(self) -> int:
+        return sum(len(level) for level in self.levels)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def _compress(self):
+        while self._size() > self._max_size():
+            for level, items in enumerate(self.levels):
+                if len(items) >= self._capacity(level):
+                    if level + 1 == len(self.levels):
+                        self.levels.append([])
+                    items.sort()
+                    # При нечетной длине один элемент остается на уровне: иначе сжатие
+                    # теряло бы или добавляло половину его веса.
+                    kept = [items.pop(self._rng.randrange(len(items)))] if len(items) % 2 else []
+                    offset = self._rng.randint(0, 1)
+                    self.levels[level + 1].extend(items[offset::2])
+                    self.levels[level] = kept
+                    break
+
+    def add_many(self, values: Iterable[float]):
+        batch = [float(v) for v in values if v is not None and not math.isnan(v)]
+        step = max(1, self.k)
+        for start in range(0, len(batch), step):
+            chunk = batch[start : start + step]
+            self.levels[0].extend(chunk)
+            self.n += len(chunk)
+            self._compress()
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantiles(self, fractions: Sequence[float]) -> List[Optional[float]]:
+        weighted = sorted(
+            (value, 1 << level) for level, items in enumerate(self.levels) for value in items
+        )
+        if not weighted:
+            return [None] * len(fractions)
+        values = np.array([value for value, _ in weighted])
+        cumulative = np.cumsum([weight for _, weight in weighted])
+        total = cumulative[-1]
+        positions = np.searchsorted(cumulative, [fraction * total for fraction in fractions], side="left")
+        return [float(values[min(pos, len(values) - 1)]) for pos in positions]
+
+    def to_json(self) -> str:
+        return json.dumps({"k": self.k, "n": self.n, "levels": self.levels})
+
+    @classmethod
+    def from_json(cls, payload: str) -> "KLLSketch":
+        data = json.loads(payload)
+        return cls(k=data["k"], levels=data["levels"], n=data["n"])
+
+
+def ensure_sketch_table():
+    """Создает таблицу скетчей; первая полная сборка идет в фоне, до нее данных нет."""
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        execute_query(
+            """
+            CREATE TABLE IF NOT EXISTS rating_sketches (
+                dimension VARCHAR(16) NOT NULL,
+                dim_key VARCHAR(255) NOT NULL,
+                day DATE NOT NULL,
+                rating_count INT NOT NULL,
+                users_hll VARBINARY(4097) NOT NULL,
+                ratings_kll MEDIUMTEXT NOT NULL,
+                PRIMARY KEY (dimension, day, dim_key)
+            )
+            """
+        )
+        if get_watermark(WATERMARK_JOB) is None:
+            _start_initial_build()
+        _ready = True
+
+
+def _run_refresh(full: bool = False, if_missing: bool = False) -> bool:
+    try:
+        refresh_sketches(full=full, if_missing=if_missing)
+    except Exception as exc:
+        sketch_status.record_error(exc)
+        return False
+    sketch_status.record_success()
+    return True
+
+
+def _start_initial_build():
+    global _initial_thread
+    if _initial_thread is not None and _initial_thread.is_alive():
+        return
+    _initial_thread = threading.Thread(
+        target=_run_refresh,
+        kwargs={"full": True, "if_missing": True},
+        name="rating-sketches-initial",
+        daemon=True,
+    )
+    _initial_thread.start()
+
+
+def _build_day_sketches(frame: pd.DataFrame) -> List[Tuple]:
+    rows = []
+    frame = frame.assign(**{"all": ALL_KEY})
+    for dimension in SKETCH_DIMENSIONS:
+        scoped = frame.dropna(subset=[dimension])
+        for (key, day), group in scoped.groupby([dimension, "day"], sort=False):
+            hll = HyperLogLog()
+            hll.add_many(group["user_id"].to_numpy())
+            kll = KLLSketch()
+            kll.add_many(group["rating"].to_numpy())
+            rows.append((dimension, str(key), day, len(group), hll.to_bytes(), kll.to_json()))
+    return rows
+
+
+def refresh_sketches(full: bool = False, if_missing: bool = False) -> int:
+    """Перестраивает дневные скетчи начиная с дня отметки rated_at; возвращает число строк.
+
+    Скетчи не поддерживают вычитание, поэтому день отметки пересобирается целиком, а правки
+    и удаления старых оценок учитываются полной перестройкой (full=True), которую фоновая
+    задача делает раз в сутки. if_missing=True пропускает сборку, если скетчи уже построены.
+    """
+    with _refresh_lock:
+        if if_missing and get_watermark(WATERMARK_JOB) is not None:
+            return 0
+        watermark = None if full else get_watermark(WATERMARK_JOB)
+        since = watermark.date() if hasattr(watermark, "date") else watermark
+        where, params = ("WHERE r.rated_at >= %s", (since,)) if since else ("WHERE r.rated_at IS NOT NULL", ())
+        columns, records = fetch_columns(
+            f"""
+            SELECT r.user_id, r.rating, DATE(r.rated_at) AS day, ta.city, ta.category
+            FROM ratings r
+            LEFT JOIN tourism_attractions ta ON ta.place_id = r.place_id
+            {where}
+            """,
+            params,
+        )
+        frame = pd.DataFrame.from_records(
+            records, columns=columns or ["user_id", "rating", "day", "city", "category"]
+        )
+        frame["rating"] = pd.to_numeric(frame["rating"], errors="coerce")
+        rows = _build_day_sketches(frame)
+        latest = fetch_one_dict("SELECT MAX(rated_at) AS latest FROM ratings")
+        with transaction() as cursor:
+            if since is None:
+                cursor.execute("DELETE FROM rating_sketches")
+            else:
+                cursor.execute("DELETE FROM rating_sketches WHERE day >= %s", (since,))
+            if rows:
+                cursor.executemany(
+                    """
+                    INSERT INTO rating_sketches
+                        (dimension, dim_key, day, rating_count, users_hll, ratings_kll)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    """,
+                    rows,
+                )
+            set_watermark(WATERMARK_JOB, latest["latest"] if latest else None, cursor=cursor)
+        return len(rows)
+
+
+def load_merged_sketches(
+    dimension: str, start: Optional[date] = None, end: Optional[date] = None
+) -> Dict[str, Tuple[int, HyperLogLog, KLLSketch]]:
+    """Сливает дневные скетчи за период: по одному HLL и KLL на значение измерения."""
+    if dimension not in SKETCH_DIMENSIONS:
+        raise ValueError(f"Неизвестное измерение: {dimension}")
+    ensure_sketch_table()
+    filters = ["dimension = %s"]
+    params: list = [dimension]
+    if start is not None:
+        filters.append("day >= %s")
+        params.append(start)
+    if end is not None:
+        filters.append("day <= %s")
+        params.append(end)
+    merged: Dict[str, Tuple[int, HyperLogLog, KLLSketch]] = {}
+    for row in fetch_all_dicts(
+        f"""
+        SELECT dim_key, rating_count, users_hll, ratings_kll
+        FROM rating_sketches
+        WHERE {" AND ".join(filters)}
+        """,
+        tuple(params),
+    ):
+        hll = HyperLogLog.from_bytes(bytes(row["users_hll"]))
+        kll = KLLSketch.from_json(row["ratings_kll"])
+        if row["dim_key"] in merged:
+            count, merged_hll, merged_kll = merged[row["dim_key"]]
+            merged[row["dim_key"]] = (count + row["rating_count"], merged_hll.merge(hll), merged_kll.merge(kll))
+        else:
+            merged[row["dim_key"]] = (row["rating_count"], hll, kll)
+    return merged
+
+
+def _sketch_loop(interval_seconds: int):
+    last_full = time.monotonic()
+    while True:
+        time.sleep(interval_seconds)
+        full = time.monotonic() - last_full >= FULL_REBUILD_INTERVAL
+        if _run_refresh(full=full) and full:
+            last_full = time.monotonic()
+
+
+def start_sketch_job(interval_seconds: int) -> bool:
+    global _sketch_thread
+    if interval_seconds <= 0:
+        return False
+    if _sketch_thread is not None and _sketch_thread.is_alive():
+        return False
+    _sketch_thread = threading.Thread(
+        target=_sketch_loop,
+        args=(interval_seconds,),
+        name="rating-sketches",
+        daemon=True,
+    )
+    _sketch_thread.start()
+    return True
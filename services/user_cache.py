@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import copy
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Set, Tuple
+
+import pandas as pd
+
+from config import get_settings
+
+
+@dataclass
+class _UserEntry:
+    value: Any
+    size: int
+    stored_at: float
+
+
+def estimate_size(value: Any) -> int:
+    """Оценка занимаемой памяти в байтах."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+def _detach(value: Any) -> Any:
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    return copy.deepcopy(value)
+
+
+class UserCache:
+    """LRU-кэш пользовательских данных с ограничением по суммарному объему.
+
+    Ключ — (имя набора, user_id). При превышении лимита вытесняются самые давно
+    использованные записи; запись пользователя сбрасывается точечно.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, int], _UserEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        # Поколения и счетчики загрузок есть только у пользователей с загрузкой в процессе:
+        # по ним отбрасывается результат, устаревший из-за сброса во время загрузки.
+        self._generation: Dict[int, int] = {}
+        self._loading: Dict[int, int] = {}
+        self._epoch = 0
+        self._dependents: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, name: str, user_id: int, loader):
+        key = (name, user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.stored_at < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _detach(entry.value)
+            self.misses += 1
+            generation = self._generation.setdefault(user_id, 0)
+            epoch = self._epoch
+            self._loading[user_id] = self._loading.get(user_id, 0) + 1
+        try:
+            value = loader()
+        except BaseException:
+            with self._lock:
+                self._finish_load(user_id)
+            raise
+        size = estimate_size(value)
+        with self._lock:
+            fresh = self._epoch == epoch and self._generation.get(user_id) == generation
+            self._finish_load(user_id)
+            if fresh and size <= self.max_bytes:
+                self._drop(key)
+                self._entries[key] = _UserEntry(value=value, size=size, stored_at=time.monotonic())
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    self._bytes -= self._entries.popitem(last=False)[1].size
+                    self.evictions += 1
+        return _detach(value)
+
+    def _finish_load(self, user_id: int):
+        remaining = self._loading.get(user_id, 0) - 1
+        if remaining > 0:
+            self._loading[user_id] = remaining
+        else:
+            self._loading.pop(user_id, None)
+            self._generation.pop(user_id, None)
+
+    def _bump(self, user_id: int):
+        if user_id in self._generation:
+            self._generation[user_id] += 1
+
+    def _drop(self, key: Tuple[str, int]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def register_dependent(self, name: str, *sources: str):
+        """Набор name собирается из sources: сброс любого из них сбрасывает и его."""
+        for source in sources:
+            self._dependents.setdefault(source, set()).add(name)
+
+    def _expand(self, names) -> Set[str]:
+        return set(names).union(*(self._dependents.get(name, ()) for name in names))
+
+    def invalidate_user(self, user_id: int, *names: str):
+        """Сбрасывает наборы пользователя (все, если имена не заданы)."""
+        names = self._expand(names)
+        with self._lock:
+            self._bump(user_id)
+            for key in [k for k in self._entries if k[1] == user_id and (not names or k[0] in names)]:
+                self._drop(key)
+
+    def invalidate_names(self, *names: str):
+        """Сбрасывает наборы у всех пользователей, например после записи из другого процесса."""
+        names = self._expand(names)
+        with self._lock:
+            for user_id in list(self._generation):
+                self._bump(user_id)
+            for key in [k for k in self._entries if k[0] in names]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            # Загрузки, начатые до очистки, не сохранят результат: их эпоха устарела.
+            self._epoch += 1
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "users": len({user_id for _, user_id in self._entries}),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+_settings = get_settings()
+user_cache = UserCache(
+    max_bytes=_settings.user_cache_max_mb * 1024 * 1024,
+    ttl=_settings.user_cache_ttl,
+)
+
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import pandas as pd
+
+from db import fetch_result_sets
+from services.job_status import job_status
+from services.preferences import (
+    PREFERENCES_SQL,
+    PROFILE_SQL,
+    RATINGS_SQL,
+    build_preference_vector,
+)
+from services.user_cache import user_cache
+
+
+@dataclass
+class UserContext:
+    user_id: int
+    profile: Optional[Dict]
+    preferences: pd.DataFrame
+    ratings: pd.DataFrame
+    preference_vector: Dict[str, Dict[str, float]]
+
+
+user_cache.register_dependent("context", "profile", "preferences", "ratings")
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="user-context")
+_inflight: Dict[int, Future] = {}
+_inflight_lock = threading.Lock()
+prefetch_status = job_status("user_context_prefetch")
+
+
+def load_user_context(user_id: int) -> UserContext:
+    """Профиль, предпочтения и оценки одним multi-statement запросом."""
+    profile_rows, preference_rows, rating_rows = fetch_result_sets(
+        (PROFILE_SQL, PREFERENCES_SQL, RATINGS_SQL), (user_id, user_id, user_id)
+    )
+    preferences = pd.DataFrame(preference_rows)
+    return UserContext(
+        user_id=user_id,
+        profile=profile_rows[0] if profile_rows else None,
+        preferences=preferences,
+        ratings=pd.DataFrame(rating_rows),
+        preference_vector=build_preference_vector(preferences),
+    )
+
+
+def get_user_context(user_id: int) -> UserContext:
+    """Контекст из кэша; если идет фоновая предзагрузка — дожидается ее."""
+    with _inflight_lock:
+        future = _inflight.get(user_id)
+    if future is not None:
+        # Ошибку предзагрузки уже записал _prefetch_done; контекст загрузится заново ниже.
+        try:
+            future.result()
+        except Exception:
+            pass
+    return user_cache.get_or_load("context", user_id, lambda: load_user_context(user_id))
+
+
+def prefetch_user_context(user_id: int):
+    """Начинает загрузку контекста в фоне сразу после успешного входа."""
+    with _inflight_lock:
+        current = _inflight.get(user_id)
+        if current is not None and not current.done():
+            return
+        future = _inflight[user_id] = _executor.submit(
+            user_cache.get_or_load, "context", user_id, lambda: load_user_context(user_id)
+        )
+    future.add_done_callback(lambda done: _prefetch_done(user_id, done))
+
+
+def _prefetch_done(user_id: int, future: Future):
+    with _inflight_lock:
+        if _inflight.get(user_id) is future:
+            del _inflight[user_id]
+    exc = future.exception()
+    if exc is not None:
+        prefetch_status.record_error(exc)
+    else:
+        prefetch_status.record_success()
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+from db import execute_query, fetch_one_dict
+
+
+_ready = False
+
+
+def ensure_watermark_table():
+    global _ready
+    if _ready:
+        return
+    execute_query(
+        """
+        CREATE TABLE IF NOT EXISTS job_watermarks (
+            job_name VARCHAR(64) PRIMARY KEY,
+            watermark DATETIME NULL,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                ON UPDATE CURRENT_TIMESTAMP
+        )
+        """
+    )
+    _ready = True
+
+
+def get_watermark(job_name: str) -> Optional[datetime]:
+    """Возвращает отметку rated_at, до которой фоновая задача уже обработала данные."""
+    ensure_watermark_table()
+    row = fetch_one_dict("SELECT watermark FROM job_watermarks WHERE job_name = %s", (job_name,))
+    return row["watermark"] if row else None
+
+
+def set_watermark(job_name: str, watermark: Optional[datetime], cursor=None):
+    ensure_watermark_table()
+    query = """
+        INSERT INTO job_watermarks (job_name, watermark)
+        VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE watermark = VALUES(watermark)
+    """
+    if cursor is not None:
+        cursor.execute(query, (job_name, watermark))
+    else:
+        execute_query(query, (job_name, watermark))
+
+
+def rewind_watermark(job_name: str, watermark: Optional[datetime], cursor=None):
+    """Сдвигает отметку назад (None — полная перестройка), чтобы задача пересчитала старые данные."""
+    ensure_watermark_table()
+    query = """
+        UPDATE job_watermarks
+        SET watermark = CASE WHEN %s IS NULL THEN NULL ELSE LEAST(watermark, %s) END
+        WHERE job_name = %s
+    """
+    params = (watermark, watermark, job_name)
+    if cursor is not None:
+        cursor.execute(query, params)
+    else:
+        execute_query(query, params)
@@ -0,0 +1,201 @@
+from datetime import date, timedelta
+
+import pytest
+
+from db import (
+    column_names,
+    create_backend,
+    execute_query,
+    fetch_all_dicts,
+    fetch_one_dict,
+    iter_row_chunks,
+    transaction,
+    use_backend,
+)
+from db_embedded import EmbeddedError, translate
+
+
+@pytest.fixture
+def sqlite_db():
+    backend = create_backend("sqlite", ":memory:")
+    with use_backend(backend):
+        execute_query(
+            """
+            CREATE TABLE tourism_attractions (
+                place_id INT PRIMARY KEY,
+                place_name VARCHAR(255),
+                category VARCHAR(255),
+                overall_rating DOUBLE
+            )
+            """
+        )
+        execute_query(
+            """
+            CREATE TABLE user_preferences (
+                user_id INT NOT NULL,
+                preference_type VARCHAR(64) NOT NULL,
+                preference_key VARCHAR(255) NOT NULL,
+                preference_value DOUBLE,
+                PRIMARY KEY (user_id, preference_type, preference_key)
+            )
+            """
+        )
+        execute_query(
+            """
+            CREATE TABLE ratings (
+                user_id INT NOT NULL,
+                place_id INT NOT NULL,
+                rating INT,
+                rated_at DATE,
+                PRIMARY KEY (user_id, place_id)
+            )
+            """
+        )
+        execute_query("CREATE TABLE counters (name VARCHAR(64) PRIMARY KEY, value INT NOT NULL)")
+        with transaction() as cursor:
+            cursor.executemany(
+                "INSERT INTO tourism_attractions VALUES (%s, %s, %s, %s)",
+                [(1, "Monas", "Budaya", 4.5), (2, "Ancol", "Taman_Hiburan", 4.0), (3, "Kota Tua", "Budaya", 4.2)],
+            )
+        yield backend
+
+
+def test_upsert_updates_with_values_reference(sqlite_db):
+    query = """
+        INSERT INTO counters (name, value) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+    """
+    execute_query(query, ("ratings", 2))
+    execute_query(query, ("ratings", 3))
+    assert fetch_one_dict("SELECT value FROM counters WHERE name = %s", ("ratings",))["value"] == 5
+
+
+def test_insert_select_upsert(sqlite_db):
+    for _ in range(2):
+        execute_query(
+            """
+            INSERT INTO counters (name, value)
+            SELECT category, COUNT(*) FROM tourism_attractions GROUP BY category
+            ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+            """
+        )
+    rows = {row["name"]: row["value"] for row in fetch_all_dicts("SELECT name, value FROM counters")}
+    assert rows == {"Budaya": 4, "Taman_Hiburan": 2}
+
+
+def test_insert_ignore_keeps_existing_row(sqlite_db):
+    execute_query("INSERT INTO counters (name, value) VALUES ('a', 1)")
+    execute_query("INSERT IGNORE INTO counters (name, value) VALUES ('a', 7)")
+    assert fetch_one_dict("SELECT value FROM counters WHERE name = 'a'")["value"] == 1
+
+
+def test_group_concat_with_separator(sqlite_db):
+    row = fetch_one_dict(
+        """
+        SELECT GROUP_CONCAT(place_name ORDER BY place_id SEPARATOR ' | ') AS names
+        FROM tourism_attractions
+        WHERE category = %s
+        """,
+        ("Budaya",),
+    )
+    assert sorted(row["names"].split(" | ")) == ["Kota Tua", "Monas"]
+
+
+def test_date_functions(sqlite_db):
+    row = fetch_one_dict(
+        """
+        SELECT
+            CURDATE() AS today,
+            DATE_SUB(CURDATE(), INTERVAL 7 DAY) AS week_ago,
+            WEEKDAY('2024-01-01') AS monday,
+            WEEKDAY('2024-01-07') AS sunday,
+            GREATEST(1, 3, 2) AS largest
+        """
+    )
+    assert row["today"] == date.today().isoformat()
+    assert row["week_ago"] == (date.today() - timedelta(days=7)).isoformat()
+    assert (row["monday"], row["sunday"], row["largest"]) == (0, 6, 3)
+    with pytest.raises(EmbeddedError):
+        fetch_one_dict("SELECT DATE_SUB(CURDATE(), INTERVAL 1 MONTH) AS d")
+
+
+def test_date_columns_are_converted(sqlite_db):
+    execute_query("INSERT INTO ratings VALUES (%s, %s, %s, %s)", (1, 1, 5, date(2024, 3, 1)))
+    assert fetch_one_dict("SELECT rated_at FROM ratings")["rated_at"] == date(2024, 3, 1)
+
+
+def test_trigger_for_each_row(sqlite_db):
+    execute_query("INSERT INTO counters (name, value) VALUES ('ratings', 0)")
+    execute_query(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_ratings_count_insert
+        AFTER INSERT ON ratings
+        FOR EACH ROW
+        UPDATE counters SET value = value + 1 WHERE name = 'ratings'
+        """
+    )
+    with transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO ratings (user_id, place_id, rating, rated_at) VALUES (%s, %s, %s, CURDATE())",
+            [(1, 1, 5), (1, 2, 4), (2, 1, 3)],
+        )
+    assert fetch_one_dict("SELECT value FROM counters WHERE name = 'ratings'")["value"] == 3
+
+
+def test_stored_function_is_inlined(sqlite_db):
+    execute_query("INSERT INTO user_preferences VALUES (7, 'category_preference', 'Budaya', 0.5)")
+    rows = fetch_all_dicts(
+        """
+        SELECT ta.place_id, get_recommendation_score(%s, ta.place_id) AS score
+        FROM tourism_attractions ta
+        ORDER BY ta.place_id
+        """,
+        (7,),
+    )
+    scores = {row["place_id"]: round(row["score"], 4) for row in rows}
+    assert scores == {1: round(4.5 * 0.6 + 0.5 * 4, 4), 2: round(4.0 * 0.6 + 0.3 * 4, 4), 3: round(4.2 * 0.6 + 0.5 * 4, 4)}
+
+
+def test_like_escapes_wildcards(sqlite_db):
+    execute_query("INSERT INTO counters (name, value) VALUES ('a_b', 1), ('axb', 2)")
+    rows = fetch_all_dicts("SELECT name FROM counters WHERE name LIKE %s", (r"a\_b%",))
+    assert [row["name"] for row in rows] == ["a_b"]
+
+
+def test_session_statements_and_row_locks_are_dropped(sqlite_db):
+    assert translate("sqlite", "SET SESSION information_schema_stats_expiry = 0") is None
+    with transaction() as cursor:
+        cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+        cursor.execute("SELECT place_id FROM tourism_attractions WHERE place_id = %s FOR UPDATE", (1,))
+        assert cursor.fetchall() == [{"place_id": 1}]
+
+
+def test_transaction_rolls_back_and_nests(sqlite_db):
+    with pytest.raises(RuntimeError):
+        with transaction() as cursor:
+            cursor.execute("INSERT INTO counters (name, value) VALUES ('a', 1)")
+            with transaction() as inner:
+                inner.execute("INSERT INTO counters (name, value) VALUES ('b', 1)")
+            raise RuntimeError("rollback")
+    assert fetch_all_dicts("SELECT name FROM counters") == []
+
+
+def test_iter_row_chunks_and_column_names(sqlite_db):
+    chunks = list(iter_row_chunks("SELECT place_id, place_name FROM tourism_attractions", chunk_size=2, describe=True))
+    assert [len(rows) for _, rows in chunks] == [2, 1]
+    assert chunks[0][0] == [("place_id", None), ("place_name", None)]
+    assert column_names("tourism_attractions") == ["place_id", "place_name", "category", "overall_rating"]
+
+
+def test_duckdb_tracks_transaction_state():
+    pytest.importorskip("duckdb")
+    backend = create_backend("duckdb", ":memory:")
+    with use_backend(backend):
+        execute_query("CREATE TABLE counters (name VARCHAR(64) PRIMARY KEY, value INT NOT NULL)")
+        with transaction() as cursor:
+            with backend.connect() as conn:
+                assert backend.in_transaction(conn)
+            cursor.execute("INSERT INTO counters (name, value) VALUES ('a', 1)")
+        with backend.connect() as conn:
+            assert not backend.in_transaction(conn)
+        assert fetch_one_dict("SELECT value FROM counters WHERE name = 'a'")["value"] == 1
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from config import get_settings
+
+
+MIN_POINT_BUDGET = 10
+
+
+@dataclass
+class Downsampled:
+    frame: pd.DataFrame
+    source_points: int
+
+    @property
+    def points(self) -> int:
+        return len(self.frame)
+
+    @property
+    def reduced(self) -> bool:
+        return self.points < self.source_points
+
+    @property
+    def ratio(self) -> float:
+        return self.source_points / self.points if self.points else 1.0
+
+    def describe(self) -> str:
+        return (
+            f"Показано {self.points:,} из {self.source_points:,} точек "
+            f"(сокращение в {self.ratio:.1f}×)".replace(",", " ")
+        )
+
+
+def _budget(budget: Optional[int]) -> int:
+    return max(int(budget or get_settings().chart_point_budget), MIN_POINT_BUDGET)
+
+
+def _numeric(values: pd.Series) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.astype("int64").to_numpy(dtype=float)
+    if not pd.api.types.is_numeric_dtype(values):
+        converted = pd.to_datetime(values, errors="coerce")
+        if converted.notna().any():
+            return converted.astype("int64").to_numpy(dtype=float)
+    return pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+
+
+def _lttb_indices(xs: np.ndarray, ys: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: из каждого бакета точка с наибольшим треугольником."""
+    count = len(xs)
+    edges = np.linspace(1, count - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, count - 1
+    anchor = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        avg_x, avg_y = xs[stop:next_stop].mean(), ys[stop:next_stop].mean()
+        area = np.abs(
+            (xs[anchor] - avg_x) * (ys[start:stop] - ys[anchor])
+            - (xs[anchor] - xs[start:stop]) * (avg_y - ys[anchor])
+        )
+        anchor = start + int(area.argmax())
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def downsample_line(frame: pd.DataFrame, x: str, y: str, budget: Optional[int] = None) -> Downsampled:
+    """Прореживает линию по LTTB до бюджета точек.
+
+    Первая, последняя точки и глобальные минимум и максимум по `y` сохраняются всегда.
+    """
+    budget = _budget(budget)
+    source_points = len(frame)
+    if source_points <= budget:
+        return Downsampled(frame, source_points)
+    ordered = frame.assign(_x=_numeric(frame[x]), _y=_numeric(frame[y]))
+    ordered = ordered.dropna(subset=["_x", "_y"]).sort_values("_x", kind="stable")
+    xs, ys = ordered["_x"].to_numpy(), ordered["_y"].to_numpy()
+    if len(xs) <= budget:
+        return Downsampled(ordered.drop(columns=["_x", "_y"]).reset_index(drop=True), source_points)
+    selected = np.union1d(_lttb_indices(xs, ys, budget - 2), [ys.argmin(), ys.argmax()])
+    result = ordered.iloc[selected].drop(columns=["_x", "_y"]).reset_index(drop=True)
+    return Downsampled(result, source_points)
+
+
+def downsample_scatter(
+    frame: pd.DataFrame,
+    x: str,
+    y: str,
+    budget: Optional[int] = None,
+    weight: Optional[str] = None,
+) -> Downsampled:
+    """Прореживает точечную диаграмму сеткой: по одной точке на непустую ячейку.
+
+    Из ячейки берется точка с наибольшим `weight` (или первая); крайние точки
+    по обеим осям сохраняются, поэтому масштаб осей не меняется.
+    """
+    budget = _budget(budget)
+    source_points = len(frame)
+    if source_points <= budget:
+        return Downsampled(frame, source_points)
+    points = frame.assign(_x=_numeric(frame[x]), _y=_numeric(frame[y])).dropna(subset=["_x", "_y"])
+    xs, ys = points["_x"].to_numpy(), points["_y"].to_numpy()
+    grid = int(np.sqrt(budget - 4))
+
+    def cells(values: np.ndarray) -> np.ndarray:
+        span = values.max() - values.min()
+        if span == 0:
+            return np.zeros(len(values), dtype=int)
+        return np.minimum(((values - values.min()) / span * grid).astype(int), grid - 1)
+
+    cell = pd.Series(cells(xs) * grid + cells(ys), index=points.index)
+    if weight is not None:
+        ranked = pd.to_numeric(points[weight], errors="coerce").fillna(-np.inf)
+        representatives = ranked.groupby(cell).idxmax()
+    else:
+        representatives = cell.groupby(cell).head(1).index
+    extremes = points.index[[xs.argmin(), xs.argmax(), ys.argmin(), ys.argmax()]]
+    keep = points.index.isin(pd.Index(representatives).union(extremes))
+    result = points[keep].drop(columns=["_x", "_y"]).reset_index(drop=True)
+    return Downsampled(result, source_points)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+
+EXPORT_FORMATS: Dict[str, Tuple[str, str]] = {
+    "xlsx": ("XLSX", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("CSV", "text/csv"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+}
+
+MAX_CACHED_EXPORTS = 32
+
+_exports: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+_exports_lock = threading.Lock()
+
+
+def df_to_xlsx_bytes(df: pd.DataFrame) -> bytes:
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name="Данные")
+    output.seek(0)
+    return output.getvalue()
+
+
+def df_to_csv_bytes(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8-sig")
+
+
+def df_to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    output = BytesIO()
+    try:
+        df.to_parquet(output, index=False)
+    except (TypeError, ValueError):
+        object_columns = df.select_dtypes(include="object").columns
+        output = BytesIO()
+        df.astype({column: "string" for column in object_columns}).to_parquet(output, index=False)
+    return output.getvalue()
+
+
+_WRITERS = {
+    "xlsx": df_to_xlsx_bytes,
+    "csv": df_to_csv_bytes,
+    "parquet": df_to_parquet_bytes,
+}
+
+
+def dataframe_digest(df: pd.DataFrame) -> str:
+    """Хеш содержимого таблицы: значения, индекс, имена и типы колонок."""
+    digest = hashlib.sha1()
+    digest.update(repr(list(zip(df.columns, map(str, df.dtypes)))).encode("utf-8"))
+    if not df.empty:
+        row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+        digest.update(row_hashes.tobytes())
+    return digest.hexdigest()
+
+
+def get_cached_export(digest: str, fmt: str) -> Optional[bytes]:
+    with _exports_lock:
+        payload = _exports.get((digest, fmt))
+        if payload is not None:
+            _exports.move_to_end((digest, fmt))
+        return payload
+
+
+def export_dataframe(df: pd.DataFrame, fmt: str, digest: Optional[str] = None) -> bytes:
+    """Сериализует таблицу в выбранный формат; повторный запрос той же таблицы берется из LRU."""
+    digest = digest or dataframe_digest(df)
+    cached = get_cached_export(digest, fmt)
+    if cached is not None:
+        return cached
+    payload = _WRITERS[fmt](df)
+    with _exports_lock:
+        _exports[(digest, fmt)] = payload
+        _exports.move_to_end((digest, fmt))
+        while len(_exports) > MAX_CACHED_EXPORTS:
+            _exports.popitem(last=False)
+    return payload
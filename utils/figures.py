@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+import pandas as pd
+import streamlit as st
+from streamlit.elements.lib.form_utils import current_form_id
+from streamlit.elements.lib.utils import compute_and_register_element_id
+from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+
+from utils.export import dataframe_digest
+
+
+MAX_CACHED_FIGURES = 64
+_CHART_CONFIG = json.dumps({"showLink": False, "linkText": False})
+
+_figures: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+_figures_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def cached_figure(chart_id: str, data: pd.DataFrame, build: Callable[[pd.DataFrame], Any]) -> str:
+    """Сериализованная в JSON фигура Plotly, общая для всех сессий процесса.
+
+    Ключ — идентификатор графика и хеш содержимого данных, поэтому фигура
+    строится и сериализуется заново только после изменения данных.
+    Отображается через render_figure.
+    """
+    key = (chart_id, dataframe_digest(data))
+    with _figures_lock:
+        figure = _figures.get(key)
+        if figure is not None:
+            _figures.move_to_end(key)
+            _stats["hits"] += 1
+            return figure
+        _stats["misses"] += 1
+    figure = build(data).to_json()
+    with _figures_lock:
+        _figures[key] = figure
+        _figures.move_to_end(key)
+        while len(_figures) > MAX_CACHED_FIGURES:
+            _figures.popitem(last=False)
+    return figure
+
+
+def render_figure(spec: str, use_container_width: bool = True):
+    """Выводит готовую JSON-спецификацию графика.
+
+    st.plotly_chart на каждом перерисовывании заново валидирует фигуру и сериализует
+    ее в JSON; здесь в элемент сразу кладется закэшированная строка. Повторяет
+    st.plotly_chart из streamlit 1.39 без выбора точек на графике.
+    """
+    dg = st._main
+    proto = PlotlyChartProto()
+    proto.use_container_width = use_container_width
+    proto.theme = "streamlit"
+    proto.form_id = current_form_id(dg)
+    proto.spec = spec
+    proto.config = _CHART_CONFIG
+    proto.id = compute_and_register_element_id(
+        "plotly_chart",
+        user_key=None,
+        form_id=proto.form_id,
+        plotly_spec=proto.spec,
+        plotly_config=proto.config,
+        selection_mode=("points", "box", "lasso"),
+        is_selection_activated=False,
+        theme="streamlit",
+        use_container_width=use_container_width,
+    )
+    dg._enqueue("plotly_chart", proto)
+
+
+def clear_figure_cache():
+    with _figures_lock:
+        _figures.clear()
+
+
+def figure_cache_stats() -> Dict[str, Any]:
+    with _figures_lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            "entries": len(_figures),
+            "hits": _stats["hits"],
+            "misses": _stats["misses"],
+            "hit_ratio": round(_stats["hits"] / lookups, 3) if lookups else None,
+        }
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from importlib.abc import MetaPathFinder
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+FIRST_PARTY_PACKAGES = ("services", "utils")
+
+
+class _TimedLoader:
+    def __init__(self, loader, profiler: "ImportProfiler"):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        name = module.__name__
+        self._profiler._stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = self._profiler._stack.pop()
+            if self._profiler._stack:
+                self._profiler._stack[-1] += elapsed
+            self._profiler.timings[name] = (elapsed, elapsed - children)
+            module.__loader__ = self._loader
+            if module.__spec__ is not None:
+                module.__spec__.loader = self._loader
+
+
+class ImportProfiler(MetaPathFinder):
+    """Меряет время импорта каждого модуля: полное (с вложенными) и собственное."""
+
+    def __init__(self):
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self._stack: List[float] = []
+        self._active = False
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self.total_seconds: Optional[float] = None
+        self.finished = False
+
+    def find_spec(self, fullname, path=None, target=None):
+        if threading.current_thread() is not self._thread:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def start(self):
+        if self._active or self.finished:
+            return
+        self._active = True
+        self._thread = threading.current_thread()
+        self._started_at = time.perf_counter()
+        sys.meta_path.insert(0, self)
+
+    def stop(self):
+        if not self._active:
+            return
+        sys.meta_path.remove(self)
+        self.total_seconds = time.perf_counter() - self._started_at
+        self._active = False
+        self.finished = True
+
+    def slowest(self, limit: int = 15) -> List[Tuple[str, float, float]]:
+        """Самые медленные импорты: сторонние пакеты верхнего уровня и модули приложения."""
+        items = [
+            (name, total, own)
+            for name, (total, own) in self.timings.items()
+            if "." not in name or name.split(".")[0] in FIRST_PARTY_PACKAGES
+        ]
+        return sorted(items, key=lambda item: item[1], reverse=True)[:limit]
+
+
+import_profiler = ImportProfiler()
+warmup_timings: Dict[str, Tuple[float, Optional[str]]] = {}
+
+
+def run_warmup(steps: Sequence[Tuple[str, Callable[[], object]]]):
+    """Выполняет шаги прогрева по очереди; ошибка шага не останавливает остальные."""
+    for label, step in steps:
+        started = time.perf_counter()
+        error = None
+        try:
+            step()
+        except Exception as exc:
+            error = str(exc)
+        warmup_timings[label] = (time.perf_counter() - started, error)